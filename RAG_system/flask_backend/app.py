@@ -1,42 +1,104 @@
-from flask import Flask, jsonify
+import os
+import threading
+import time
+
+from flask import Flask, g, jsonify, request
 from flask_cors import CORS
 
-from routes.upload import upload_bp
-from routes.models import models_bp
-from routes.collections import collections_bp
-from routes.collectionStatus import status_bp
-from routes.chat import chat_bp
-from routes.status import system_status_bp
-from routes.docRemove import delete_bp
-from routes.knowledgeBases import kb_bp
-from routes.knowledgeBasesDoc import docKB_bp
-from routes.staticFiles import static_bp
-
-from routes.util.qdrant_util import qdrant_DBConnector
-vector_db = qdrant_DBConnector("預設向量數據庫", recreate=False)
-
-app = Flask(__name__)
-CORS(app)
-
-@app.route('/')
-def health_check():
-    return jsonify({
-        'status': 'ok',
-        'message': 'Service is running',
-        'version': '1.0.0'
-    })
-
-app.register_blueprint(system_status_bp)
-app.register_blueprint(models_bp)
-app.register_blueprint(collections_bp)
-app.register_blueprint(status_bp)
-app.register_blueprint(chat_bp)
-app.register_blueprint(delete_bp)
-app.register_blueprint(kb_bp)
-app.register_blueprint(docKB_bp)
-app.register_blueprint(static_bp)
-app.register_blueprint(upload_bp)
+def create_app():
+    """
+    build the Flask app
+
+    routes are imported here rather than at module level, so spawn children
+    of the page range process pool (which re-import __main__) stay light
+
+    Returns:
+        Flask app
+    """
+    from routes.upload import upload_bp
+    from routes.models import models_bp
+    from routes.collections import collections_bp
+    from routes.collectionStatus import status_bp
+    from routes.chat import chat_bp
+    from routes.status import system_status_bp
+    from routes.docRemove import delete_bp
+    from routes.knowledgeBases import kb_bp
+    from routes.knowledgeBasesDoc import docKB_bp
+    from routes.staticFiles import static_bp
+    from routes.metrics import metrics_bp
+    from routes.jobs import jobs_bp
+    from routes.util.metrics import HTTP_LATENCY, HTTP_REQUESTS
+
+    from routes.util.qdrant_util import qdrant_DBConnector
+    qdrant_DBConnector("預設向量數據庫", recreate=False)
+
+    app = Flask(__name__)
+    CORS(app)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        # 依 blueprint 統計請求數與延遲
+        start = g.pop('request_start', None)
+        blueprint = request.blueprint or 'app'
+        if start is not None:
+            def observe_latency():
+                HTTP_LATENCY.observe(time.perf_counter() - start, blueprint=blueprint)
+            if response.is_streamed:
+                # 串流回應 (/api/chat/stream) 此時只送出標頭，於內容送完關閉時才記錄延遲
+                response.call_on_close(observe_latency)
+            else:
+                observe_latency()
+        HTTP_REQUESTS.inc(blueprint=blueprint, method=request.method, status=response.status_code)
+        return response
+
+    @app.route('/')
+    def health_check():
+        return jsonify({
+            'status': 'ok',
+            'message': 'Service is running',
+            'version': '1.0.0'
+        })
+
+    app.register_blueprint(system_status_bp)
+    app.register_blueprint(models_bp)
+    app.register_blueprint(collections_bp)
+    app.register_blueprint(status_bp)
+    app.register_blueprint(chat_bp)
+    app.register_blueprint(delete_bp)
+    app.register_blueprint(kb_bp)
+    app.register_blueprint(docKB_bp)
+    app.register_blueprint(static_bp)
+    app.register_blueprint(upload_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(jobs_bp)
+    return app
+
+def start_background_services():
+    """
+    start the ingest workers and the converter warm-up, once per serving
+    process (python app.py, or gunicorn's post_worker_init hook)
+    """
+    from routes.util.job_queue import ingest_queue
+
+    # 預先載入 docling converter 與 tokenizer，例如 WARMUP_CONVERTERS=plain,ocr
+    warmup_converters = [opt.strip() for opt in os.getenv('WARMUP_CONVERTERS', '').split(',') if opt.strip()]
+    if warmup_converters:
+        from routes.util.converter_pool import warm_up
+        threading.Thread(
+            target=warm_up,
+            args=([(opt == 'ocr', False) for opt in warmup_converters],),
+            daemon=True
+        ).start()
+
+    # 啟動背景文件處理 worker
+    ingest_queue.start()
 
 if __name__ == '__main__':
+    app = create_app()
+    start_background_services()
     #app.run(debug=True, port=5050)
     app.run(host='0.0.0.0', port=5050)
\ No newline at end of file
@@ -0,0 +1,5 @@
+# gunicorn 設定：背景 worker 與預熱只在服務請求的 worker 行程中啟動一次
+
+def post_worker_init(worker):
+    from app import start_background_services
+    start_background_services()
@@ -3,4 +3,5 @@ from .stopwords import (
     STOPWORDS_CHINESE,
     STOPWORDS_ZH_TW
 )
-from .bm25 import load_bm25, create_bm25, bm25_search
\ No newline at end of file
+from .bm25 import load_bm25, create_bm25, bm25_search
+from .sparse import SPARSE_VECTOR_NAME, document_sparse_vector, query_sparse_vector
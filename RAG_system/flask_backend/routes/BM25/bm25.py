@@ -18,6 +18,26 @@ from .detect_language import tokenizer_detect_language
 jieba.set_dictionary(os.path.join(os.path.dirname(__file__), 'dict.txt.big'))
 #jieba.set_dictionary('dict.txt.big')
 
+def english_tokenize(text: str, stemmer, stopwords: set) -> List[str]:
+    """English tokenize: preprocessing + PyStemmer + stopwords filter"""
+    text = text.lower()
+    text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9\s]', '', text)
+    tokens = text.split()
+    return [stemmer.stemWord(token) for token in tokens if token and token not in stopwords]
+
+def mixed_chinese_tokenize(text: str, stemmer, stopwords: set) -> List[str]:
+    """Mix tokenize: jieba + PyStemmer and stopwords filter"""
+    # tokenize as chinese
+    text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9\s]', '', text) # preserve numbers and white space
+    seg_list = jieba.cut_for_search(text)
+    tokenized_text = [token for token in seg_list if not re.search(r'[\s]', token)]
+
+    # english processing
+    for i, token in enumerate(tokenized_text):
+        tokenized_text[i] = tokenized_text[i].lower()
+    #tokenized_text = [stemmer.stemWord(token) for token in tokenized_text if token and token not in stopwords]
+    return [stemmer.stemWord(token) for token in tokenized_text if token and token not in stopwords]
+
 # abstract class
 class AbstractBM25(ABC):
     def __init__(self, corpus: List[str], k1: float = 1.5, b: float = 0.75, stopwords: tuple = ()):
@@ -195,10 +215,7 @@ class EnglishBM25(AbstractBM25):
 
     def _tokenize(self, text: str) -> List[str]:
         """English tokenize: preprocessing + PyStemmer + stopwords filter"""
-        text = text.lower()
-        text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9\s]', '', text)
-        tokens = text.split()
-        return [self.stemmer.stemWord(token) for token in tokens if token and token not in self.stopwords]
+        return english_tokenize(text, self.stemmer, self.stopwords)
 
 # ChineseBM25 implementation (with jieba and stopwords)
 class ChineseBM25(AbstractBM25):
@@ -226,16 +243,7 @@ class MixedChineseBM25(AbstractBM25):
 
     def _tokenize(self, text: str) -> List[str]:
         """Mix tokenize: jieba + PyStemmer and stopwords filter"""
-        # tokenize as chinese
-        text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9\s]', '', text) # preserve numbers and white space
-        seg_list = jieba.cut_for_search(text)
-        tokenized_text = [token for token in seg_list if not re.search(r'[\s]', token)]
-
-        # english processing
-        for i, token in enumerate(tokenized_text):
-            tokenized_text[i] = tokenized_text[i].lower()
-        #tokenized_text = [self.stemmer.stemWord(token) for token in tokenized_text if token and token not in self.stopwords]
-        return [self.stemmer.stemWord(token) for token in tokenized_text if token and token not in self.stopwords]
+        return mixed_chinese_tokenize(text, self.stemmer, self.stopwords)
 
 # Mixure implementation
 class MixedLanguageBM25(AbstractBM25):
@@ -0,0 +1,72 @@
+import hashlib
+import os
+from typing import Dict, List, Tuple
+
+import Stemmer
+
+from .bm25 import english_tokenize, mixed_chinese_tokenize
+from .detect_language import tokenizer_detect_language
+from .stopwords import (
+    STOPWORDS_EN_PLUS,
+    STOPWORDS_CHINESE,
+    STOPWORDS_ZH_TW
+)
+
+# Qdrant 中稀疏向量的名稱，IDF 由 Qdrant 以 Modifier.IDF 於查詢時計算
+SPARSE_VECTOR_NAME = "bm25"
+BM25_K1 = float(os.getenv('BM25_K1', 1.5))
+BM25_B = float(os.getenv('BM25_B', 0.75))
+# 文件長度正規化用的平均 chunk 長度 (詞數)，寫入時無法得知整個集合的平均值
+BM25_AVG_DOC_LENGTH = float(os.getenv('BM25_AVG_DOC_LENGTH', 256))
+
+_stemmer = Stemmer.Stemmer('english')
+_stopwords_en = set(STOPWORDS_EN_PLUS)
+_stopwords_all = set(STOPWORDS_EN_PLUS + STOPWORDS_CHINESE + STOPWORDS_ZH_TW)
+
+def tokenize(text: str) -> List[str]:
+    """
+    same tokens as MixedLanguageBM25 with its default stopwords
+    """
+    if tokenizer_detect_language(text) == 'en':
+        return english_tokenize(text, _stemmer, _stopwords_en)
+    return mixed_chinese_tokenize(text, _stemmer, _stopwords_all)
+
+def token_index(token: str) -> int:
+    """
+    stable 32-bit sparse dimension of a token (Python hash() is salted per process)
+    """
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=4).digest(), 'little')
+
+def _term_counts(tokens: List[str]) -> Dict[int, int]:
+    counts = {}
+    for token in tokens:
+        index = token_index(token)
+        counts[index] = counts.get(index, 0) + 1
+    return counts
+
+def document_sparse_vector(text: str,
+                           k1: float = BM25_K1,
+                           b: float = BM25_B,
+                           avg_doc_length: float = BM25_AVG_DOC_LENGTH) -> Tuple[List[int], List[float]]:
+    """
+    BM25 term frequency part of every term of a chunk
+
+    Returns:
+        (indices, values) of the sparse vector, sorted by index
+    """
+    tokens = tokenize(text)
+    doc_length = len(tokens)
+    indices, values = [], []
+    for index, term_freq in sorted(_term_counts(tokens).items()):
+        indices.append(index)
+        values.append(term_freq * (k1 + 1) / (term_freq + k1 * (1 - b + b * doc_length / avg_doc_length)))
+    return indices, values
+
+def query_sparse_vector(text: str) -> Tuple[List[int], List[float]]:
+    """
+    query terms with weight 1 (repeated query terms count once per
+    occurrence, as in AbstractBM25._score)
+    """
+    counts = _term_counts(tokenize(text))
+    indices = sorted(counts)
+    return indices, [float(counts[index]) for index in indices]
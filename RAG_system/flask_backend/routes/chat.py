@@ -1,47 +1,47 @@
 print("載入 chat_bp")
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 
 import ollama
+import json
+import os
 
 from .util.qdrant_util import qdrant_DBConnector
 from .util.ollama_util import *
+from .util.answer_cache import answer_cache
+from .util.table_store import lookup_table_rows
+from .util.tracing import span, start_trace
+from .util.metrics import record_cache_lookup
 
 chat_bp = Blueprint('chat', __name__)
 
-@chat_bp.route('/api/chat', methods=['POST'])
-def chat():
-    try:
-        data = request.json
-        query = data.get('query')
-        model_id = data.get('model')
-        collection_name = data.get('collection')
-        kb_name = data.get('kbName')  # 獲取知識庫名稱
-        
-        if not query or not model_id or not collection_name:
-            return jsonify({'error': '缺少必要參數'}), 400
-        
-        # 連接到Qdrant
-        vector_db = qdrant_DBConnector(collection_name)
+# 重排序設定：single 為原本對所有候選做完整 rerank，cascade 先剪枝再 rerank
+RERANK_MODE = os.getenv('RERANK_MODE', 'single')
+RETRIEVE_TOP_K = int(os.getenv('RETRIEVE_TOP_K', 20))
+CASCADE_FIRST_STAGE = os.getenv('CASCADE_FIRST_STAGE', 'rrf')
+CASCADE_KEEP = int(os.getenv('CASCADE_KEEP', 8))
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'true') == 'true'
+# 表格結構化索引：以儲存格/欄名比對取出表格列，與向量檢索結果一起 rerank 後作為參考文件
+TABLE_RETRIEVAL_ENABLED = os.getenv('TABLE_RETRIEVAL_ENABLED', 'true') == 'true'
+TABLE_TOP_K = int(os.getenv('TABLE_TOP_K', 5))
+TABLE_MIN_SCORE = float(os.getenv('TABLE_MIN_SCORE', 0.5))
 
-        reranked_result = reranker(query, hybrid_retriever_with_kbname(vector_db, kb_name, query, 20), threshold=0.45)
-        #reranked_result = reranker(query, hybrid_retriever(vector_db, query, 20), threshold=0.45)
-        
-        # 格式化檢索結果
-        formatted_docs = []
-        for i, (score, text, meta) in enumerate(reranked_result):
-            formatted_docs.append({
-                'text': text,
-                'score': float(score),
-                'source': f"文檔{i+1}，{meta.get('filename')}",  
-                'page': meta.get("page_ref"),
-                'image_ref': meta.get("image_ref"),
-                'table_ref': meta.get('table_ref')
-            })
-        
-        # 構建提示
-        # Job instruction
-        instruction = """
+def rerank_candidates(query, candidates, data):
+    rerank_mode = data.get('rerank_mode', RERANK_MODE)
+    if rerank_mode not in ('single', 'cascade'):
+        raise ValueError("Unsupported rerank_mode. Please choose 'single' or 'cascade'.")
+    if rerank_mode == 'cascade':
+        return cascade_reranker(
+            query,
+            candidates,
+            first_stage=data.get('cascade_first_stage', CASCADE_FIRST_STAGE),
+            keep=int(data.get('cascade_keep', CASCADE_KEEP)),
+            threshold=0.45
+        )
+    return reranker(query, candidates, threshold=0.45)
+
+# Job instruction
+INSTRUCTION = """
         你是台灣國泰集團的聊天機器人秘書，專門為用戶提供公司內外文件內容的解析和答疑，
         你的任務是根據你獲得的「參考文件」，對「用戶問題」段落的問題進行回答。
 
@@ -54,13 +54,28 @@ def chat():
         嚴格使用繁體中文，避免英文或簡體中文。
         """
 
-        # RAG retrieved documents
-        rag_docs = format_rag_output(reranked_result)
+def format_sources(reranked_result):
+    # 格式化檢索結果
+    formatted_docs = []
+    for i, (score, text, meta) in enumerate(reranked_result):
+        formatted_docs.append({
+            'text': text,
+            'score': float(score),
+            'source': f"文檔{i+1}，{meta.get('filename')}",  
+            'page': meta.get("page_ref"),
+            'image_ref': meta.get("image_ref"),
+            'table_ref': meta.get('table_ref')
+        })
+    return formatted_docs
+
+def build_prompt(query, reranked_result):
+    # RAG retrieved documents
+    rag_docs = format_rag_output(reranked_result)
 
-        # Prompt template
-        prompt = f"""
+    # Prompt template
+    prompt = f"""
         # 任務
-        {instruction}
+        {INSTRUCTION}
 
         # 參考文件
         {rag_docs}
@@ -68,12 +83,218 @@ def chat():
         # 用戶問題
         {query}
         """
+    return prompt
+
+def use_answer_cache(data):
+    return ANSWER_CACHE_ENABLED and data.get('use_cache', True)
+
+def answer_cache_version(data):
+    # 檢索前的知識庫版本，生成期間有上傳/刪除時不快取答案
+    return answer_cache.version(data.get('collection'), data.get('kbName'))
+
+def retrieval_settings(data):
+    # 影響檢索結果的請求參數 (套用預設值後)，作為答案快取鍵的一部分
+    rerank_mode = data.get('rerank_mode', RERANK_MODE)
+    cascade = None
+    if rerank_mode == 'cascade':
+        cascade = (data.get('cascade_first_stage', CASCADE_FIRST_STAGE), int(data.get('cascade_keep', CASCADE_KEEP)))
+    table_top_k = None
+    if TABLE_RETRIEVAL_ENABLED and data.get('use_table_index', True):
+        table_top_k = int(data.get('table_top_k', TABLE_TOP_K))
+    return (rerank_mode, int(data.get('top_k', RETRIEVE_TOP_K)), cascade, table_top_k)
+
+def lookup_cached_answer(data, embedded_query):
+    if not use_answer_cache(data):
+        return None
+    with span("answer_cache_lookup"):
+        cached = answer_cache.lookup(data.get('collection'), data.get('kbName'), data.get('model'), embedded_query,
+                                     settings=retrieval_settings(data))
+    record_cache_lookup("answer", cached is not None)
+    return cached
+
+def store_cached_answer(data, embedded_query, answer, sources, version):
+    if not use_answer_cache(data):
+        return
+    answer_cache.store(data.get('collection'), data.get('kbName'), data.get('model'),
+                       data.get('query'), embedded_query, answer, sources, version=version,
+                       settings=retrieval_settings(data))
+
+def retrieve_and_rerank(data, embedded_query=None):
+    query = data.get('query')
+    collection_name = data.get('collection')
+    kb_name = data.get('kbName')  # 獲取知識庫名稱
+
+    # 連接到Qdrant
+    vector_db = qdrant_DBConnector(collection_name)
+
+    top_k = int(data.get('top_k', RETRIEVE_TOP_K))
+    candidates = hybrid_retriever_with_kbname(vector_db, kb_name, query, top_k, embedded_query=embedded_query)
+    # 表格列與檢索結果一起由 reranker 評分，只有排名在前的才會進入提示詞
+    candidates = {**table_row_candidates(retrieve_table_rows(data)), **candidates}
+    reranked_result = rerank_candidates(query, candidates, data)
+    #reranked_result = reranker(query, hybrid_retriever(vector_db, query, 20), threshold=0.45)
+    return reranked_result
+
+def table_row_candidates(table_rows):
+    # 轉成 rrf() 輸出格式；放在最前面，cascade 的 rrf 剪枝不會在評分前就剪掉表格列
+    return {f"table-row-{i}": {"score": score, "text": text, "metadata": metadata}
+            for i, (score, text, metadata) in enumerate(table_rows)}
+
+def retrieve_table_rows(data):
+    # 表格數值類問題直接以索引比對取出相符的表格列
+    if not (TABLE_RETRIEVAL_ENABLED and data.get('use_table_index', True)):
+        return []
+    with span("table_lookup"):
+        return lookup_table_rows(
+            data.get('kbName'),
+            data.get('query'),
+            top_k=int(data.get('table_top_k', TABLE_TOP_K)),
+            min_score=TABLE_MIN_SCORE
+        )
+
+@chat_bp.route('/api/chat', methods=['POST'])
+def chat():
+    try:
+        trace = start_trace()
+        data = request.json
+        query = data.get('query')
+        model_id = data.get('model')
+        collection_name = data.get('collection')
+        
+        if not query or not model_id or not collection_name:
+            return jsonify({'error': '缺少必要參數'}), 400
+        
+        # 相似問題命中快取時，略過檢索、重排序與生成
+        embedded_query = get_embeddings(query)
+        cache_version = answer_cache_version(data)
+        cached = lookup_cached_answer(data, embedded_query)
+        if cached:
+            response = {
+                'answer': cached['answer'],
+                'sources': cached['sources'],
+                'cached': True
+            }
+            if data.get('debug'):
+                response['debug_timings'] = trace.timings()
+            return jsonify(response)
+
+        reranked_result = retrieve_and_rerank(data, embedded_query)
+        formatted_docs = format_sources(reranked_result)
+
+        # 構建提示
+        with span("prompt_build"):
+            prompt = build_prompt(query, reranked_result)
 
         answer = get_completion(prompt, model_id)
+        store_cached_answer(data, embedded_query, answer, formatted_docs, cache_version)
         
-        return jsonify({
+        response = {
             'answer': answer,
-            'sources': formatted_docs
-        })
+            'sources': formatted_docs,
+            'cached': False
+        }
+        # 請求帶 debug: true 時回傳各階段耗時 (ms)
+        if data.get('debug'):
+            response['debug_timings'] = trace.timings()
+        return jsonify(response)
     except Exception as e:
         return jsonify({'error': f'處理聊天請求時出錯: {str(e)}'}), 500
+
+@chat_bp.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    串流版聊天API，回傳 JSON lines (application/x-ndjson)
+
+    每行一個事件:
+    {"type": "sources", "sources": [...]}   檢索完成後立即送出
+    {"type": "token", "content": "..."}     模型每產生一段文字送出一次
+    {"type": "done"}                        生成結束（命中答案快取時 sources/done 帶有 cached: true，
+                                            請求帶 debug: true 時附上 debug_timings）
+    {"type": "error", "error": "..."}       處理中出錯
+    """
+    data = request.json or {}
+    query = data.get('query')
+    model_id = data.get('model')
+    collection_name = data.get('collection')
+
+    if not query or not model_id or not collection_name:
+        return jsonify({'error': '缺少必要參數'}), 400
+
+    def generate():
+        try:
+            trace = start_trace()
+            embedded_query = get_embeddings(query)
+            cache_version = answer_cache_version(data)
+            cached = lookup_cached_answer(data, embedded_query)
+            if cached:
+                yield json.dumps({'type': 'sources', 'sources': cached['sources'], 'cached': True}, ensure_ascii=False) + "\n"
+                yield json.dumps({'type': 'token', 'content': cached['answer']}, ensure_ascii=False) + "\n"
+                done_event = {'type': 'done', 'cached': True}
+                if data.get('debug'):
+                    done_event['debug_timings'] = trace.timings()
+                yield json.dumps(done_event) + "\n"
+                return
+
+            reranked_result = retrieve_and_rerank(data, embedded_query)
+            formatted_docs = format_sources(reranked_result)
+            yield json.dumps({'type': 'sources', 'sources': formatted_docs}, ensure_ascii=False) + "\n"
+
+            with span("prompt_build"):
+                prompt = build_prompt(query, reranked_result)
+            answer_parts = []
+            for token in get_completion_stream(prompt, model_id):
+                answer_parts.append(token)
+                yield json.dumps({'type': 'token', 'content': token}, ensure_ascii=False) + "\n"
+
+            store_cached_answer(data, embedded_query, ''.join(answer_parts), formatted_docs, cache_version)
+            done_event = {'type': 'done'}
+            if data.get('debug'):
+                done_event['debug_timings'] = trace.timings()
+            yield json.dumps(done_event) + "\n"
+        except Exception as e:
+            yield json.dumps({'type': 'error', 'error': f'處理聊天請求時出錯: {str(e)}'}, ensure_ascii=False) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@chat_bp.route('/api/chat/cascadeRecall', methods=['POST'])
+def cascade_recall():
+    """
+    比較 cascade 與單階段 rerank 的 recall@k
+
+    請求JSON格式:
+    {
+        "queries": ["問題1", "問題2"],
+        "collection": "Qdrant集合名稱",
+        "kbName": "知識庫名",
+        "top_k": 20,
+        "k": 5,
+        "cascade_first_stage": "rrf 或 light",
+        "cascade_keep": 8
+    }
+    """
+    try:
+        data = request.json
+        queries = data.get('queries')
+        collection_name = data.get('collection')
+        kb_name = data.get('kbName')
+
+        if not queries or not collection_name:
+            return jsonify({'error': '缺少必要參數'}), 400
+
+        vector_db = qdrant_DBConnector(collection_name)
+        result = cascade_recall_at_k(
+            vector_db,
+            kb_name,
+            queries,
+            top_k=int(data.get('top_k', RETRIEVE_TOP_K)),
+            k=int(data.get('k', 5)),
+            first_stage=data.get('cascade_first_stage', CASCADE_FIRST_STAGE),
+            keep=int(data.get('cascade_keep', CASCADE_KEEP))
+        )
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': f'計算 cascade recall 時出錯: {str(e)}'}), 500
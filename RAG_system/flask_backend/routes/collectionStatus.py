@@ -4,6 +4,8 @@ from qdrant_client import QdrantClient
 from flask import Blueprint, jsonify
 import os
 
+from .util.qdrant_util import describe_collection
+
 status_bp = Blueprint('status', __name__)
 
 @status_bp.route('/api/collectionStatus/<collection_name>', methods=['GET'])
@@ -33,6 +35,12 @@ def get_collection_stats(collection_name):
         vector_size = collection_info.config.params.vectors.size
         vector_count = collection_count.count
         disk_usage = (vector_size * vector_count * 4) / (1024 * 1024)  # 估計值，單位MB
+        settings = describe_collection(collection_name, collection_info)
+        # 常駐記憶體的向量大小：量化後為 int8 (1 byte) 或 1 bit，原始向量放磁碟時不計
+        bytes_per_dim = {"scalar": 1, "binary": 1 / 8}.get(settings["quantization"], 0)
+        ram_usage = (vector_size * vector_count * bytes_per_dim) / (1024 * 1024)
+        if not settings["on_disk"]:
+            ram_usage += disk_usage
         
         stats = {
             'vectorCount': vector_count,
@@ -40,6 +48,8 @@ def get_collection_stats(collection_name):
             'segmentCount': collection_info.segments_count,
             'indexType': str(collection_info.config.params.vectors.distance),
             'diskUsage': f"{disk_usage:.2f} MB",
+            'ramUsage': f"{ram_usage:.2f} MB",
+            'settings': settings,
             'created': "unknown",
             'lastModified': "unknown"
             #'created': collection_info.config.created_at,
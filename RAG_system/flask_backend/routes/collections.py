@@ -1,11 +1,27 @@
 print("載入 collections_bp")
 
 from qdrant_client import QdrantClient
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 import os
 
+from .util.qdrant_util import (qdrant_DBConnector, collection_options, save_search_settings,
+                               load_search_settings, describe_collection, SEARCH_SETTING_KEYS)
+
 collections_bp = Blueprint('collections', __name__)
 
+def _qdrant_client():
+    import socket
+    try:
+        socket.gethostbyname('qdrant')
+        # 如果在 Docker 環境中，使用 qdrant 主機名
+        qdrant_host = os.getenv('QDRANT_HOST', 'qdrant')
+    except socket.gaierror:
+        # 如果在本地開發環境中，使用 localhost
+        qdrant_host = os.getenv('QDRANT_HOST', 'localhost')
+
+    qdrant_port = int(os.getenv('QDRANT_PORT', 6333))
+    return QdrantClient(f"http://{qdrant_host}:{qdrant_port}")
+
 @collections_bp.route('/api/collections', methods=['GET'])
 def get_collections():
     try:
@@ -48,3 +64,63 @@ def get_collections():
         return jsonify(formatted_collections)
     except Exception as e:
         return jsonify({'error': f'獲取集合列表時出錯: {str(e)}'}), 500
+
+@collections_bp.route('/api/collections', methods=['POST'])
+def create_collection():
+    """
+    建立集合，可指定量化與 HNSW 參數 (未指定的使用 COLLECTION_DEFAULTS)
+
+    請求JSON格式:
+    {
+        "name": "集合名稱",
+        "quantization": "none | scalar | binary",
+        "on_disk": true,               # 原始向量放磁碟
+        "hnsw_m": 16,
+        "hnsw_ef_construct": 100,
+        "hnsw_ef": 128,                # 查詢時參數
+        "rescore": true,               # 量化搜尋後以原始向量重新計分
+        "oversampling": 2.0
+    }
+    """
+    try:
+        data = request.get_json() or {}
+        collection_name = data.pop('name', None)
+        if not collection_name or '/' in collection_name or collection_name.startswith('.'):
+            return jsonify({'error': '缺少或不合法的集合名稱'}), 400
+        try:
+            options = collection_options(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if _qdrant_client().collection_exists(collection_name):
+            return jsonify({'error': f"集合 '{collection_name}' 已存在"}), 409
+        vector_db = qdrant_DBConnector(collection_name, recreate=False, options=options)
+
+        collection_info = vector_db.qdrant_client.get_collection(collection_name)
+        return jsonify({
+            'name': collection_name,
+            'vectorDimension': collection_info.config.params.vectors.size,
+            'settings': describe_collection(collection_name, collection_info)
+        }), 201
+    except Exception as e:
+        return jsonify({'error': f'建立集合時出錯: {str(e)}'}), 500
+
+@collections_bp.route('/api/collections/<collection_name>/searchSettings', methods=['POST'])
+def update_search_settings(collection_name):
+    """
+    調整集合的查詢參數 (hnsw_ef, rescore, oversampling)，不需重建索引
+    """
+    try:
+        data = request.get_json() or {}
+        unknown = set(data) - set(SEARCH_SETTING_KEYS)
+        if unknown:
+            return jsonify({'error': f"只能調整 {', '.join(SEARCH_SETTING_KEYS)}"}), 400
+        if not _qdrant_client().collection_exists(collection_name):
+            return jsonify({'error': f"集合 '{collection_name}' 不存在"}), 404
+        try:
+            options = collection_options({**load_search_settings(collection_name), **data})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(save_search_settings(collection_name, options))
+    except Exception as e:
+        return jsonify({'error': f'更新查詢參數時出錯: {str(e)}'}), 500
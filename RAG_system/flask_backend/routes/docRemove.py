@@ -1,12 +1,173 @@
 print("載入 delete_bp")
 
+import glob
 import os
+import shutil
 from flask import Blueprint, jsonify, request
 from qdrant_client import QdrantClient, models
 from qdrant_client.http.exceptions import UnexpectedResponse
 
+from .util.answer_cache import bump_kb_version
+from .util.table_store import remove_file_tables, remove_kb_tables
+from .util.figure_storage import remove_document_figures, remove_kb_figures
+
 delete_bp = Blueprint('delete', __name__)
 
+UPLOAD_FOLDER = 'uploads'
+
+def get_qdrant_client():
+    import socket
+    try:
+        socket.gethostbyname('qdrant')
+        # 如果在 Docker 環境中，使用 qdrant 主機名
+        qdrant_host = os.getenv('QDRANT_HOST', 'qdrant')
+    except socket.gaierror:
+        # 如果在本地開發環境中，使用 localhost
+        qdrant_host = os.getenv('QDRANT_HOST', 'localhost')
+
+    qdrant_port = int(os.getenv('QDRANT_PORT', 6333))
+    return QdrantClient(f"http://{qdrant_host}:{qdrant_port}")
+
+def file_ids_filter(kb_name, file_ids):
+    # file_id 之外也限定知識庫，避免刪到其他知識庫中同 id 的向量
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="metadata.kb_name",
+                match=models.MatchValue(value=kb_name),
+            ),
+            models.FieldCondition(
+                key="metadata.file_id",
+                match=models.MatchAny(any=list(file_ids)),
+            ),
+        ],
+    )
+
+def kb_filter(kb_name):
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="metadata.kb_name",
+                match=models.MatchValue(value=kb_name),
+            ),
+        ],
+    )
+
+def count_document_vectors(qdrant_client, collection_name, kb_name, file_ids):
+    """
+    number of points of each requested document in the knowledge base
+
+    one exact facet request over metadata.file_id counts every document;
+    only ids absent from it (or every id, if facets are unavailable) are
+    confirmed with a per-file count
+
+    Returns:
+        dict file_id -> count
+    """
+    counts = {file_id: 0 for file_id in file_ids}
+    unconfirmed = list(counts)
+    try:
+        response = qdrant_client.facet(
+            collection_name=collection_name,
+            key="metadata.file_id",
+            facet_filter=file_ids_filter(kb_name, unconfirmed),
+            limit=len(unconfirmed),
+            exact=True,
+        )
+        for hit in response.hits:
+            if hit.value in counts:
+                counts[hit.value] = hit.count
+        unconfirmed = [file_id for file_id, count in counts.items() if count == 0]
+    except Exception as e:
+        # 舊版 Qdrant 或缺少 file_id 索引時無法 facet，改為逐一計算
+        print(f"facet 計算失敗，改為逐一計算：{str(e)}")
+    for file_id in unconfirmed:
+        counts[file_id] = qdrant_client.count(
+            collection_name=collection_name,
+            count_filter=file_ids_filter(kb_name, [file_id]),
+            exact=True,
+        ).count
+    return counts
+
+def delete_vectors(qdrant_client, collection_name, points_filter, count=None):
+    """
+    delete the points matching points_filter in one request
+
+    only the matching points are counted (through the payload index),
+    instead of counting the whole collection before and after the delete
+
+    Args:
+        count: number of matching points if already counted
+    Returns:
+        number of deleted points
+    """
+    if count is None:
+        count = qdrant_client.count(
+            collection_name=collection_name,
+            count_filter=points_filter,
+            exact=True,
+        ).count
+    if count > 0:
+        qdrant_client.delete(
+            collection_name=collection_name,
+            points_selector=models.FilterSelector(filter=points_filter),
+            wait=True,
+        )
+    return count
+
+def remove_document_files(kb_name, document_id, file_name=None):
+    """
+    刪除文件的 PDF、圖片與表格資料
+
+    Args:
+        file_name: 原始檔名，未提供時依 file_id 尋找上傳的檔案
+    Returns:
+        dict with file_deleted and figures_deleted
+    """
+    details = {"file_deleted": False}
+    kb_folder = os.path.join(UPLOAD_FOLDER, kb_name)
+    if file_name:
+        base_name = os.path.splitext(file_name)[0]
+        file_path = os.path.join(kb_folder, f"{base_name}_{document_id}.pdf")
+    else:
+        matches = glob.glob(os.path.join(glob.escape(kb_folder), f"*_{glob.escape(document_id)}.pdf"))
+        file_path = matches[0] if matches else None
+        base_name = os.path.basename(file_path)[:-len(f"_{document_id}.pdf")] if file_path else None
+
+    if file_path is not None and os.path.exists(file_path):
+        try:
+            os.remove(file_path)
+            details["file_deleted"] = True
+            print(f"成功刪除文件：{file_path}")
+
+            # 檢查知識庫資料夾是否為空，如果是則刪除
+            if os.path.exists(kb_folder) and not os.listdir(kb_folder):
+                try:
+                    os.rmdir(kb_folder)
+                    print(f"成功刪除空的知識庫資料夾：{kb_folder}")
+                except Exception as e:
+                    print(f"刪除知識庫資料夾失敗：{str(e)}")
+        except Exception as e:
+            details["file_error"] = str(e)
+            print(f"刪除文件失敗：{str(e)}")
+    else:
+        print(f"文件不存在所指定位置：{file_path}")
+
+    # 刪除圖片：figure_storage/<kb_name>/<file_id>/ 整個資料夾，舊版平放的圖片依檔名前綴刪除
+    legacy_prefix = f"{base_name}_{document_id}" if base_name else None
+    details["figures_deleted"] = remove_document_figures(kb_name, document_id, legacy_prefix)
+    # 刪除表格索引 (查詢時依檔案變更重建)
+    remove_file_tables(kb_name, document_id)
+    return details
+
+def _collection_missing(qdrant_client, collection_name):
+    if qdrant_client.collection_exists(collection_name):
+        return None
+    return jsonify({
+        "success": False,
+        "error": f"集合 '{collection_name}' 不存在"
+    }), 404
+
 @delete_bp.route('/api/delete', methods=['POST'])
 def delete_document():
     """
@@ -19,14 +180,37 @@ def delete_document():
         "kb_name": "知識庫名"
         "collection": "Qdrant集合名稱 (預設為 None)"
     }
+
+    批次刪除同一知識庫的多個文檔 (一次 Qdrant 請求):
+    {
+        "documents": [{"document_id": "文檔ID", "filename": "原始檔名 (選填)"}, ...],
+        或 "document_ids": ["文檔ID", ...],
+        "kb_name": "知識庫名",
+        "collection": "Qdrant集合名稱"
+    }
     """
     try:
         data = request.get_json()
-        document_id = data.get('document_id')
-        file_name = data.get('filename')
         kb_name = data.get('kb_name')
         collection_name = data.get('collection', None)
 
+        if data.get('documents') is not None or data.get('document_ids') is not None:
+            documents = data.get('documents') or [{"document_id": document_id} for document_id in data['document_ids']]
+            bulk = True
+        else:
+            documents = [{"document_id": data.get('document_id'), "filename": data.get('filename')}]
+            bulk = False
+        # 缺少 document_id 的項目不處理，於結果中回報
+        invalid_documents = [document for document in documents
+                             if not isinstance(document, dict) or not document.get("document_id")]
+        documents = [document for document in documents
+                     if isinstance(document, dict) and document.get("document_id")]
+        document_ids = [document["document_id"] for document in documents]
+        if not document_ids or not kb_name:
+            return jsonify({"success": False, "error": "缺少 document_id 或 kb_name"}), 400
+        if os.path.basename(kb_name) != kb_name:
+            return jsonify({"success": False, "error": "不合法的 kb_name"}), 400
+
         result = {
             "success": True,
             "message": "文檔已成功刪除",
@@ -37,49 +221,32 @@ def delete_document():
             }
         }
 
+        missing_ids = []
         try:
-            import socket
-            try:
-                socket.gethostbyname('qdrant')
-                # 如果在 Docker 環境中，使用 qdrant 主機名
-                qdrant_host = os.getenv('QDRANT_HOST', 'qdrant')
-            except socket.gaierror:
-                # 如果在本地開發環境中，使用 localhost
-                qdrant_host = os.getenv('QDRANT_HOST', 'localhost')
-            
-            qdrant_port = int(os.getenv('QDRANT_PORT', 6333))
-            qdrant_client = QdrantClient(f"http://{qdrant_host}:{qdrant_port}")
-            #qdrant_client = QdrantClient(host="localhost", port=6333)
-            collections = qdrant_client.get_collections().collections
-            collection_exists = any(c.name == collection_name for c in collections)
-
-            if not collection_exists:
-                return jsonify({
-                    "success": False,
-                    "error": f"集合 '{collection_name}' 不存在"
-                }), 404
-            
-            vectors_count_before_delete = qdrant_client.count(collection_name).count
-
-            delete_result = qdrant_client.delete(
-                collection_name=collection_name,
-                points_selector=models.FilterSelector(
-                    filter=models.Filter(
-                        must=[
-                            models.FieldCondition(
-                                key="metadata.file_id",
-                                match=models.MatchValue(value=document_id),
-                            ),
-                        ],
-                    )
-                ),
-            )
-
-            vectors_count_after_delete = qdrant_client.count(collection_name).count
-
-            deleted_vectors_count = vectors_count_before_delete - vectors_count_after_delete
+            qdrant_client = get_qdrant_client()
+            missing = _collection_missing(qdrant_client, collection_name)
+            if missing is not None:
+                return missing
+
+            # 先確認每個要刪除的文件在此知識庫中都有向量，再一次刪除找到的文件
+            counts = count_document_vectors(qdrant_client, collection_name, kb_name, document_ids)
+            found_ids = [document_id for document_id in document_ids if counts[document_id] > 0]
+            missing_ids = [document_id for document_id in document_ids if counts[document_id] == 0]
+            if found_ids:
+                deleted_vectors_count = delete_vectors(
+                    qdrant_client, collection_name, file_ids_filter(kb_name, found_ids),
+                    count=sum(counts[document_id] for document_id in found_ids)
+                )
+            else:
+                deleted_vectors_count = 0
             result["details"]["vectors_count"] = deleted_vectors_count
             result["details"]["vectors_deleted"] = deleted_vectors_count > 0
+            if missing_ids:
+                result["details"]["missing_documents"] = missing_ids
+            if invalid_documents:
+                result["details"]["invalid_documents"] = invalid_documents
+            if deleted_vectors_count > 0:
+                bump_kb_version(collection_name, kb_name)
 
         except UnexpectedResponse as e:
             result["success"] = False
@@ -96,41 +263,27 @@ def delete_document():
             result["message"] = "未刪除任何向量"
             result["error"] = "找不到文檔id指定的向量"
             return jsonify(result), 404
-        
-        # 刪除檔案
-        if file_name:
-            base_name = os.path.splitext(file_name)[0]
-            actual_filename = f"{base_name}_{document_id}.pdf"
-            file_path = os.path.join('uploads', kb_name, actual_filename)
-
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    result["details"]["file_deleted"] = True
-                    print(f"成功刪除文件：{file_path}")
-                    
-                    # 檢查知識庫資料夾是否為空，如果是則刪除
-                    kb_folder = os.path.join('uploads', kb_name)
-                    if os.path.exists(kb_folder) and not os.listdir(kb_folder):
-                        try:
-                            os.rmdir(kb_folder)
-                            print(f"成功刪除空的知識庫資料夾：{kb_folder}")
-                        except Exception as e:
-                            print(f"刪除知識庫資料夾失敗：{str(e)}")
-                except Exception as e:
-                    result["details"]["file_error"] = str(e)
-                    print(f"刪除文件失敗：{str(e)}")
-            else:
-                print(f"文件不存在所指定位置：{file_path}")
 
-            # 刪除圖片
-            UPLOAD_FOLDER_IMAGE = 'figure_storage'
-            for filename in os.listdir(UPLOAD_FOLDER_IMAGE):
-                if filename.startswith(f"{base_name}_{document_id}"):
-                    file_path = os.path.join(UPLOAD_FOLDER_IMAGE, filename)
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
-                        print(f"已刪除圖片資料：{file_path}")
+        # 部分文件在此知識庫中找不到向量：只刪除找到的文件，並回報找不到的文件
+        if missing_ids:
+            result["success"] = False
+            result["message"] = f"已刪除 {len(found_ids)} 個文檔，{len(missing_ids)} 個文檔找不到向量"
+            result["error"] = f"找不到文檔id指定的向量: {', '.join(missing_ids)}"
+        if invalid_documents:
+            result["success"] = False
+            result["error"] = "; ".join(filter(None, [result.get("error"), f"{len(invalid_documents)} 個項目缺少 document_id"]))
+
+        # 刪除檔案、圖片與表格
+        if bulk:
+            result["details"]["documents"] = {}
+            for document in documents:
+                if document["document_id"] in missing_ids:
+                    continue
+                document_details = remove_document_files(kb_name, document["document_id"], document.get("filename"))
+                result["details"]["documents"][document["document_id"]] = document_details
+            result["details"]["file_deleted"] = all(d["file_deleted"] for d in result["details"]["documents"].values())
+        else:
+            result["details"].update(remove_document_files(kb_name, document_ids[0], data.get('filename')))
 
         return jsonify(result)
 
@@ -138,4 +291,56 @@ def delete_document():
         return jsonify({
             "success": False,
             "error": f"刪除資料時出錯: {str(e)}"
-        }), 500
\ No newline at end of file
+        }), 500
+
+@delete_bp.route('/api/delete_kb', methods=['POST'])
+def delete_knowledge_base():
+    """
+    刪除整個知識庫 - 一次刪除其所有向量、上傳檔案、圖片與表格
+
+    請求JSON格式:
+    {
+        "kb_name": "知識庫資料夾名稱 (<kb_name>_<kb_id>)",
+        "collection": "Qdrant集合名稱"
+    }
+    """
+    try:
+        data = request.get_json()
+        kb_name = data.get('kb_name')
+        collection_name = data.get('collection', None)
+        if not kb_name or os.path.basename(kb_name) != kb_name:
+            return jsonify({"success": False, "error": "缺少或不合法的 kb_name"}), 400
+
+        qdrant_client = get_qdrant_client()
+        missing = _collection_missing(qdrant_client, collection_name)
+        if missing is not None:
+            return missing
+
+        deleted_vectors_count = delete_vectors(qdrant_client, collection_name, kb_filter(kb_name))
+        bump_kb_version(collection_name, kb_name)
+
+        kb_folder = os.path.join(UPLOAD_FOLDER, kb_name)
+        files_deleted = 0
+        if os.path.isdir(kb_folder):
+            files_deleted = len(os.listdir(kb_folder))
+            shutil.rmtree(kb_folder)
+            print(f"成功刪除知識庫資料夾：{kb_folder}")
+
+        return jsonify({
+            "success": True,
+            "message": "知識庫已成功刪除",
+            "details": {
+                "vectors_count": deleted_vectors_count,
+                "files_deleted": files_deleted,
+                "figures_deleted": remove_kb_figures(kb_name),
+                "tables_deleted": remove_kb_tables(kb_name)
+            }
+        })
+
+    except UnexpectedResponse as e:
+        return jsonify({"success": False, "error": f"Qdrant API錯誤: {str(e)}"}), 500
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"刪除知識庫時出錯: {str(e)}"
+        }), 500
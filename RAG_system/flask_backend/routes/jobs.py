@@ -0,0 +1,38 @@
+print("載入 jobs_bp")
+
+from flask import Blueprint, jsonify, request
+
+from .util.job_queue import ingest_queue
+
+jobs_bp = Blueprint('jobs', __name__)
+
+@jobs_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    查詢文件處理工作的狀態與進度
+
+    Returns:
+        {
+            "job_id": "工作ID",
+            "status": "queued / running / completed / failed",
+            "progress": {"stage": "...", "pages_done": 0, "pages_total": 0, "chunks_embedded": 0, "chunks_upserted": 0},
+            "result": {...},
+            "error": "錯誤訊息"
+        }
+    """
+    try:
+        job = ingest_queue.store.get(job_id)
+        if job is None:
+            return jsonify({'error': f'找不到工作 {job_id}'}), 404
+        return jsonify(job)
+    except Exception as e:
+        return jsonify({'error': f'獲取工作狀態時出錯: {str(e)}'}), 500
+
+@jobs_bp.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    try:
+        limit = int(request.args.get('limit', 50))
+        status = request.args.get('status')
+        return jsonify(ingest_queue.store.list(limit=limit, status=status))
+    except Exception as e:
+        return jsonify({'error': f'獲取工作列表時出錯: {str(e)}'}), 500
@@ -0,0 +1,28 @@
+print("載入 metrics_bp")
+
+from flask import Blueprint, Response
+
+from .util.metrics import registry
+from .util.tracing import stage_stats
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@registry.register_collector
+def _stage_latency_collector():
+    # 聊天流程各階段延遲 (來自 tracing 的樣本視窗)，以 summary 格式輸出
+    name = "rag_chat_stage_latency_seconds"
+    lines = [f"# HELP {name} Chat pipeline stage latency over the recent sample window",
+             f"# TYPE {name} summary"]
+    for stage, stats in stage_stats.summary().items():
+        lines.append(f'{name}{{stage="{stage}",quantile="0.5"}} {stats["p50_ms"] / 1000}')
+        lines.append(f'{name}{{stage="{stage}",quantile="0.95"}} {stats["p95_ms"] / 1000}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {stats["mean_ms"] * stats["count"] / 1000}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {stats["count"]}')
+    return lines
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus text exposition format 的監控指標
+    """
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -1,18 +1,77 @@
 print("載入 static_bp")
 
-from flask import Blueprint, send_from_directory
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Blueprint, abort, request, send_file
+
+from .util.figure_export import thumbnail_width, ensure_thumbnail
+from .util.figure_storage import resolve_figure
 
 static_bp = Blueprint('static', __name__)
 
+FIGURE_ROOT = 'figure_storage'
+# 瀏覽器快取秒數；圖片 ref 帶有 file_id，重新上傳的文件會得到新的 ref，
+# 因此以 immutable 長期快取，過期後才以 ETag 驗證
+FIGURE_CACHE_MAX_AGE = int(os.getenv('FIGURE_CACHE_MAX_AGE', 31536000))
+
+_ETAG_CACHE_SIZE = 4096
+_etags = OrderedDict()  # (path, mtime_ns, size) -> content hash
+_etag_lock = threading.Lock()
+
+def file_etag(path):
+    # 依檔案內容計算 strong ETag，檔案未變更時重複使用
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _etag_lock:
+        etag = _etags.get(key)
+        if etag is not None:
+            _etags.move_to_end(key)
+            return etag
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    etag = sha256.hexdigest()[:32]
+    with _etag_lock:
+        _etags[key] = etag
+        while len(_etags) > _ETAG_CACHE_SIZE:
+            _etags.popitem(last=False)
+    return etag
+
 @static_bp.route('/api/figure_storage/<path:filename>', methods=['GET'])
 def serve_figure(filename):
     """
     提供 figure_storage 目錄下的圖片文件
-    
+
     Args:
-        filename: 請求的文件名稱
-        
+        filename: 圖片 ref (由檔名中的 file_id 找到 <kb_name>/<file_id>/ 資料夾，
+            找不到時使用舊版平放的圖片)
+        w: 選填，縮圖寬度 (px)，回傳不小於此寬度的預先產生縮圖
+
     Returns:
-        請求的文件內容
+        請求的文件內容，帶 ETag 與 Cache-Control (public, max-age, immutable)，
+            支援 If-None-Match 條件請求
     """
-    return send_from_directory('figure_storage', filename) 
\ No newline at end of file
+    # 只提供 resolve_figure 找得到的圖片，manifest、縮圖資料夾等其他檔案一律 404
+    figure_dir, file_path = resolve_figure(filename, os.path.abspath(FIGURE_ROOT))
+    if file_path is None:
+        abort(404)
+    ref = filename
+
+    requested_width = request.args.get('w', type=int)
+    if requested_width and requested_width > 0:
+        width = thumbnail_width(requested_width)
+        if width is not None:
+            file_path = ensure_thumbnail(figure_dir, ref, width)
+
+    response = send_file(
+        file_path,
+        etag=file_etag(file_path),
+        conditional=True,
+        max_age=FIGURE_CACHE_MAX_AGE
+    )
+    response.cache_control.immutable = True
+    return response
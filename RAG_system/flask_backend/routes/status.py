@@ -4,6 +4,9 @@ from flask import Blueprint, jsonify
 from datetime import datetime
 import psutil
 
+from .util.tracing import stage_stats
+from .util.metrics import QUEUE_DEPTH
+
 system_status_bp = Blueprint('system_status', __name__)
 
 @system_status_bp.route('/api/status', methods=['GET'])
@@ -13,9 +16,11 @@ def get_status():
         cpu_usage = psutil.cpu_percent()
         memory_usage = psutil.virtual_memory().percent
         
+        ingest_in_progress = QUEUE_DEPTH.get(queue='ingest_in_progress')
+        
         status = {
-            'status': 'idle',  # 'idle', 'processing', 'error'
-            'message': '系統就緒',
+            'status': 'processing' if ingest_in_progress > 0 else 'idle',  # 'idle', 'processing', 'error'
+            'message': f'正在處理 {ingest_in_progress} 份文件' if ingest_in_progress > 0 else '系統就緒',
             'cpuUsage': cpu_usage,
             'memoryUsage': memory_usage,
             'lastUpdated': datetime.now().isoformat()
@@ -24,3 +29,17 @@ def get_status():
         return jsonify(status)
     except Exception as e:
         return jsonify({'error': f'獲取系統狀態時出錯: {str(e)}'}), 500
+
+@system_status_bp.route('/api/status/timings', methods=['GET'])
+def get_stage_timings():
+    """
+    回傳聊天流程各階段的延遲統計 (count, mean, p50, p95, max，單位 ms)
+    """
+    try:
+        return jsonify({
+            'stages': stage_stats.summary(),
+            'sampleSize': stage_stats.sample_size,
+            'lastUpdated': datetime.now().isoformat()
+        })
+    except Exception as e:
+        return jsonify({'error': f'獲取階段延遲統計時出錯: {str(e)}'}), 500
@@ -2,22 +2,13 @@ print("載入 upload_bp")
 
 from flask import Blueprint, jsonify, request
 import os
+import shutil
 import uuid
-from pathlib import Path
-
-from docling.datamodel.pipeline_options import PdfPipelineOptions, RapidOcrOptions, PictureDescriptionApiOptions
-from docling.backend.pypdfium2_backend import PyPdfiumDocumentBackend
-from docling.datamodel.base_models import InputFormat
-from docling.document_converter import DocumentConverter, PdfFormatOption
-from docling.chunking import HybridChunker
-from docling_core.types.doc import PictureItem, TableItem, TextItem
-from docling_core.types.doc.labels import DocItemLabel
-
-from huggingface_hub import snapshot_download
-from transformers import AutoTokenizer
-from .util.docling_util import *
-from .util.text_splitter import RecursiveTextSplitter, DataFrameFormatter
-from .util.qdrant_util import qdrant_DBConnector, DataObject
+import zipfile
+
+from .util.qdrant_util import qdrant_DBConnector
+from .util.ingest_util import ingest_pdf, ingest_pdf_batch, reindex_document, file_sha256, BATCH_CONVERSION_WORKERS
+from .util.job_queue import ingest_queue
 
 upload_bp = Blueprint('upload', __name__)
 
@@ -25,6 +16,28 @@ UPLOAD_FOLDER = './uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 UPLOAD_FOLDER_IMAGE = './figure_storage'
 os.makedirs(UPLOAD_FOLDER_IMAGE, exist_ok=True)
+# 批次匯入伺服器端資料夾時，只允許此路徑底下的資料夾
+INGEST_IMPORT_ROOT = os.getenv('INGEST_IMPORT_ROOT')
+PAGE_PARALLEL_DEFAULT = os.getenv('PAGE_PARALLEL_DEFAULT', 'false')
+
+def new_pdf_path(original_filename, kb_folder_name):
+    file_ext = os.path.splitext(original_filename)[1]
+    basename = os.path.splitext(original_filename)[0]
+
+    # 移除特殊字元但保留中文
+    safe_basename = ''.join(c for c in basename if c.isalnum() or '\u4e00' <= c <= '\u9fff')[:30]
+    file_id = str(uuid.uuid4())[:8]
+    new_filename = f"{safe_basename}_{file_id}{file_ext}"
+    file_path = os.path.join(UPLOAD_FOLDER, kb_folder_name, new_filename)
+    return file_path, file_id
+
+def parse_upload_options(form):
+    # Convertion settings
+    do_ocr = form.get("do_ocr") == "true"
+    do_image_summary = form.get("do_image_summary") == "true"
+    # 長文件依頁面區段平行轉換
+    page_parallel = form.get("page_parallel", PAGE_PARALLEL_DEFAULT) == "true"
+    return do_ocr, do_image_summary, page_parallel
 
 @upload_bp.route('/api/upload', methods=['POST'])
 def upload_file():
@@ -45,14 +58,7 @@ def upload_file():
     new_kb_name, kb_id = vector_db.find_existing_or_create_kb_folder(UPLOAD_FOLDER, kb_name)
 
     # Convertion settings
-    if request.form.get("do_ocr") == "true":
-        do_ocr = True 
-    else: 
-        do_ocr = False
-    if request.form.get("do_image_summary") == "true":
-        do_image_summary = True 
-    else:
-        do_image_summary = False
+    do_ocr, do_image_summary, page_parallel = parse_upload_options(request.form)
     
     # Get file
     if 'file' not in request.files:
@@ -63,239 +69,241 @@ def upload_file():
     
     if file and file.filename.endswith('.pdf'):
         original_filename = file.filename
-        file_ext = os.path.splitext(original_filename)[1]
-        basename = os.path.splitext(original_filename)[0]
-
-        # 移除特殊字元但保留中文
-        safe_basename = ''.join(c for c in basename if c.isalnum() or '\u4e00' <= c <= '\u9fff')[:30]
-        file_id = str(uuid.uuid4())[:8]
-        new_filename = f"{safe_basename}_{file_id}{file_ext}"
-        file_path = os.path.join(UPLOAD_FOLDER, new_kb_name, new_filename)
+        file_path, file_id = new_pdf_path(original_filename, new_kb_name)
         #print(file_path)
         file.save(file_path)
-        
-        # 處理PDF文檔
-        try:
-            # 設置docling處理選項
-            if do_ocr:
-                # PyPdfium with RapidOCR
-                # ----------------------
-                # Download RappidOCR models from HuggingFace
-                print("Downloading RapidOCR models")
-                download_path = snapshot_download(repo_id="SWHL/RapidOCR")
-
-                det_model_path = os.path.join(
-                    download_path, "PP-OCRv4", "ch_PP-OCRv4_det_infer.onnx"
-                )
-                rec_model_path = os.path.join(
-                    download_path, "PP-OCRv4", "ch_PP-OCRv4_rec_infer.onnx"
-                )
-                cls_model_path = os.path.join(
-                    download_path, "PP-OCRv3", "ch_ppocr_mobile_v2.0_cls_train.onnx"
-                )
-                ocr_options = RapidOcrOptions(
-                    det_model_path=det_model_path,
-                    rec_model_path=rec_model_path,
-                    cls_model_path=cls_model_path,
-                    #force_full_page_ocr=True
-                )
-
-                pipeline_options = PdfPipelineOptions()
-
-                pipeline_options.do_ocr = True
-                pipeline_options.do_table_structure = True
-                pipeline_options.table_structure_options.do_cell_matching = True
-                pipeline_options.table_structure_options.mode = 'accurate'
-
-                pipeline_options.images_scale = 2.0
-                pipeline_options.generate_page_images = True
-                pipeline_options.generate_picture_images = True
-
-                pipeline_options.ocr_options = ocr_options
-
-                pypdfium_converter = DocumentConverter(
-                    format_options={
-                        InputFormat.PDF: PdfFormatOption(
-                        pipeline_options=pipeline_options, backend=PyPdfiumDocumentBackend
-                        )
-                }
-                )
-
-            else:
-                # PyPdfium without EasyOCR
-                # --------------------
-                pipeline_options = PdfPipelineOptions()
-                pipeline_options.do_ocr = False
-                pipeline_options.do_table_structure = True
-                pipeline_options.table_structure_options.do_cell_matching = False
-                #pipeline_options.table_structure_options.do_cell_matching = True
-
-                #pipeline_options.table_structure_options.mode = 'accurate'
-
-                pipeline_options.images_scale = 2
-                pipeline_options.generate_page_images = True
-                pipeline_options.generate_picture_images = True
-
-                pypdfium_converter = DocumentConverter(
-                    format_options={
-                        InputFormat.PDF: PdfFormatOption(
-                        pipeline_options=pipeline_options, backend=PyPdfiumDocumentBackend
-                        )
-                    }
-                )
-            
-            # 轉換文檔
-            conv_results = pypdfium_converter.convert_all(
-                [file_path],
-                raises_on_error=True,  # to let conversion run through all and examine results at the end
-            )
-            conv_results_list = list(conv_results)
-
-            # 提取表格或圖片截圖
-            # Save images of figures and tables for later summary reference
-            for conv_res in conv_results_list:
-                docling_docs = conv_res.document
-                doc_filename = conv_res.input.file.stem
-                table_counter = 0
-                picture_counter = 0
-                
-                for element, _level in docling_docs.iterate_items():
-                    if isinstance(element, TableItem):
-                        table_counter += 1
-                        table_name = f"{doc_filename}-table-{table_counter}.png"
-                        element_image_filename = Path(os.path.join(
-                            UPLOAD_FOLDER_IMAGE, table_name
-                        ))
-                        with element_image_filename.open("wb") as fp:
-                            element.get_image(docling_docs).save(fp, "PNG")
-
-                    if isinstance(element, PictureItem):
-                        picture_counter += 1
-                        picture_name = f"{doc_filename}-picture-{picture_counter}.png"
-                        element_image_filename = Path(os.path.join(
-                            UPLOAD_FOLDER_IMAGE, picture_name
-                        ))
-                        with element_image_filename.open("wb") as fp:
-                            element.get_image(docling_docs).save(fp, "PNG")
-            
-            # 創建分塊器
-            tokenizer = AutoTokenizer.from_pretrained("BAAI/bge-m3")
-            if do_image_summary:
-                hybrid_chunker = HybridChunker(
-                    tokenizer=tokenizer,
-                    max_tokens=8000,
-                    serializer_provider=ImgAnnotationSerializerProvider(),
-                )
-            else:
-                hybrid_chunker = HybridChunker(
-                    tokenizer=tokenizer,
-                    max_tokens=8000,
-                    merge_peers=True  # optional, defaults to True
-                )
-            
-            # 分塊
-            all_chunks = []
-            for conv_res in conv_results_list:
-                docling_docs = conv_res.document
-                chunk_iter = hybrid_chunker.chunk(dl_doc=docling_docs)
-                chunks = list(chunk_iter)
-                all_chunks += chunks
-            
-            # 處理大塊文本
-            big_chunk = []
-            for i, chunk in enumerate(all_chunks):
-                if type(chunk) == tuple:
-                    ser_txt = chunk[0]
-                else:
-                    ser_txt = hybrid_chunker.contextualize(chunk=chunk)
-                ser_tokens = len(tokenizer.tokenize(ser_txt))
-                if ser_tokens > 1024:
-                    #print(f"=== {i} ===")
-                    #print(f"chunker.serialize(chunk) ({ser_tokens} tokens):\n{repr(ser_txt)}")
-                    #print(f"chunker.serialize(chunk) ({ser_tokens} tokens):\n{ser_txt}")
-                    big_chunk.append(chunk)
-                    #print()
-                else:
-                    pass
-                
-            splitter = RecursiveTextSplitter(tokenizer=tokenizer, max_tokens=1024, overlap=150, min_length_ratio=1)
-
-            rechunked_large_chunks = []
-
-            for i, chunk in enumerate(big_chunk):
-                if type(chunk) == tuple:
-                    ser_txt = chunk[0]
-                else:
-                    ser_txt = hybrid_chunker.contextualize(chunk=chunk)
-                    
-                if splitter.tokenize_len(ser_txt) > splitter.max_tokens:
-                    sub_chunks = splitter.split_text(ser_txt)
-                    #sub_chunks_meta = {"filename": chunk.meta.origin.filename}
-                    sub_chunks_meta = extract_meta_from_docling(chunk.meta)
-                    sub_chunks_pair = [(text, sub_chunks_meta) for text in sub_chunks]
-                    rechunked_large_chunks.extend(sub_chunks_pair)
-                else:
-                    rechunked_large_chunks.append(ser_txt)
-            
-            # 提取表格
-            all_tables = extract_tables(conv_results_list)
-            table_formatter = DataFrameFormatter(tokenizer=tokenizer, show_index=False, max_tokens=1024)
-
-            table_chunks = []
-            for table in all_tables:
-                chunks = table_formatter.chunk_rows(table[0])
-                chunks_pair = [(text, table[1]) for text in chunks]
-                table_chunks.extend(chunks_pair)
-            
-            # 匯總所有分切的chunk
-            all_chunks.extend(rechunked_large_chunks)
-            all_chunks.extend(table_chunks)
-
-            # 分割text, metadata
-            node_text, node_metadatas = [], []
-            for chunk in all_chunks:
-                if type(chunk) == tuple:
-                    node_text.append(chunk[0])
-                    basename, _ = os.path.splitext(chunk[1]["filename"])
-                    file_id = basename.split('_')[-1]
-                    chunk[1]["file_id"] = file_id
-                    chunk[1]["kb_name"] = new_kb_name
-                    chunk[1]["kb_id"] = kb_id
-                    #node_metadatas.append(json.dumps(meta_dict, indent=4, ensure_ascii=False))
-                    node_metadatas.append(chunk[1])
-                else:
-                    node_text.append(hybrid_chunker.contextualize(chunk=chunk))
-                    meta_dict = extract_meta_from_docling(chunk.meta)
-                    basename, _ = os.path.splitext(meta_dict.get("filename"))
-                    file_id = basename.split('_')[-1]
-                    meta_dict["file_id"] = file_id
-                    meta_dict["kb_name"] = new_kb_name
-                    meta_dict["kb_id"] = kb_id
-                    #node_metadatas.append(json.dumps(meta_dict, indent=4, ensure_ascii=False))
-                    node_metadatas.append(meta_dict)
-            
-            # 生成嵌入向量
-            embedded_text = []
-            for i in node_text:
-                embedded_text.append(get_embeddings(i))
-            
-            # 存儲到Qdrant
-            data = DataObject(node_text, node_metadatas)
-            #vector_db = qdrant_DBConnector("qdrant_new", recreate=True)
-            vector_db.upsert_vector(embedded_text, data)
-            
+
+        # 同一知識庫已有內容相同的文件時直接回傳，不重複處理
+        existing = vector_db.find_file_by_hash(file_sha256(file_path), new_kb_name)
+        if existing is not None:
+            os.remove(file_path)
             return jsonify({
                 'success': True,
-                'file_id': file_id,
+                'duplicate': True,
+                'status': 'completed',
+                'file_id': existing['file_id'],
                 'filename': original_filename,
                 'kb_name': new_kb_name,
                 'do_ocr': do_ocr,
                 'do_image_summary': do_image_summary
-                #'chunks_count': len(chunks),
-                #'tables_count': 0
             })
-            
-        except Exception as e:
-            return jsonify({'error': f'處理文件時出錯: {str(e)}'}), 500
+        
+        # 加入背景處理佇列，立即回傳工作ID
+        job_id = ingest_queue.enqueue('pdf', {
+            'file_path': file_path,
+            'collection': upload_collection,
+            'kb_name': new_kb_name,
+            'kb_id': kb_id,
+            'do_ocr': do_ocr,
+            'do_image_summary': do_image_summary,
+            'page_parallel': page_parallel
+        })
+
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'file_id': file_id,
+            'filename': original_filename,
+            'kb_name': new_kb_name,
+            'do_ocr': do_ocr,
+            'do_image_summary': do_image_summary,
+            'page_parallel': page_parallel
+        }), 202
     
-    return jsonify({'error': '不支持的文件類型'}), 400
\ No newline at end of file
+    return jsonify({'error': '不支持的文件類型'}), 400
+
+def run_pdf_ingest_job(params, progress):
+    return ingest_pdf(
+        params['file_path'],
+        params['collection'],
+        params['kb_name'],
+        params['kb_id'],
+        do_ocr=params.get('do_ocr', False),
+        do_image_summary=params.get('do_image_summary', False),
+        page_parallel=params.get('page_parallel', False),
+        progress=progress
+    )
+
+@upload_bp.route('/api/upload/batch', methods=['POST'])
+def upload_batch():
+    """
+    批次上傳多個PDF到同一個知識庫，背景以管線方式處理
+
+    表單欄位:
+        collection: Qdrant集合名稱
+        kb_name: 知識庫名
+        files: 多個 PDF 檔或 zip 壓縮檔 (可重複)
+        directory: 伺服器端資料夾路徑 (需位於 INGEST_IMPORT_ROOT 底下)
+        do_ocr, do_image_summary: 同 /api/upload
+        conversion_workers: 同時轉換的檔案數 (預設 BATCH_CONVERSION_WORKERS)
+    """
+    upload_collection = request.form.get('collection')
+    if not upload_collection:
+        return jsonify({'error': '未提供 collection 名稱'}), 400
+    kb_name = request.form.get('kb_name')
+    if not kb_name:
+        return jsonify({'error': '沒有知識庫名部分'}), 400
+
+    files = [f for f in request.files.getlist('files') if f.filename]
+    directory = request.form.get('directory')
+    if not files and not directory:
+        return jsonify({'error': '沒有文件或資料夾'}), 400
+
+    if directory:
+        if not INGEST_IMPORT_ROOT:
+            return jsonify({'error': '伺服器未開放資料夾匯入 (未設定 INGEST_IMPORT_ROOT)'}), 403
+        import_root = os.path.realpath(INGEST_IMPORT_ROOT)
+        directory = os.path.realpath(directory)
+        if os.path.commonpath([import_root, directory]) != import_root or not os.path.isdir(directory):
+            return jsonify({'error': f'不允許的資料夾路徑: {directory}'}), 400
+
+    do_ocr, do_image_summary, page_parallel = parse_upload_options(request.form)
+    conversion_workers = int(request.form.get('conversion_workers', BATCH_CONVERSION_WORKERS))
+
+    vector_db = qdrant_DBConnector(upload_collection, recreate=False)
+    new_kb_name, kb_id = vector_db.find_existing_or_create_kb_folder(UPLOAD_FOLDER, kb_name)
+
+    saved_files = []
+    skipped = []
+
+    def add_saved(original_filename, save_fn):
+        file_path, file_id = new_pdf_path(os.path.basename(original_filename), new_kb_name)
+        save_fn(file_path)
+        saved_files.append({'filename': os.path.basename(original_filename), 'file_id': file_id, 'file_path': file_path})
+
+    for file in files:
+        if file.filename.lower().endswith('.pdf'):
+            add_saved(file.filename, file.save)
+        elif file.filename.lower().endswith('.zip'):
+            try:
+                with zipfile.ZipFile(file.stream) as archive:
+                    for member in archive.infolist():
+                        if member.is_dir() or not member.filename.lower().endswith('.pdf'):
+                            continue
+                        def save_member(path, member=member):
+                            with archive.open(member) as src, open(path, 'wb') as dst:
+                                shutil.copyfileobj(src, dst)
+                        add_saved(member.filename, save_member)
+            except zipfile.BadZipFile:
+                skipped.append({'filename': file.filename, 'reason': '無效的 zip 檔'})
+        else:
+            skipped.append({'filename': file.filename, 'reason': '不支持的文件類型'})
+
+    if directory:
+        for root, _dirs, names in os.walk(directory):
+            for name in sorted(names):
+                if name.lower().endswith('.pdf'):
+                    src = os.path.join(root, name)
+                    add_saved(name, lambda path, src=src: shutil.copyfile(src, path))
+
+    if not saved_files:
+        return jsonify({'error': '沒有可處理的 PDF 文件', 'skipped': skipped}), 400
+
+    job_id = ingest_queue.enqueue('pdf_batch', {
+        'file_paths': [f['file_path'] for f in saved_files],
+        'collection': upload_collection,
+        'kb_name': new_kb_name,
+        'kb_id': kb_id,
+        'do_ocr': do_ocr,
+        'do_image_summary': do_image_summary,
+        'page_parallel': page_parallel,
+        'conversion_workers': conversion_workers
+    })
+
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'kb_name': new_kb_name,
+        'files': [{'filename': f['filename'], 'file_id': f['file_id']} for f in saved_files],
+        'skipped': skipped,
+        'do_ocr': do_ocr,
+        'do_image_summary': do_image_summary
+    }), 202
+
+def run_pdf_batch_ingest_job(params, progress):
+    return ingest_pdf_batch(
+        params['file_paths'],
+        params['collection'],
+        params['kb_name'],
+        params['kb_id'],
+        do_ocr=params.get('do_ocr', False),
+        do_image_summary=params.get('do_image_summary', False),
+        conversion_workers=params.get('conversion_workers', BATCH_CONVERSION_WORKERS),
+        page_parallel=params.get('page_parallel', False),
+        progress=progress
+    )
+
+@upload_bp.route('/api/reindex', methods=['POST'])
+def reindex_files():
+    """
+    以保存的轉換結果重新分塊、嵌入並寫入已上傳的文件
+
+    請求JSON格式:
+    {
+        "collection": "Qdrant集合名稱",
+        "kb_name": "知識庫資料夾名 (<kb_name>_<kb_id>)",
+        "file_ids": ["文件ID", ...],
+        "do_ocr": "選填，未指定時沿用已保存的轉換結果",
+        "do_image_summary": false
+    }
+    """
+    data = request.get_json() or {}
+    collection = data.get('collection')
+    if not collection:
+        return jsonify({'error': '未提供 collection 名稱'}), 400
+    kb_name = data.get('kb_name')
+    if not kb_name:
+        return jsonify({'error': '沒有知識庫名部分'}), 400
+    file_ids = data.get('file_ids') or ([data['file_id']] if data.get('file_id') else [])
+    if not file_ids:
+        return jsonify({'error': '未提供文件ID'}), 400
+    if not os.path.isdir(os.path.join(UPLOAD_FOLDER, kb_name)):
+        return jsonify({'error': f'知識庫 {kb_name} 不存在'}), 404
+
+    job_id = ingest_queue.enqueue('reindex', {
+        'collection': collection,
+        'kb_name': kb_name,
+        'file_ids': file_ids,
+        'do_ocr': data.get('do_ocr'),
+        'do_image_summary': bool(data.get('do_image_summary', False))
+    })
+
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'kb_name': kb_name,
+        'file_ids': file_ids
+    }), 202
+
+def run_reindex_job(params, progress):
+    results = []
+    failures = []
+    files_total = len(params['file_ids'])
+    for file_id in params['file_ids']:
+        def file_progress(stage, **fields):
+            progress(stage, files_total=files_total, files_done=len(results) + len(failures),
+                     current_file=file_id, **fields)
+        try:
+            results.append(reindex_document(
+                params['collection'],
+                params['kb_name'],
+                file_id,
+                do_ocr=params.get('do_ocr'),
+                do_image_summary=params.get('do_image_summary', False),
+                progress=file_progress
+            ))
+        except Exception as e:
+            failures.append({'file_id': file_id, 'error': str(e)})
+    return {
+        'files_total': files_total,
+        'files_succeeded': len(results),
+        'files': results,
+        'failures': failures
+    }
+
+ingest_queue.register_handler('pdf', run_pdf_ingest_job)
+ingest_queue.register_handler('pdf_batch', run_pdf_batch_ingest_job)
+ingest_queue.register_handler('reindex', run_reindex_job)
@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# 知識庫版本號，上傳或刪除文件時遞增，使舊的快取答案失效
+_kb_versions = {}
+_kb_versions_lock = threading.Lock()
+
+def get_kb_version(collection_name, kb_name):
+    with _kb_versions_lock:
+        return _kb_versions.get((collection_name, kb_name), 0)
+
+def bump_kb_version(collection_name, kb_name=None):
+    """
+    mark a knowledge base as changed
+
+    Args:
+        collection_name: qdrant collection name
+        kb_name: knowledge base name, None bumps every kb in the collection
+    """
+    with _kb_versions_lock:
+        if kb_name is None:
+            for key in list(_kb_versions):
+                if key[0] == collection_name:
+                    _kb_versions[key] += 1
+            # 尚未記錄過的知識庫也要失效
+            _kb_versions[(collection_name, None)] = _kb_versions.get((collection_name, None), 0) + 1
+        else:
+            _kb_versions[(collection_name, kb_name)] = _kb_versions.get((collection_name, kb_name), 0) + 1
+    answer_cache.invalidate(collection_name, kb_name)
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold=0.95, max_entries=256, ttl=None):
+        """
+        answer cache keyed by (collection, kb_name, model, settings) and query embedding
+
+        Args:
+            threshold: cosine similarity a cached query must exceed to count as hit
+            max_entries: max cached answers per (collection, kb_name, model, settings)
+            ttl: seconds an entry stays valid, None for no expiry
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = {}  # (collection, kb_name, model, settings) -> OrderedDict(query -> entry)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def version(self, collection_name, kb_name):
+        # 檢索前取得，生成結束後傳入 store()，期間知識庫有變動時不寫入快取
+        return (get_kb_version(collection_name, kb_name), get_kb_version(collection_name, None))
+
+    def lookup(self, collection_name, kb_name, model, query_embedding, settings=None):
+        """
+        Args:
+            settings: hashable retrieval settings the answer depends on
+                (rerank mode, top_k, ...); answers are only shared between
+                requests with equal settings
+        Returns:
+            cached {"answer", "sources", "query", "similarity"} or None
+        """
+        key = (collection_name, kb_name, model, settings)
+        version = self.version(collection_name, kb_name)
+        query_vec = self._normalize(query_embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            bucket = self._entries.get(key)
+            best_query, best_entry, best_sim = None, None, -1.0
+            if bucket:
+                for cached_query, entry in list(bucket.items()):
+                    if entry["version"] != version or (self.ttl and now - entry["created"] > self.ttl):
+                        del bucket[cached_query]
+                        continue
+                    sim = float(np.dot(query_vec, entry["embedding"]))
+                    if sim > best_sim:
+                        best_query, best_entry, best_sim = cached_query, entry, sim
+
+            if best_entry is not None and best_sim >= self.threshold:
+                bucket.move_to_end(best_query)
+                self.hits += 1
+                return {
+                    "answer": best_entry["answer"],
+                    "sources": best_entry["sources"],
+                    "query": best_query,
+                    "similarity": best_sim
+                }
+            self.misses += 1
+            return None
+
+    def store(self, collection_name, kb_name, model, query, query_embedding, answer, sources,
+              version=None, settings=None):
+        """
+        Args:
+            version: version() taken before retrieval; the answer is not
+                stored if the knowledge base changed since
+            settings: same as lookup()
+        Returns:
+            True if stored
+        """
+        key = (collection_name, kb_name, model, settings)
+        current_version = self.version(collection_name, kb_name)
+        if version is not None and version != current_version:
+            return False
+        entry = {
+            "embedding": self._normalize(query_embedding),
+            "answer": answer,
+            "sources": sources,
+            "version": current_version,
+            "created": time.monotonic()
+        }
+        with self._lock:
+            bucket = self._entries.setdefault(key, OrderedDict())
+            bucket[query] = entry
+            bucket.move_to_end(query)
+            while len(bucket) > self.max_entries:
+                bucket.popitem(last=False)
+        return True
+
+    def invalidate(self, collection_name, kb_name=None):
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == collection_name and (kb_name is None or key[1] == kb_name):
+                    del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0,
+                "entries": sum(len(bucket) for bucket in self._entries.values())
+            }
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv('ANSWER_CACHE_THRESHOLD', 0.95)),
+    max_entries=int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 256)),
+    ttl=float(os.getenv('ANSWER_CACHE_TTL')) if os.getenv('ANSWER_CACHE_TTL') else None
+)
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import uuid
+from importlib.metadata import version, PackageNotFoundError
+
+from docling_core.types.doc import ImageRefMode
+from docling_core.types.doc.document import DoclingDocument
+
+CONVERSION_CACHE_FOLDER = os.getenv('CONVERSION_CACHE_FOLDER', './conversion_cache')
+# 轉換設定有影響輸出的修改時遞增，讓舊快取失效
+CONVERSION_CACHE_VERSION = 1
+
+def _docling_version():
+    try:
+        return version("docling")
+    except PackageNotFoundError:
+        return "unknown"
+
+def options_key(do_ocr):
+    # 以會影響轉換結果的設定組成快取鍵
+    options = {
+        "do_ocr": bool(do_ocr),
+        "docling": _docling_version(),
+        "version": CONVERSION_CACHE_VERSION
+    }
+    return hashlib.sha256(json.dumps(options, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def cache_path(file_hash, do_ocr):
+    return os.path.join(CONVERSION_CACHE_FOLDER, f"{file_hash}_{options_key(do_ocr)}.json")
+
+def cached_ocr_option(file_hash):
+    # 重新索引未指定 OCR 設定時，沿用已有的轉換快取 (優先使用 OCR 版本)
+    for do_ocr in (True, False):
+        if os.path.exists(cache_path(file_hash, do_ocr)):
+            return do_ocr
+    return None
+
+def load_converted(file_hash, do_ocr, file_path):
+    """
+    load a cached DoclingDocument converted from identical content
+
+    origin filename and name are set to file_path, since the cached
+    conversion may come from an upload with another file_id
+
+    Returns:
+        DoclingDocument or None
+    """
+    path = cache_path(file_hash, do_ocr)
+    if not os.path.exists(path):
+        return None
+    try:
+        doc = DoclingDocument.load_from_json(path)
+    except Exception as e:
+        print(f"讀取轉換快取失敗 {path}: {str(e)}")
+        return None
+    filename = os.path.basename(file_path)
+    doc.name = os.path.splitext(filename)[0]
+    if doc.origin is not None:
+        doc.origin.filename = filename
+    return doc
+
+def save_converted(doc, file_hash, do_ocr):
+    # 圖片以內嵌方式保存，重新分塊時可直接輸出表格與圖片截圖
+    os.makedirs(CONVERSION_CACHE_FOLDER, exist_ok=True)
+    path = cache_path(file_hash, do_ocr)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        doc.save_as_json(tmp_path, image_mode=ImageRefMode.EMBEDDED)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
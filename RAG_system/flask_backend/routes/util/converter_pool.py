@@ -0,0 +1,108 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+from docling.chunking import HybridChunker
+
+from transformers import AutoTokenizer
+from .docling_util import ImgAnnotationSerializerProvider
+from .metrics import time_model_load
+from .page_worker import new_converter
+
+TOKENIZER_NAME = "BAAI/bge-m3"
+# 每組設定最多建立的 converter 數量，預設足以支援 ingest worker 與批次轉換同時進行
+CONVERTER_POOL_SIZE = int(os.getenv(
+    'CONVERTER_POOL_SIZE',
+    max(int(os.getenv('INGEST_WORKERS', 1)), int(os.getenv('BATCH_CONVERSION_WORKERS', 2)))
+))
+
+_lock = threading.Lock()
+_tokenizer = None
+_chunkers = {}
+_converter_pools = {}  # option key -> {"idle": Queue, "created": int}
+
+def _build_converter(do_ocr):
+    with time_model_load('docling_converter_ocr' if do_ocr else 'docling_converter'):
+        return new_converter(do_ocr)
+
+def _get_pool(key):
+    with _lock:
+        pool = _converter_pools.get(key)
+        if pool is None:
+            pool = _converter_pools[key] = {"idle": queue.Queue(), "created": 0}
+        return pool
+
+@contextmanager
+def converter_for(do_ocr):
+    """
+    borrow a DocumentConverter for the given option set
+
+    converters are created lazily, reused across uploads and never shared
+    by two conversions at the same time (at most CONVERTER_POOL_SIZE per key)
+    """
+    key = (bool(do_ocr),)
+    pool = _get_pool(key)
+    converter = None
+    try:
+        converter = pool["idle"].get_nowait()
+    except queue.Empty:
+        with _lock:
+            can_create = pool["created"] < CONVERTER_POOL_SIZE
+            if can_create:
+                pool["created"] += 1
+        if can_create:
+            try:
+                converter = _build_converter(do_ocr)
+            except Exception:
+                with _lock:
+                    pool["created"] -= 1
+                raise
+        else:
+            converter = pool["idle"].get()
+    try:
+        yield converter
+    finally:
+        pool["idle"].put(converter)
+
+def get_tokenizer():
+    global _tokenizer
+    with _lock:
+        if _tokenizer is None:
+            with time_model_load(f'{TOKENIZER_NAME} tokenizer'):
+                _tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+        return _tokenizer
+
+def get_chunker(do_image_summary):
+    # 創建分塊器
+    tokenizer = get_tokenizer()
+    with _lock:
+        chunker = _chunkers.get(bool(do_image_summary))
+        if chunker is None:
+            if do_image_summary:
+                chunker = HybridChunker(
+                    tokenizer=tokenizer,
+                    max_tokens=8000,
+                    serializer_provider=ImgAnnotationSerializerProvider(),
+                )
+            else:
+                chunker = HybridChunker(
+                    tokenizer=tokenizer,
+                    max_tokens=8000,
+                    merge_peers=True  # optional, defaults to True
+                )
+            _chunkers[bool(do_image_summary)] = chunker
+        return chunker
+
+def warm_up(option_sets=((False, False),)):
+    """
+    build converters, tokenizer and chunkers ahead of the first upload
+
+    Args:
+        option_sets: iterable of (do_ocr, do_image_summary)
+    """
+    for do_ocr, do_image_summary in option_sets:
+        with converter_for(do_ocr):
+            pass
+        get_chunker(do_image_summary)
+    print("converter pool warm-up finished")
@@ -16,6 +16,9 @@ from docling_core.transforms.serializer.markdown import MarkdownPictureSerialize
 from docling_core.types.doc.document import PictureClassificationData, PictureDescriptionData, PictureItem, PictureMoleculeData, DoclingDocument
 from docling_core.transforms.chunker.hierarchical_chunker import ChunkingSerializerProvider, ChunkingDocSerializer, DocChunk
 
+from .image_summary import summarize_image_cached
+from .figure_export import figure_ref
+
 class AnnotationPictureSerializer(MarkdownPictureSerializer):
 
     @override
@@ -33,7 +36,8 @@ class AnnotationPictureSerializer(MarkdownPictureSerializer):
         image_uri = str(item.image.uri)
         doc_name = doc.origin.filename
 
-        image_caption = summarize_image_openai(doc_name, image_uri)
+        # 摘要已在分塊前平行產生，這裡只讀取快取
+        image_caption = summarize_image_cached(doc_name, image_uri)
         #image_caption = "aaaa"
 
         text_parts.append(image_caption)
@@ -61,13 +65,13 @@ def extract_meta_from_docling(DocChunk: DocChunk):
         if it.get("label") == "table":
             self_ref = it.get("self_ref")
             table_ref_count = int(self_ref.split("/")[-1]) + 1
-            table_ref_name = f"{os.path.splitext(chunk_file_name)[0]}-table-{table_ref_count}.png"
+            table_ref_name = figure_ref(os.path.splitext(chunk_file_name)[0], "table", table_ref_count)
             table_ref.append(table_ref_name)
 
         elif it.get("label") == "picture":
             self_ref = it.get("self_ref")
             image_ref_count = int(self_ref.split("/")[-1]) + 1
-            image_ref_name = f"{os.path.splitext(chunk_file_name)[0]}-picture-{image_ref_count}.png"
+            image_ref_name = figure_ref(os.path.splitext(chunk_file_name)[0], "picture", image_ref_count)
             image_ref.append(image_ref_name)
 
         for provs in it.get("prov"):
@@ -95,11 +99,13 @@ class PatchedChunkingSerializerProvider(BaseSerializerProvider):
 def extract_tables(list_dl_doc):
     all_tables = []
     for result in list_dl_doc:
-        table_filename, ext = os.path.splitext(result.document.origin.filename)
+        # 接受 ConversionResult 或 DoclingDocument
+        document = getattr(result, "document", result)
+        table_filename, ext = os.path.splitext(document.origin.filename)
 
-        for table in result.document.tables:
+        for table in document.tables:
             self_ref = table.self_ref
-            table_ref_name = f"{table_filename}-table-{int(self_ref.split('/')[-1]) + 1}.png"
+            table_ref_name = figure_ref(table_filename, "table", int(self_ref.split('/')[-1]) + 1)
             page_ref_set = [prov.page_no for prov in table.prov]
 
             table_meta = {
@@ -164,7 +170,8 @@ def summarize_image_openai(filename, image_base64, model="gpt-4o"):
     if not api_key:
         raise ValueError("無效的 OPENAI_API_KEY，請確認你的 .env 檔案中有正確設定。")
     
-    openai_client = OpenAI(api_key=api_key)
+    # OPENAI_BASE_URL 可指向相容 OpenAI API 的服務 (例如測試用的 stub server)
+    openai_client = OpenAI(api_key=api_key, base_url=os.getenv("OPENAI_BASE_URL") or None)
 
     prompt = (
         f"請仔細閱讀這張來自文檔「{filename}」的圖片內容。綜合檔名和你看到的圖像資訊，完成以下任務：\n"
@@ -0,0 +1,234 @@
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# 表格/圖片截圖輸出設定
+FIGURE_FORMAT = os.getenv('FIGURE_FORMAT', 'png').lower()  # png / webp / jpeg
+FIGURE_QUALITY = int(os.getenv('FIGURE_QUALITY', 85))  # webp / jpeg 品質
+FIGURE_MAX_DIMENSION = int(os.getenv('FIGURE_MAX_DIMENSION', 0))  # 長邊上限 (px)，0 為不縮放
+FIGURE_EXPORT_WORKERS = int(os.getenv('FIGURE_EXPORT_WORKERS', 2))
+# 預先產生的縮圖寬度 (px)，/api/figure_storage/<ref>?w= 取最接近的寬度
+FIGURE_THUMBNAIL_WIDTHS = sorted(int(w) for w in os.getenv('FIGURE_THUMBNAIL_WIDTHS', '320,640').split(',') if w.strip())
+THUMBNAIL_FOLDER = 'thumbs'
+
+_FORMATS = {
+    "png": ("PNG", ".png"),
+    "webp": ("WEBP", ".webp"),
+    "jpeg": ("JPEG", ".jpg"),
+    "jpg": ("JPEG", ".jpg"),
+}
+if FIGURE_FORMAT not in _FORMATS:
+    raise ValueError(f"不支援的 FIGURE_FORMAT: {FIGURE_FORMAT} (可用 png / webp / jpeg)")
+FIGURE_PIL_FORMAT, FIGURE_EXTENSION = _FORMATS[FIGURE_FORMAT]
+
+# 最近輸出過的圖片 hash -> 檔案路徑，相同圖片直接複製不重新編碼
+_RECENT_LIMIT = 512
+_recent = OrderedDict()
+_WIDTH_CACHE_SIZE = 4096
+_widths = OrderedDict()  # (path, mtime_ns) -> 原圖寬度
+_lock = threading.Lock()
+_executor = None
+
+def figure_ref(doc_stem, kind, number):
+    """
+    file name of the N-th table / picture of a document, e.g.
+    figure_ref("report_1a2b3c4d", "table", 1) -> "report_1a2b3c4d-table-1.png"
+    """
+    return f"{doc_stem}-{kind}-{number}{FIGURE_EXTENSION}"
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, FIGURE_EXPORT_WORKERS), thread_name_prefix="figure-export")
+        return _executor
+
+def image_hash(image):
+    sha256 = hashlib.sha256()
+    sha256.update(f"{image.mode}|{image.size}".encode("utf-8"))
+    sha256.update(image.tobytes())
+    return sha256.hexdigest()
+
+def _save(image, path, pil_format):
+    if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, "wb") as fp:
+            if pil_format == "PNG":
+                image.save(fp, "PNG")
+            else:
+                image.save(fp, pil_format, quality=FIGURE_QUALITY)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def encode_image(image, path):
+    if FIGURE_MAX_DIMENSION > 0 and max(image.size) > FIGURE_MAX_DIMENSION:
+        image = image.copy()
+        image.thumbnail((FIGURE_MAX_DIMENSION, FIGURE_MAX_DIMENSION), Image.LANCZOS)
+    _save(image, path, FIGURE_PIL_FORMAT)
+
+def thumbnail_width(requested_width):
+    # 取不小於要求寬度的最小縮圖寬度，超過時用最大的縮圖
+    for width in FIGURE_THUMBNAIL_WIDTHS:
+        if width >= requested_width:
+            return width
+    return FIGURE_THUMBNAIL_WIDTHS[-1] if FIGURE_THUMBNAIL_WIDTHS else None
+
+def thumbnail_path(figure_root, ref, width):
+    return os.path.join(figure_root, THUMBNAIL_FOLDER, str(width), ref)
+
+def make_thumbnail(source_path, target_path, width):
+    """
+    write a width-limited copy of a figure in the figure's own format
+
+    Returns:
+        False if the figure is not wider than width (serve the original)
+    """
+    with Image.open(source_path) as image:
+        if image.width <= width:
+            return False
+        pil_format = image.format or FIGURE_PIL_FORMAT
+        height = max(1, round(image.height * width / image.width))
+        thumbnail = image.resize((width, height), Image.LANCZOS)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    _save(thumbnail, target_path, pil_format)
+    return True
+
+def ensure_thumbnail(figure_root, ref, width):
+    """
+    path of the thumbnail of ref for width, generated when missing or
+    older than the figure; the figure path when it is narrow enough
+    """
+    source_path = os.path.join(figure_root, ref)
+    if figure_width(source_path) <= width:
+        return source_path
+    target_path = thumbnail_path(figure_root, ref, width)
+    if os.path.exists(target_path) and os.path.getmtime(target_path) >= os.path.getmtime(source_path):
+        return target_path
+    return target_path if make_thumbnail(source_path, target_path, width) else source_path
+
+def figure_width(path):
+    # 原圖寬度依 (路徑, 修改時間) 快取，窄圖的縮圖請求不必每次重新開啟原圖
+    key = (path, os.stat(path).st_mtime_ns)
+    with _lock:
+        width = _widths.get(key)
+        if width is not None:
+            _widths.move_to_end(key)
+            return width
+    with Image.open(path) as image:
+        width = image.width
+    with _lock:
+        _widths[key] = width
+        while len(_widths) > _WIDTH_CACHE_SIZE:
+            _widths.popitem(last=False)
+    return width
+
+def remove_thumbnails(figure_root, prefix):
+    # 刪除以 prefix 開頭的圖片的所有縮圖
+    thumbnail_root = os.path.join(figure_root, THUMBNAIL_FOLDER)
+    if not os.path.isdir(thumbnail_root):
+        return 0
+    removed = 0
+    for width_dir in os.listdir(thumbnail_root):
+        width_path = os.path.join(thumbnail_root, width_dir)
+        if not os.path.isdir(width_path):
+            continue
+        for filename in os.listdir(width_path):
+            if filename.startswith(prefix):
+                os.remove(os.path.join(width_path, filename))
+                removed += 1
+    return removed
+
+def export_image(image, path):
+    """
+    write one figure, copying an identical already encoded image if any
+    (an identical image being encoded by another thread is waited for)
+
+    Returns:
+        True if the image was encoded, False if copied
+    """
+    digest = image_hash(image)
+    with _lock:
+        existing = _recent.get(digest)
+        if existing is None:
+            done = threading.Event()
+            _recent[digest] = (path, done)
+        _recent.move_to_end(digest)
+        while len(_recent) > _RECENT_LIMIT:
+            _recent.popitem(last=False)
+
+    if existing is not None:
+        existing_path, existing_done = existing
+        existing_done.wait()
+        if existing_path != path and os.path.exists(existing_path):
+            shutil.copyfile(existing_path, path)
+            return False
+
+    try:
+        encode_image(image, path)
+    except Exception:
+        if existing is None:
+            with _lock:
+                _recent.pop(digest, None)
+        raise
+    finally:
+        if existing is None:
+            done.set()
+    return True
+
+
+class FigureExporter:
+    def __init__(self):
+        """
+        export table / picture images of one ingest in the shared
+        background pool, so chunking does not wait for image encoding
+        """
+        self._futures = []
+
+    def submit(self, element, doc, path):
+        self._futures.append(_get_executor().submit(self._export, element, doc, path))
+
+    @staticmethod
+    def _export(element, doc, path):
+        image = element.get_image(doc)
+        if image is None:
+            return None
+        encoded = export_image(image, path)
+        # 預先產生聊天介面使用的縮圖
+        figure_root, ref = os.path.split(path)
+        for width in FIGURE_THUMBNAIL_WIDTHS:
+            make_thumbnail(path, thumbnail_path(figure_root, ref, width), width)
+        return encoded
+
+    def wait(self):
+        """
+        wait for every submitted export; failures are logged, not raised
+
+        Returns:
+            dict with exported, copied (identical image) and failed counts
+        """
+        stats = {"exported": 0, "copied": 0, "failed": 0}
+        for future in self._futures:
+            try:
+                encoded = future.result()
+            except Exception as e:
+                print(f"輸出圖片失敗: {str(e)}")
+                stats["failed"] += 1
+                continue
+            if encoded is None:
+                stats["failed"] += 1
+            elif encoded:
+                stats["exported"] += 1
+            else:
+                stats["copied"] += 1
+        self._futures = []
+        return stats
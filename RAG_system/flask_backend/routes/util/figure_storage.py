@@ -0,0 +1,168 @@
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+
+# 圖片依知識庫與文件分層存放：figure_storage/<kb_name>/<file_id>/<ref>
+# 舊版上傳的圖片仍平放在 figure_storage/<ref>
+FIGURE_ROOT = './figure_storage'
+MANIFEST_NAME = 'manifest.json'
+# figure_export 可能輸出的圖片格式，其他檔案 (manifest、暫存檔) 不對外提供
+IMAGE_EXTENSIONS = ('.png', '.webp', '.jpg', '.jpeg')
+
+_REF_PATTERN = re.compile(r"^(?P<stem>.+)-(?:table|picture)-\d+\.[A-Za-z0-9]+$")
+
+_lock = threading.Lock()
+_document_dirs = {}  # file_id -> document dir
+
+def ref_file_id(ref):
+    """
+    file_id encoded in a figure ref, e.g. "report_1a2b3c4d-table-1.png" -> "1a2b3c4d"
+    """
+    match = _REF_PATTERN.match(ref)
+    if match is None:
+        return None
+    return match.group("stem").split('_')[-1]
+
+def is_figure_ref(ref):
+    """
+    True for a bare figure file name ("<stem>_<file_id>-table|picture-N.<image ext>")
+    """
+    return (os.path.basename(ref) == ref
+            and ref_file_id(ref) is not None
+            and os.path.splitext(ref)[1].lower() in IMAGE_EXTENSIONS)
+
+def document_dir(kb_name, file_id, figure_root=FIGURE_ROOT):
+    return os.path.join(figure_root, kb_name, file_id)
+
+def prepare_document_dir(kb_name, file_id, figure_root=FIGURE_ROOT):
+    path = document_dir(kb_name, file_id, figure_root)
+    os.makedirs(path, exist_ok=True)
+    with _lock:
+        _document_dirs[file_id] = path
+    return path
+
+def write_manifest(kb_name, file_id, filename, refs, figure_root=FIGURE_ROOT):
+    """
+    record the figures of one document; written even without figures so
+    deletion never has to fall back to scanning the legacy flat directory
+    """
+    path = prepare_document_dir(kb_name, file_id, figure_root)
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"kb_name": kb_name, "file_id": file_id, "filename": filename, "figures": sorted(refs)},
+                  f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return manifest_path
+
+def read_manifest(kb_name, file_id, figure_root=FIGURE_ROOT):
+    manifest_path = os.path.join(document_dir(kb_name, file_id, figure_root), MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def find_document_dir(file_id, figure_root=FIGURE_ROOT):
+    # file_id 唯一，只需檢查各知識庫資料夾底下是否有此文件
+    with _lock:
+        cached = _document_dirs.get(file_id)
+    if cached is not None and os.path.isdir(cached):
+        return cached
+    if not os.path.isdir(figure_root):
+        return None
+    for entry in os.scandir(figure_root):
+        if entry.is_dir():
+            path = os.path.join(entry.path, file_id)
+            if os.path.isdir(path):
+                with _lock:
+                    _document_dirs[file_id] = path
+                return path
+    return None
+
+def resolve_figure(ref, figure_root=FIGURE_ROOT):
+    """
+    path of a figure ref in the sharded layout, falling back to the
+    legacy flat directory; anything but a figure image ref is not found
+
+    Returns:
+        (directory, path) or (None, None) if not found
+    """
+    if not is_figure_ref(ref):
+        return None, None
+    doc_dir = find_document_dir(ref_file_id(ref), figure_root)
+    if doc_dir is not None and os.path.isfile(os.path.join(doc_dir, ref)):
+        return doc_dir, os.path.join(doc_dir, ref)
+    legacy_path = os.path.join(figure_root, ref)
+    if os.path.isfile(legacy_path):
+        return figure_root, legacy_path
+    return None, None
+
+def copy_document_figures(refs, rename, kb_name, file_id, filename, figure_root=FIGURE_ROOT):
+    """
+    copy the figures of a deduplicated document under its new name
+
+    Args:
+        refs: figure refs of the source document
+        rename: callable mapping a source ref to the new ref
+    Returns:
+        list of copied new refs
+    """
+    target_dir = prepare_document_dir(kb_name, file_id, figure_root)
+    copied = []
+    for ref in sorted(set(refs)):
+        _source_dir, source_path = resolve_figure(ref, figure_root)
+        if source_path is None:
+            continue
+        new_ref = rename(ref)
+        shutil.copyfile(source_path, os.path.join(target_dir, new_ref))
+        copied.append(new_ref)
+    write_manifest(kb_name, file_id, filename, copied, figure_root)
+    return copied
+
+def remove_document_figures(kb_name, file_id, legacy_prefix=None, figure_root=FIGURE_ROOT):
+    """
+    delete every figure (and thumbnail) of a document
+
+    documents uploaded before sharding have no document directory; their
+    flat files are found by legacy_prefix ('<stem>_<file_id>')
+
+    Returns:
+        number of removed figures
+    """
+    path = document_dir(kb_name, file_id, figure_root) if kb_name else None
+    with _lock:
+        _document_dirs.pop(file_id, None)
+    if path is not None and os.path.isdir(path):
+        manifest = read_manifest(kb_name, file_id, figure_root)
+        shutil.rmtree(path)
+        kb_dir = os.path.dirname(path)
+        if not os.listdir(kb_dir):
+            os.rmdir(kb_dir)
+        return len(manifest["figures"]) if manifest else 0
+
+    if not legacy_prefix or not os.path.isdir(figure_root):
+        return 0
+    from .figure_export import remove_thumbnails
+
+    removed = 0
+    for filename in os.listdir(figure_root):
+        legacy_path = os.path.join(figure_root, filename)
+        if filename.startswith(legacy_prefix) and os.path.isfile(legacy_path):
+            os.remove(legacy_path)
+            removed += 1
+            print(f"已刪除圖片資料：{legacy_path}")
+    remove_thumbnails(figure_root, legacy_prefix)
+    return removed
+
+def remove_kb_figures(kb_name, figure_root=FIGURE_ROOT):
+    path = os.path.join(figure_root, kb_name)
+    if not os.path.isdir(path):
+        return False
+    with _lock:
+        for file_id in [fid for fid, doc_dir in _document_dirs.items() if os.path.dirname(doc_dir) == path]:
+            _document_dirs.pop(file_id)
+    shutil.rmtree(path)
+    return True
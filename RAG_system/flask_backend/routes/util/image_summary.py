@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from docling_core.types.doc.document import PictureItem
+
+from .metrics import record_cache_lookup
+
+IMAGE_SUMMARY_MODEL = os.getenv('IMAGE_SUMMARY_MODEL', 'gpt-4o')
+# 同時送出的圖片摘要請求數
+IMAGE_SUMMARY_WORKERS = int(os.getenv('IMAGE_SUMMARY_WORKERS', 4))
+IMAGE_SUMMARY_CACHE_FOLDER = os.getenv('IMAGE_SUMMARY_CACHE_FOLDER', './image_summary_cache')
+# 修改 summarize_image_openai 的提示詞時遞增，讓舊摘要失效
+IMAGE_SUMMARY_PROMPT_VERSION = 1
+# 記憶體中保留的摘要筆數 (LRU)，其餘從磁碟快取讀取
+IMAGE_SUMMARY_MEMORY_CACHE_SIZE = int(os.getenv('IMAGE_SUMMARY_MEMORY_CACHE_SIZE', 1024))
+
+_lock = threading.Lock()
+_memory_cache = OrderedDict()
+
+def summary_key(image_uri, model=IMAGE_SUMMARY_MODEL):
+    # 以圖片內容 + 模型 + 提示詞版本為鍵；不含檔名，重新上傳的文件也能共用
+    sha256 = hashlib.sha256()
+    sha256.update(image_uri.encode("utf-8"))
+    sha256.update(f"|{model}|{IMAGE_SUMMARY_PROMPT_VERSION}".encode("utf-8"))
+    return sha256.hexdigest()
+
+def _cache_path(key):
+    return os.path.join(IMAGE_SUMMARY_CACHE_FOLDER, f"{key}.json")
+
+def _remember(key, summary):
+    with _lock:
+        _memory_cache[key] = summary
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > IMAGE_SUMMARY_MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+def get_cached_summary(image_uri, model=IMAGE_SUMMARY_MODEL):
+    key = summary_key(image_uri, model)
+    with _lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            return _memory_cache[key]
+    path = _cache_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            summary = json.load(f)["summary"]
+    except Exception as e:
+        print(f"讀取圖片摘要快取失敗 {path}: {str(e)}")
+        return None
+    _remember(key, summary)
+    return summary
+
+def store_summary(image_uri, summary, model=IMAGE_SUMMARY_MODEL):
+    key = summary_key(image_uri, model)
+    _remember(key, summary)
+    os.makedirs(IMAGE_SUMMARY_CACHE_FOLDER, exist_ok=True)
+    path = _cache_path(key)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "model": model, "prompt_version": IMAGE_SUMMARY_PROMPT_VERSION},
+                  f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def summarize_image_cached(filename, image_uri, model=IMAGE_SUMMARY_MODEL):
+    """
+    summary of one picture, from the cache or summarize_image_openai
+
+    Returns:
+        image summary
+    """
+    from .docling_util import summarize_image_openai
+
+    summary = get_cached_summary(image_uri, model)
+    record_cache_lookup("image_summary", summary is not None)
+    if summary is None:
+        summary = summarize_image_openai(filename, image_uri, model=model)
+        store_summary(image_uri, summary, model)
+    return summary
+
+def summarize_pictures(docling_documents, workers=IMAGE_SUMMARY_WORKERS, model=IMAGE_SUMMARY_MODEL):
+    """
+    precompute summaries of every picture before chunking
+
+    missing summaries are requested concurrently, identical images only
+    once, so AnnotationPictureSerializer only reads the cache
+
+    Returns:
+        dict with pictures, cached and summarized counts
+    """
+    pending = {}
+    pictures = 0
+    for doc in docling_documents:
+        for element, _level in doc.iterate_items():
+            if not isinstance(element, PictureItem) or element.image is None:
+                continue
+            pictures += 1
+            image_uri = str(element.image.uri)
+            key = summary_key(image_uri, model)
+            if key not in pending and get_cached_summary(image_uri, model) is None:
+                pending[key] = (doc.origin.filename, image_uri)
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="image-summary") as executor:
+            futures = [executor.submit(summarize_image_cached, filename, image_uri, model)
+                       for filename, image_uri in pending.values()]
+            for future in futures:
+                future.result()
+
+    return {'pictures': pictures, 'cached': pictures - len(pending), 'summarized': len(pending)}
@@ -0,0 +1,558 @@
+import glob
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from docling_core.types.doc import PictureItem, TableItem
+
+from .docling_util import *
+from .converter_pool import converter_for, get_tokenizer, get_chunker
+from .page_parallel import convert_pdf_page_parallel
+from .conversion_cache import load_converted, save_converted, cached_ocr_option
+from .text_splitter import ChunkRecord, RecursiveTextSplitter, DataFrameFormatter
+from .qdrant_util import qdrant_DBConnector, DataObject, PointIdAssigner
+from .answer_cache import bump_kb_version
+from .image_summary import summarize_pictures
+from .figure_export import FigureExporter, figure_ref
+from .figure_storage import FIGURE_ROOT, prepare_document_dir, write_manifest, copy_document_figures
+from .table_store import stage_file_tables, commit_file_tables, discard_staged_tables, copy_file_tables, remove_file_tables
+from .stream_pipeline import background_iter, BatchUpserter
+from .metrics import INGEST_DOCUMENTS, record_ingest_stage, record_cache_lookup
+
+UPLOAD_FOLDER = './uploads'
+UPLOAD_FOLDER_IMAGE = FIGURE_ROOT
+
+# 嵌入進度每處理幾個 chunk 回報一次
+PROGRESS_EVERY = 10
+# 批次上傳時同時進行 docling 轉換的檔案數
+BATCH_CONVERSION_WORKERS = int(os.getenv('BATCH_CONVERSION_WORKERS', 2))
+# 分塊→嵌入→寫入各階段間的佇列長度與每次寫入 Qdrant 的 point 數
+CHUNK_QUEUE_SIZE = int(os.getenv('CHUNK_QUEUE_SIZE', 32))
+UPSERT_BATCH_SIZE = int(os.getenv('UPSERT_BATCH_SIZE', 64))
+# 保存 docling 轉換結果，重新分塊/嵌入時不必重新轉換
+CONVERSION_CACHE_ENABLED = os.getenv('CONVERSION_CACHE_ENABLED', 'true') == 'true'
+
+def _report(progress, stage, **fields):
+    if progress is not None:
+        progress(stage, **fields)
+
+def file_sha256(file_path, block_size=1 << 20):
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def _file_stem_and_id(file_path):
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return stem, stem.split('_')[-1]
+
+def _remove_file(file_path):
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+def copy_document(vector_db, source_meta, file_path, collection_name, new_kb_name, kb_id):
+    """
+    reuse conversion and embeddings of an identical document in another KB
+
+    vectors are copied with metadata pointing to the new file, and the
+    table / picture images are copied under the new file name
+
+    Args:
+        vector_db: qdrant_DBConnector of the collection
+        source_meta: metadata of one chunk of the existing document
+        file_path: newly saved PDF path in the target KB
+    Returns:
+        dict with file_id and chunks count
+    """
+    source_stem = os.path.splitext(source_meta["filename"])[0]
+    new_stem, new_file_id = _file_stem_and_id(file_path)
+    new_filename = os.path.basename(file_path)
+
+    def rename(ref):
+        return new_stem + ref[len(source_stem):] if ref.startswith(source_stem) else ref
+
+    points = vector_db.retrieved_from_file(source_meta["file_id"], with_vectors=True)
+    vectors, texts, metadatas = [], [], []
+    source_refs = set()
+    for point in points:
+        meta = dict(point.payload['metadata'])
+        meta["filename"] = new_filename
+        meta["file_id"] = new_file_id
+        meta["kb_name"] = new_kb_name
+        meta["kb_id"] = kb_id
+        for ref_key in ("table_ref", "image_ref"):
+            refs = meta.get(ref_key) or []
+            source_refs.update(refs)
+            meta[ref_key] = [rename(ref) for ref in refs]
+        vectors.append(point.vector)
+        texts.append(point.payload['text'])
+        metadatas.append(meta)
+
+    vector_db.upsert_vector(vectors, DataObject(texts, metadatas))
+    copy_document_figures(source_refs, rename, new_kb_name, new_file_id, new_filename)
+    copy_file_tables(source_meta["kb_name"], source_meta["file_id"], new_kb_name, new_file_id, new_filename, rename)
+    bump_kb_version(collection_name, new_kb_name)
+    return {'file_id': new_file_id, 'chunks': len(texts), 'copied_from': source_meta["file_id"]}
+
+def deduplicate_document(file_path, collection_name, new_kb_name, kb_id, file_hash=None):
+    """
+    short-circuit ingest of a document whose content already exists
+
+    Returns:
+        (result dict or None, file_hash); result is None when the document
+        has to be converted and embedded normally
+    """
+    file_hash = file_hash or file_sha256(file_path)
+    file_id = _file_stem_and_id(file_path)[1]
+    vector_db = qdrant_DBConnector(collection_name, recreate=False)
+
+    # 略過本文件自己的 point：重新排隊的工作可能已寫入一部分，
+    # 不能當成重複文件刪掉 PDF，而是重新處理 (確定性的 point id 會覆寫已寫入的部分)
+    # 同一知識庫已有相同文件：刪除剛存的副本，直接回傳既有文件
+    existing = vector_db.find_file_by_hash(file_hash, new_kb_name, exclude_file_id=file_id)
+    if existing is not None:
+        _remove_file(file_path)
+        return {'file_id': existing["file_id"], 'duplicate': True, 'filename': existing["filename"]}, file_hash
+
+    # 其他知識庫已有相同文件：複製向量與圖片，不必重新轉換與嵌入
+    existing = vector_db.find_file_by_hash(file_hash, exclude_file_id=file_id)
+    if existing is not None:
+        result = copy_document(vector_db, existing, file_path, collection_name, new_kb_name, kb_id)
+        return result, file_hash
+
+    return None, file_hash
+
+def convert_pdf(file_path, do_ocr=False, page_parallel=False, file_hash=None, use_cache=CONVERSION_CACHE_ENABLED):
+    """
+    convert one PDF with a pooled docling converter
+
+    Args:
+        page_parallel: convert long PDFs by page ranges in a process pool
+        file_hash: sha256 of the PDF, computed if not given
+        use_cache: reuse / save the conversion in the conversion cache
+    Returns:
+        list of DoclingDocument
+    """
+    if use_cache:
+        file_hash = file_hash or file_sha256(file_path)
+        cached_doc = load_converted(file_hash, do_ocr, file_path)
+        record_cache_lookup("conversion", cached_doc is not None)
+        if cached_doc is not None:
+            return [cached_doc]
+
+    # 轉換文檔
+    stage_start = time.perf_counter()
+    docling_documents = None
+    if page_parallel:
+        merged_doc = convert_pdf_page_parallel(file_path, do_ocr)
+        if merged_doc is not None:
+            docling_documents = [merged_doc]
+    if docling_documents is None:
+        with converter_for(do_ocr) as pypdfium_converter:
+            conv_results = pypdfium_converter.convert_all(
+                [file_path],
+                raises_on_error=True,  # to let conversion run through all and examine results at the end
+            )
+            docling_documents = [conv_res.document for conv_res in conv_results]
+    pages_total = sum(len(doc.pages) for doc in docling_documents)
+    record_ingest_stage("pages", pages_total, time.perf_counter() - stage_start)
+
+    if use_cache:
+        try:
+            save_converted(docling_documents[0], file_hash, do_ocr)
+        except Exception as e:
+            # 快取寫入失敗不影響本次處理
+            print(f"保存轉換快取失敗 {file_path}: {str(e)}")
+    return docling_documents
+
+def ingest_pdf(file_path, collection_name, new_kb_name, kb_id, do_ocr=False, do_image_summary=False, page_parallel=False, progress=None):
+    """
+    convert, chunk, embed and upsert one PDF into a knowledge base
+
+    Args:
+        file_path: saved PDF path under UPLOAD_FOLDER/<kb folder>
+        collection_name: qdrant collection name
+        new_kb_name: kb folder name ('<kb_name>_<kb_id>'), stored as metadata.kb_name
+        kb_id: kb id
+        do_ocr: convert with RapidOCR
+        do_image_summary: summarize pictures with openai while chunking
+        page_parallel: convert long PDFs by page ranges in a process pool
+        progress: optional callback progress(stage, **fields)
+    Returns:
+        dict with file_id, pages and chunks count
+    """
+    try:
+        _report(progress, "deduplicating")
+        result, file_hash = deduplicate_document(file_path, collection_name, new_kb_name, kb_id)
+        if result is not None:
+            return result
+        _report(progress, "converting")
+        docling_documents = convert_pdf(file_path, do_ocr, page_parallel, file_hash=file_hash)
+    except Exception:
+        INGEST_DOCUMENTS.inc(result="error")
+        raise
+    return index_converted(docling_documents, file_path, collection_name, new_kb_name, kb_id,
+                           do_image_summary=do_image_summary, file_hash=file_hash, progress=progress)
+
+def _chunk_metadata(meta_dict, new_kb_name, kb_id, file_hash):
+    basename, _ = os.path.splitext(meta_dict["filename"])
+    meta_dict["file_id"] = basename.split('_')[-1]
+    meta_dict["kb_name"] = new_kb_name
+    meta_dict["kb_id"] = kb_id
+    meta_dict["file_hash"] = file_hash
+    return meta_dict
+
+def iter_chunks(docling_documents, hybrid_chunker, tokenizer, new_kb_name, kb_id, file_hash, timing=None):
+    """
+    lazily yield a ChunkRecord for every chunk to embed
+
+    each docling chunk is contextualized and tokenized once; order follows
+    the original pipeline: docling chunks, then the splits of chunks longer
+    than 1024 tokens, then table row chunks
+
+    Args:
+        timing: optional dict, timing["seconds"] accumulates chunking time
+    """
+    def timed(iterator):
+        while True:
+            stage_start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                if timing is not None:
+                    timing["seconds"] = timing.get("seconds", 0.0) + time.perf_counter() - stage_start
+            yield item
+
+    def generate():
+        splitter = RecursiveTextSplitter(tokenizer=tokenizer, max_tokens=1024, overlap=150, min_length_ratio=1)
+
+        # 分塊，超過 1024 tokens 的大塊文本另外保留待切分
+        big_chunk = []
+        for docling_docs in docling_documents:
+            for chunk in hybrid_chunker.chunk(dl_doc=docling_docs):
+                meta_dict = _chunk_metadata(extract_meta_from_docling(chunk.meta), new_kb_name, kb_id, file_hash)
+                record = ChunkRecord(hybrid_chunker.contextualize(chunk=chunk), meta_dict, tokenizer)
+                if record.token_count > splitter.max_tokens:
+                    big_chunk.append(record)
+                else:
+                    record.release_tokens()
+                yield record
+
+        # 處理大塊文本
+        for record in big_chunk:
+            for sub_record in splitter.split_record(record):
+                sub_record.release_tokens()
+                yield sub_record
+            record.release_tokens()
+
+        # 提取表格，先暫存；向量寫入成功後 index_converted 才換上知識庫的表格索引
+        all_tables = extract_tables(docling_documents)
+        for docling_docs in docling_documents:
+            file_id = _file_stem_and_id(docling_docs.origin.filename)[1]
+            stage_file_tables(new_kb_name, file_id,
+                              [table for table in all_tables if table[1]["filename"] == docling_docs.origin.filename])
+        table_formatter = DataFrameFormatter(tokenizer=tokenizer, show_index=False, max_tokens=1024)
+        for table_df, table_meta in all_tables:
+            for text in table_formatter.chunk_rows(table_df):
+                yield ChunkRecord(text, _chunk_metadata(dict(table_meta), new_kb_name, kb_id, file_hash))
+
+    return timed(generate())
+
+def index_converted(docling_documents, file_path, collection_name, new_kb_name, kb_id, do_image_summary=False, file_hash=None, progress=None, existing_ids=None, written_ids=None):
+    """
+    export figures, chunk, embed and upsert already converted documents
+
+    chunking, embedding and upserting run as a streaming pipeline: chunks
+    are produced in a background thread through a bounded queue, embedded
+    one by one and upserted in batches by another thread, so memory stays
+    flat and points become searchable while the document is processed
+
+    Args:
+        docling_documents: convert_pdf() output
+        file_hash: sha256 of the PDF, stored as metadata.file_hash
+        existing_ids: point ids already in the collection (re-index); chunks
+            whose deterministic id is among them are not embedded again,
+            only their payload is overwritten
+        written_ids: optional set, filled with the ids of every point of the document
+        other args: see ingest_pdf()
+    Returns:
+        dict with file_id, pages, chunks and reused chunks count
+    """
+    vector_db = qdrant_DBConnector(collection_name, recreate=False)
+    file_hash = file_hash or file_sha256(file_path)
+
+    upserter = None
+    figure_refs = {}  # file_id -> (filename, refs)
+    try:
+        pages_total = sum(len(doc.pages) for doc in docling_documents)
+        _report(progress, "exporting_figures", pages_total=pages_total, pages_done=pages_total)
+
+        # 提取表格或圖片截圖
+        # Save images of figures and tables for later summary reference
+        # 編碼與寫檔在背景執行緒進行，不阻塞分塊與嵌入
+        # 依知識庫與文件分層存放：figure_storage/<kb_name>/<file_id>/
+        figure_exporter = FigureExporter()
+        for docling_docs in docling_documents:
+            doc_filename = Path(docling_docs.origin.filename).stem
+            doc_file_id = _file_stem_and_id(docling_docs.origin.filename)[1]
+            figure_dir = prepare_document_dir(new_kb_name, doc_file_id)
+            doc_refs = figure_refs.setdefault(doc_file_id, (docling_docs.origin.filename, []))[1]
+            table_counter = 0
+            picture_counter = 0
+
+            for element, _level in docling_docs.iterate_items():
+                if isinstance(element, TableItem):
+                    table_counter += 1
+                    table_name = figure_ref(doc_filename, "table", table_counter)
+                    figure_exporter.submit(element, docling_docs, os.path.join(figure_dir, table_name))
+                    doc_refs.append(table_name)
+
+                if isinstance(element, PictureItem):
+                    picture_counter += 1
+                    picture_name = figure_ref(doc_filename, "picture", picture_counter)
+                    figure_exporter.submit(element, docling_docs, os.path.join(figure_dir, picture_name))
+                    doc_refs.append(picture_name)
+
+        # 平行產生圖片摘要，分塊時由 serializer 讀取快取
+        if do_image_summary:
+            _report(progress, "summarizing_images")
+            stage_start = time.perf_counter()
+            summary_stats = summarize_pictures(docling_documents)
+            record_ingest_stage("image_summaries", summary_stats["summarized"], time.perf_counter() - stage_start)
+            _report(progress, "summarizing_images", **summary_stats)
+
+        # 創建分塊器
+        _report(progress, "embedding", chunks_embedded=0, chunks_upserted=0)
+        tokenizer = get_tokenizer()
+        hybrid_chunker = get_chunker(do_image_summary)
+
+        # 分塊 (背景執行緒) → 生成嵌入向量 → 批次存儲到Qdrant (背景執行緒)
+        chunk_timing = {}
+        chunks = background_iter(
+            iter_chunks(docling_documents, hybrid_chunker, tokenizer, new_kb_name, kb_id, file_hash, chunk_timing),
+            maxsize=CHUNK_QUEUE_SIZE, name="ingest-chunking"
+        )
+        upserter = BatchUpserter(
+            vector_db, batch_size=UPSERT_BATCH_SIZE,
+            on_upserted=lambda upserted: _report(progress, "embedding", chunks_upserted=upserted)
+        )
+        embed_seconds = 0.0
+        chunks_embedded = 0
+        chunks_reused = 0
+        assign_id = PointIdAssigner()
+        try:
+            for record in chunks:
+                point_id = assign_id(record.text, record.metadata)
+                if existing_ids is not None and point_id in existing_ids:
+                    # 內容未變的 chunk 不重新嵌入
+                    upserter.add(None, record.text, record.metadata, point_id)
+                    chunks_reused += 1
+                    continue
+                stage_start = time.perf_counter()
+                vector = get_embeddings(record.text)
+                embed_seconds += time.perf_counter() - stage_start
+                upserter.add(vector, record.text, record.metadata, point_id)
+                chunks_embedded += 1
+                if chunks_embedded % PROGRESS_EVERY == 0:
+                    _report(progress, "embedding", chunks_embedded=chunks_embedded)
+        finally:
+            # 停止分塊執行緒
+            chunks.close()
+
+        _report(progress, "upserting", chunks_embedded=chunks_embedded)
+        upserter.close()
+        # 向量全部寫入後才換上新的表格，表格列與向量保持一致
+        for doc_file_id in figure_refs:
+            commit_file_tables(new_kb_name, doc_file_id)
+        stage_start = time.perf_counter()
+        figure_stats = figure_exporter.wait()
+        for doc_file_id, (doc_name, doc_refs) in figure_refs.items():
+            write_manifest(new_kb_name, doc_file_id, doc_name, doc_refs)
+        record_ingest_stage("figures", figure_stats["exported"] + figure_stats["copied"], time.perf_counter() - stage_start)
+        record_ingest_stage("chunks", chunks_embedded, chunk_timing.get("seconds", 0.0))
+        record_ingest_stage("embeddings", chunks_embedded, embed_seconds)
+        record_ingest_stage("upserts", len(upserter.point_ids), upserter.seconds)
+        bump_kb_version(collection_name, new_kb_name)
+        INGEST_DOCUMENTS.inc(result="success")
+        if written_ids is not None:
+            written_ids.update(upserter.point_ids)
+            written_ids.update(upserter.reused_ids)
+
+        file_id = os.path.splitext(os.path.basename(file_path))[0].split('_')[-1]
+        return {
+            'file_id': file_id,
+            'pages': pages_total,
+            'chunks': chunks_embedded + chunks_reused,
+            'reused': chunks_reused,
+            'figures': figure_stats
+        }
+
+    except Exception:
+        INGEST_DOCUMENTS.inc(result="error")
+        for doc_file_id in set(figure_refs) | {_file_stem_and_id(file_path)[1]}:
+            discard_staged_tables(new_kb_name, doc_file_id)
+            if existing_ids is None:
+                # 新文件處理失敗才移除表格；重新索引失敗時保留原本的表格
+                remove_file_tables(new_kb_name, doc_file_id)
+        if upserter is not None:
+            # 移除已寫入的部分 point，避免留下不完整的文件
+            upserter.abort()
+            try:
+                vector_db.delete_points(upserter.point_ids)
+                bump_kb_version(collection_name, new_kb_name)
+            except Exception as e:
+                print(f"清除未完成文件的向量失敗: {str(e)}")
+        raise
+
+def ingest_pdf_batch(file_paths, collection_name, new_kb_name, kb_id, do_ocr=False, do_image_summary=False,
+                     conversion_workers=BATCH_CONVERSION_WORKERS, page_parallel=False, progress=None):
+    """
+    ingest many PDFs into one knowledge base with pipelined conversion
+
+    docling conversion of the next files runs in a thread pool while the
+    current file is chunked, embedded and upserted; at most
+    conversion_workers + 1 converted documents are held in memory
+
+    Args:
+        file_paths: saved PDF paths
+        conversion_workers: number of concurrent docling conversions
+        other args: see ingest_pdf()
+    Returns:
+        dict with per file results and failures
+    """
+    results = []
+    failures = []
+    files_total = len(file_paths)
+    _report(progress, "deduplicating", files_total=files_total, files_done=0, failures=0)
+
+    # 先排除內容重複的文件 (包含同一批次內重複的檔案)
+    file_hashes = {}
+    seen_in_batch = {}
+    to_convert = []
+    for file_path in file_paths:
+        filename = os.path.basename(file_path)
+        try:
+            file_hash = file_sha256(file_path)
+            if file_hash in seen_in_batch:
+                _remove_file(file_path)
+                results.append({'filename': filename, 'file_id': seen_in_batch[file_hash], 'duplicate': True})
+                continue
+            seen_in_batch[file_hash] = _file_stem_and_id(file_path)[1]
+            result, _ = deduplicate_document(file_path, collection_name, new_kb_name, kb_id, file_hash)
+        except Exception as e:
+            failures.append({'filename': filename, 'error': str(e)})
+            continue
+        if result is not None:
+            result['filename'] = filename
+            results.append(result)
+        else:
+            file_hashes[file_path] = file_hash
+            to_convert.append(file_path)
+
+    file_paths = to_convert
+    _report(progress, "converting", files_total=files_total, files_done=len(results) + len(failures),
+            failures=len(failures))
+
+    def file_progress(stage, **fields):
+        # 單一檔案的進度加上批次層級資訊
+        _report(progress, stage, files_total=files_total, files_done=len(results) + len(failures),
+                failures=len(failures), **fields)
+
+    with ThreadPoolExecutor(max_workers=max(1, conversion_workers), thread_name_prefix="batch-convert") as executor:
+        pending = {}
+        next_to_submit = 0
+
+        def fill_window():
+            nonlocal next_to_submit
+            while next_to_submit < len(file_paths) and len(pending) <= conversion_workers:
+                path = file_paths[next_to_submit]
+                pending[next_to_submit] = executor.submit(convert_pdf, path, do_ocr, page_parallel, file_hashes[path])
+                next_to_submit += 1
+
+        fill_window()
+        for index, file_path in enumerate(file_paths):
+            future = pending.pop(index)
+            filename = os.path.basename(file_path)
+            try:
+                docling_documents = future.result()
+            except Exception as e:
+                INGEST_DOCUMENTS.inc(result="error")
+                failures.append({'filename': filename, 'error': f'轉換失敗: {str(e)}'})
+                fill_window()
+                continue
+
+            # 下一批檔案的轉換與目前檔案的嵌入/寫入同時進行
+            fill_window()
+            try:
+                result = index_converted(docling_documents, file_path, collection_name, new_kb_name, kb_id,
+                                         do_image_summary=do_image_summary, file_hash=file_hashes[file_path],
+                                         progress=file_progress)
+                result['filename'] = filename
+                results.append(result)
+            except Exception as e:
+                failures.append({'filename': filename, 'error': str(e)})
+            finally:
+                del docling_documents
+            file_progress("indexing", current_file=filename)
+
+    return {
+        'files_total': files_total,
+        'files_succeeded': len(results),
+        'files': results,
+        'failures': failures
+    }
+
+def find_uploaded_file(kb_name, file_id):
+    matches = glob.glob(os.path.join(UPLOAD_FOLDER, glob.escape(kb_name), f"*_{glob.escape(file_id)}.pdf"))
+    return matches[0] if matches else None
+
+def reindex_document(collection_name, kb_name, file_id, do_ocr=None, do_image_summary=False, progress=None):
+    """
+    re-chunk, re-embed and re-upsert an uploaded document
+
+    the docling conversion is taken from the conversion cache when present,
+    so changing chunking parameters does not redo OCR / TableFormer; point
+    ids are deterministic, so unchanged chunks keep their point and vector
+    and only the old points no longer produced are deleted, once the new
+    ones are written
+
+    Args:
+        kb_name: kb folder name ('<kb_name>_<kb_id>')
+        file_id: id of the uploaded file
+        do_ocr: None to use whichever cached conversion exists
+    Returns:
+        dict with file_id, pages, chunks, reused chunks and removed stale points count
+    """
+    file_path = find_uploaded_file(kb_name, file_id)
+    if file_path is None:
+        raise FileNotFoundError(f"找不到文件 {file_id} (知識庫 {kb_name})")
+    kb_id = kb_name.split('_')[-1]
+    vector_db = qdrant_DBConnector(collection_name, recreate=False)
+    old_point_ids = set(vector_db.file_point_ids(file_id))
+
+    file_hash = file_sha256(file_path)
+    if do_ocr is None:
+        do_ocr = bool(cached_ocr_option(file_hash))
+    _report(progress, "converting")
+    try:
+        docling_documents = convert_pdf(file_path, do_ocr, file_hash=file_hash, use_cache=True)
+    except Exception:
+        INGEST_DOCUMENTS.inc(result="error")
+        raise
+    written_ids = set()
+    result = index_converted(docling_documents, file_path, collection_name, kb_name, kb_id,
+                             do_image_summary=do_image_summary, file_hash=file_hash, progress=progress,
+                             existing_ids=old_point_ids, written_ids=written_ids)
+
+    # 新的 point 寫入後才刪除不再產生的舊 point，處理失敗時保留原索引
+    stale_ids = old_point_ids - written_ids
+    _report(progress, "removing_old_points", points_total=len(stale_ids))
+    vector_db.delete_points(sorted(stale_ids))
+    bump_kb_version(collection_name, kb_name)
+    result['replaced'] = len(stale_ids)
+    return result
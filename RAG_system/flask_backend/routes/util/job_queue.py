@@ -0,0 +1,246 @@
+import json
+import os
+import sqlite3
+import threading
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from .metrics import QUEUE_DEPTH
+
+JOB_DB_PATH = os.getenv('INGEST_JOB_DB', './job_data/jobs.db')
+# 同時處理的文件數上限，避免文件處理佔滿資源拖慢聊天
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 1))
+
+
+class JobStore:
+    def __init__(self, db_path=JOB_DB_PATH):
+        """
+        SQLite backed job persistence, one connection per call (closed
+        afterwards) so workers and request threads can share it
+        """
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    progress TEXT NOT NULL DEFAULT '{}',
+                    result TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        # sqlite3 連線本身的 with 只負責 commit / rollback，不會關閉連線
+        conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _now():
+        return datetime.now().isoformat()
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        return {
+            'job_id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'params': json.loads(row['params']),
+            'progress': json.loads(row['progress']),
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+
+    def create(self, kind, params):
+        job_id = str(uuid.uuid4())
+        now = self._now()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(params, ensure_ascii=False), now, now)
+            )
+        return job_id
+
+    def claim_next(self):
+        # 取出最早的排隊工作並標記為 running
+        with self._connection() as conn:
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                        (self._now(), row['id'])
+                    )
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        if row is None:
+            return None
+        job = self._to_dict(row)
+        job['status'] = 'running'
+        return job
+
+    def update_progress(self, job_id, **fields):
+        with self._connection() as conn:
+            row = conn.execute("SELECT progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            progress = json.loads(row['progress'])
+            progress.update(fields)
+            conn.execute(
+                "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(progress, ensure_ascii=False), self._now(), job_id)
+            )
+
+    def finish(self, job_id, result=None, error=None):
+        status = 'failed' if error else 'completed'
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error, self._now(), job_id)
+            )
+
+    def requeue_interrupted(self):
+        # 服務重啟時，將未完成的 running 工作重新排隊
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+                (self._now(),)
+            )
+            return cursor.rowcount
+
+    def get(self, job_id):
+        with self._connection() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def list(self, limit=50, status=None):
+        with self._connection() as conn:
+            if status:
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+                ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def count(self, status):
+        with self._connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+
+class JobQueue:
+    def __init__(self, store, workers=INGEST_WORKERS, name='ingest'):
+        """
+        background worker pool consuming jobs from a JobStore
+
+        Args:
+            store: JobStore
+            workers: number of worker threads (max concurrent jobs)
+            name: queue name used for metrics
+        """
+        self.store = store
+        self.workers = workers
+        self.name = name
+        self._handlers = {}
+        self._threads = []
+        self._wakeup = threading.Condition()
+        self._started = False
+
+    def register_handler(self, kind, handler):
+        """
+        handler(params, progress) -> result dict
+        progress(stage, **fields) updates the job progress
+        """
+        self._handlers[kind] = handler
+
+    def enqueue(self, kind, params):
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        job_id = self.store.create(kind, params)
+        self._update_depth()
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        requeued = self.store.requeue_interrupted()
+        if requeued:
+            print(f"重新排隊 {requeued} 個未完成的工作")
+        self._update_depth()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"{self.name}-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _update_depth(self):
+        QUEUE_DEPTH.set(self.store.count('queued'), queue=self.name)
+        QUEUE_DEPTH.set(self.store.count('running'), queue=f"{self.name}_in_progress")
+
+    def _worker_loop(self):
+        while True:
+            job = self.store.claim_next()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=5)
+                continue
+            self._update_depth()
+            self._run(job)
+            self._update_depth()
+
+    def _run(self, job):
+        job_id = job['job_id']
+
+        def progress(stage, **fields):
+            self.store.update_progress(job_id, stage=stage, **fields)
+
+        handler = self._handlers.get(job['kind'])
+        if handler is None:
+            self.store.finish(job_id, error=f"No handler registered for job kind '{job['kind']}'")
+            return
+        try:
+            result = handler(job['params'], progress)
+            progress('completed')
+            self.store.finish(job_id, result=result)
+        except Exception as e:
+            traceback.print_exc()
+            progress('failed')
+            self.store.finish(job_id, error=str(e))
+
+
+ingest_queue = JobQueue(JobStore())
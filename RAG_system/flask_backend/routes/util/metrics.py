@@ -0,0 +1,225 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# 預設延遲分桶 (秒)，涵蓋一般 API 到長時間的文件處理
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, name, documentation, label_names=()):
+        super().__init__(name, documentation, label_names)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name, documentation, label_names=()):
+        super().__init__(name, documentation, label_names)
+        self._values = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        key = self._key(labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # key -> {"buckets", "sum", "count"}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = [(key, {"buckets": list(state["buckets"]), "sum": state["sum"], "count": state["count"]})
+                     for key, state in self._values.items()]
+        for key, state in items:
+            for bound, count in zip(self.buckets, state["buckets"]):
+                labels = _format_labels(self.label_names, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.label_names, key, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{labels} {state['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """
+        collector: callable returning a list of exposition lines,
+                   evaluated each time /metrics is scraped
+        """
+        self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# HTTP 請求
+HTTP_REQUESTS = registry.register(Counter(
+    "rag_http_requests_total", "HTTP requests handled, by blueprint, method and status",
+    ("blueprint", "method", "status")))
+HTTP_LATENCY = registry.register(Histogram(
+    "rag_http_request_duration_seconds", "HTTP request latency by blueprint",
+    ("blueprint",)))
+
+# 文件處理吞吐量
+INGEST_ITEMS = registry.register(Counter(
+    "rag_ingest_items_total", "Items processed by ingest, by stage (pages, chunks, embeddings, upserts)",
+    ("stage",)))
+INGEST_SECONDS = registry.register(Counter(
+    "rag_ingest_stage_seconds_total", "Seconds spent per ingest stage",
+    ("stage",)))
+INGEST_THROUGHPUT = registry.register(Gauge(
+    "rag_ingest_last_throughput", "Items per second of the most recent ingest, by stage",
+    ("stage",)))
+INGEST_DOCUMENTS = registry.register(Counter(
+    "rag_ingest_documents_total", "Documents ingested, by result",
+    ("result",)))
+
+# 佇列與模型
+QUEUE_DEPTH = registry.register(Gauge(
+    "rag_queue_depth", "Number of pending items per queue",
+    ("queue",)))
+MODEL_LOAD_SECONDS = registry.register(Gauge(
+    "rag_model_load_seconds", "Seconds taken by the most recent load of a model",
+    ("model",)))
+
+# 快取
+CACHE_REQUESTS = registry.register(Counter(
+    "rag_cache_requests_total", "Cache lookups, by cache and result (hit or miss)",
+    ("cache", "result")))
+
+def record_ingest_stage(stage, items, seconds):
+    """
+    record one ingest stage run, e.g. record_ingest_stage("embeddings", 120, 8.4)
+    """
+    INGEST_ITEMS.inc(items, stage=stage)
+    INGEST_SECONDS.inc(seconds, stage=stage)
+    if seconds > 0:
+        INGEST_THROUGHPUT.set(items / seconds, stage=stage)
+
+def record_cache_lookup(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+@contextmanager
+def time_model_load(model):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        MODEL_LOAD_SECONDS.set(time.perf_counter() - start, model=model)
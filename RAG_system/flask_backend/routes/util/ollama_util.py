@@ -1,7 +1,9 @@
 import ollama
-from routes.BM25 import bm25_search
+from routes.BM25 import bm25_search, create_bm25
 from sentence_transformers import CrossEncoder
 import os
+from .tracing import span
+from .metrics import time_model_load
 
 def get_ollama_client():
     # 檢查是否在 Docker 環境中運行
@@ -20,7 +22,8 @@ def get_ollama_client():
 
 def get_embeddings(texts, model='bge-m3:latest'):
     client = get_ollama_client()
-    embed_response = client.embeddings(model=model, prompt=texts)
+    with span("embedding"):
+        embed_response = client.embeddings(model=model, prompt=texts)
     embedded_vector = embed_response["embedding"]
     return embedded_vector
 
@@ -49,7 +52,8 @@ def bm25_retrieval(vector_db_name, query, top_k=3):
 
 def bm25_retrieval_with_kb_name(vector_db_name, kb_name, query, top_k=3):
     #result = vector_db_name.retrieved_all()
-    result = vector_db_name.retrieved_from_kb(kb_name)
+    with span("corpus_scroll"):
+        result = vector_db_name.retrieved_from_kb(kb_name)
     retrieved_text = []
     retrieved_meta =[]
     retrieved_pointID = []
@@ -58,15 +62,18 @@ def bm25_retrieval_with_kb_name(vector_db_name, kb_name, query, top_k=3):
         retrieved_meta.append(point.payload['metadata'])
         retrieved_pointID.append(point.id)
 
-    bm25_result = bm25_search(corpus=retrieved_text, query=query, top_k=top_k)
+    with span("bm25_build"):
+        bm25 = create_bm25(retrieved_text)
+    with span("bm25_search"):
+        bm25_result = bm25.search(query, top_k)
     bm25_result_json = {
-        f"chunk_{retrieved_pointID[item[0]]}": {
-            "text": item[2],
-            "metadata": retrieved_meta[item[0]],
+        f"chunk_{retrieved_pointID[doc_id]}": {
+            "text": retrieved_text[doc_id],
+            "metadata": retrieved_meta[doc_id],
             "rank": index,
-            "score": item[1]
+            "score": score
         }
-        for index, item in enumerate(bm25_result)
+        for index, (doc_id, score) in enumerate(bm25_result)
     }
 
     return bm25_result_json
@@ -86,41 +93,175 @@ def rrf(ranks, k=1):
 def get_completion(prompt, model):
     client = get_ollama_client()
     messages = [{"role": "user", "content": prompt}]
-    response = client.chat(
-        model=model,
-        messages=messages
-        #stream=True,
-        #format="json",
-        #options={"temperature":0}
-    )
+    with span("llm_generation"):
+        response = client.chat(
+            model=model,
+            messages=messages
+            #stream=True,
+            #format="json",
+            #options={"temperature":0}
+        )
     return response.message.content
 
+def get_completion_stream(prompt, model):
+    # 以 stream=True 呼叫，逐段回傳模型輸出
+    client = get_ollama_client()
+    messages = [{"role": "user", "content": prompt}]
+    with span("llm_generation"):
+        with span("llm_first_token"):
+            stream = client.chat(
+                model=model,
+                messages=messages,
+                stream=True
+            )
+            stream = iter(stream)
+            first_part = next(stream, None)
+        if first_part is not None and first_part.message.content:
+            yield first_part.message.content
+        for part in stream:
+            content = part.message.content
+            if content:
+                yield content
+
 def hybrid_retriever(vector_db, query, top_k=3):
     embedded_query = get_embeddings(query)
     result = rrf([vector_db.vector_search_json(embedded_query, top_k), bm25_retrieval(vector_db, query, top_k=top_k)])
     return result
 
-def hybrid_retriever_with_kbname(vector_db, kb_name, query, top_k=3):
-    embedded_query = get_embeddings(query)
-    result = rrf([vector_db.vector_search_json_with_kb_name(kb_name, embedded_query, top_k), bm25_retrieval_with_kb_name(vector_db, kb_name, query, top_k=top_k)])
+def hybrid_retriever_with_kbname(vector_db, kb_name, query, top_k=3, embedded_query=None):
+    if embedded_query is None:
+        embedded_query = get_embeddings(query)
+    # 有 bm25 稀疏向量的集合：向量與詞彙檢索及 RRF 都在 Qdrant 一次完成
+    if getattr(vector_db, "sparse_enabled", False):
+        with span("qdrant_hybrid_search"):
+            return vector_db.hybrid_search_json_with_kb_name(kb_name, embedded_query, query, top_k)
+    # 舊集合：取出整個知識庫的文字以 Python BM25 計算
+    with span("qdrant_search"):
+        vector_result = vector_db.vector_search_json_with_kb_name(kb_name, embedded_query, top_k)
+    bm25_result = bm25_retrieval_with_kb_name(vector_db, kb_name, query, top_k=top_k)
+    with span("rrf"):
+        result = rrf([vector_result, bm25_result])
     return result
 
-def reranker(query, retrieved_result, rerank_model=CrossEncoder('BAAI/bge-reranker-v2-m3', max_length=1024), threshold=0):
+with time_model_load('BAAI/bge-reranker-v2-m3'):
+    RERANK_MODEL = CrossEncoder('BAAI/bge-reranker-v2-m3', max_length=1024)
+
+def reranker_scores(query, text_chunks, rerank_model=RERANK_MODEL):
+    if not text_chunks:
+        return []
+    with span("rerank"):
+        return rerank_model.predict([(query, doc) for doc in text_chunks])
+
+def reranker(query, retrieved_result, rerank_model=RERANK_MODEL, threshold=0):
     text_chunks = []
     meta_chunks = []
     for chunk_id, val in retrieved_result.items():
         text_chunks.append(val['text'])
         meta_chunks.append(val['metadata'])
-    scores = rerank_model.predict([(query, doc) for doc in text_chunks])
-    sorted_list = sorted(zip(scores, text_chunks, meta_chunks), key=lambda x: x[0], reverse=True)
+    scores = reranker_scores(query, text_chunks, rerank_model)
+    reranked_result = _select_reranked(zip(scores, text_chunks, meta_chunks), threshold)
+
+    return reranked_result
+    #return [chunk for chunk in sorted_list if chunk[0] > threshold]
+
+def _select_reranked(scored_list, threshold=0):
+    # 依分數排序後保留門檻以上的 chunk，數量限制在 3 到 5 之間
+    sorted_list = sorted(scored_list, key=lambda x: x[0], reverse=True)
     reranked_result = [chunk for chunk in sorted_list if chunk[0] > threshold]
     if len(reranked_result) < 3:
         reranked_result = sorted_list[:3]
     elif len(reranked_result) > 5:
         reranked_result = reranked_result[:5]
-
     return reranked_result
-    #return [chunk for chunk in sorted_list if chunk[0] > threshold]
+
+_light_rerank_models = {}
+
+def get_light_rerank_model(model_name=None):
+    # 第一階段用的小型 reranker，第一次使用時才載入並快取
+    model_name = model_name or os.getenv('CASCADE_LIGHT_RERANKER', 'BAAI/bge-reranker-base')
+    if model_name not in _light_rerank_models:
+        with time_model_load(model_name):
+            _light_rerank_models[model_name] = CrossEncoder(model_name, max_length=512)
+    return _light_rerank_models[model_name]
+
+def cascade_prune(query, retrieved_result, first_stage="rrf", keep=8, light_model=None):
+    """
+    cascade reranking first stage, prune RRF candidates cheaply
+
+    Args:
+        query: user query
+        retrieved_result: rrf() output dict
+        first_stage: 'rrf' keeps candidates by RRF score (no model cost),
+                     'light' scores them with a small cross-encoder
+        keep: number of candidates survive to the full reranker
+        light_model: optional CrossEncoder for 'light' stage
+    Returns:
+        dict with the same format as rrf() output, only survivors kept
+    Raises:
+        ValueError: unsupported first_stage or keep < 1
+    """
+    # 先檢查參數，候選數少於 keep 時也不接受不合法的設定
+    if first_stage not in ("rrf", "light"):
+        raise ValueError("Unsupported first_stage. Please choose 'rrf' or 'light'.")
+    if keep < 1:
+        raise ValueError("keep must be at least 1")
+    if keep >= len(retrieved_result):
+        return retrieved_result
+
+    if first_stage == "rrf":
+        # rrf() 輸出已依分數排序
+        survivors = list(retrieved_result.items())[:keep]
+    else:
+        light_model = light_model or get_light_rerank_model()
+        items = list(retrieved_result.items())
+        with span("rerank_first_stage"):
+            scores = light_model.predict([(query, val['text']) for _, val in items])
+        ranked = sorted(zip(scores, items), key=lambda x: x[0], reverse=True)
+        survivors = [item for _, item in ranked[:keep]]
+
+    return dict(survivors)
+
+def cascade_reranker(query, retrieved_result, first_stage="rrf", keep=8, rerank_model=RERANK_MODEL, threshold=0):
+    # 先以低成本方式剪枝，再只對存活的候選使用完整 cross-encoder
+    survivors = cascade_prune(query, retrieved_result, first_stage=first_stage, keep=keep)
+    return reranker(query, survivors, rerank_model=rerank_model, threshold=threshold)
+
+def cascade_recall_at_k(vector_db, kb_name, queries, top_k=20, k=5, first_stage="rrf", keep=8):
+    """
+    compare cascade reranking against the single-stage reranker
+
+    recall@k here is the fraction of the single-stage top-k chunks
+    that cascade reranking also returns in its top-k
+
+    Args:
+        vector_db: qdrant_DBConnector
+        kb_name: knowledge base name
+        queries: list of query strings
+        top_k: number of candidates retrieved by hybrid retriever
+        k: compared result size
+        first_stage, keep: cascade settings
+    Returns:
+        dict with per query recall and mean recall
+    """
+    per_query = []
+    for query in queries:
+        candidates = hybrid_retriever_with_kbname(vector_db, kb_name, query, top_k)
+        texts = [val['text'] for val in candidates.values()]
+        full_scores = reranker_scores(query, texts)
+        full_top = [text for _, text in sorted(zip(full_scores, texts), key=lambda x: x[0], reverse=True)[:k]]
+
+        survivors = cascade_prune(query, candidates, first_stage=first_stage, keep=keep)
+        survivor_texts = [val['text'] for val in survivors.values()]
+        cascade_scores = reranker_scores(query, survivor_texts)
+        cascade_top = [text for _, text in sorted(zip(cascade_scores, survivor_texts), key=lambda x: x[0], reverse=True)[:k]]
+
+        recall = len(set(full_top) & set(cascade_top)) / len(full_top) if full_top else 1.0
+        per_query.append({"query": query, "recall": recall,
+                          "candidates": len(texts), "scored": len(survivor_texts)})
+
+    mean_recall = sum(q["recall"] for q in per_query) / len(per_query) if per_query else 0
+    return {"recall_at_k": mean_recall, "k": k, "first_stage": first_stage,
+            "keep": keep, "queries": per_query}
 
 def format_rag_output(reranked_list):
     formatted_docs = "\n\n".join([f"Document {i+1}，{chunk[2].get('filename')}:\n{chunk[1]}" for i, chunk in enumerate(reranked_list)])
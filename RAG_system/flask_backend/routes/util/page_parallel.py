@@ -0,0 +1,111 @@
+import atexit
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import pypdfium2
+from docling_core.types.doc.document import DoclingDocument
+
+from .page_worker import convert_range
+
+# 頁面平行轉換設定
+PAGE_PARALLEL_WORKERS = int(os.getenv('PAGE_PARALLEL_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+PAGE_PARALLEL_PAGES_PER_RANGE = int(os.getenv('PAGE_PARALLEL_PAGES_PER_RANGE', 20))
+# 頁數少於此值時直接整份轉換，分段的額外成本不划算
+PAGE_PARALLEL_MIN_PAGES = int(os.getenv('PAGE_PARALLEL_MIN_PAGES', 40))
+
+# DoclingDocument 內可被 "#/<key>/<index>" 參照的清單
+_REF_KEYS = ("texts", "tables", "pictures", "groups", "key_value_items", "form_items")
+_REF_PATTERN = re.compile(r"^#/(" + "|".join(_REF_KEYS) + r")/(\d+)$")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def pdf_page_count(file_path):
+    pdf = pypdfium2.PdfDocument(file_path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+def page_ranges(page_count, pages_per_range=PAGE_PARALLEL_PAGES_PER_RANGE):
+    # docling 的 page_range 為 1 起算且包含結尾
+    return [(start, min(start + pages_per_range - 1, page_count))
+            for start in range(1, page_count + 1, pages_per_range)]
+
+def _get_executor(workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn 避免 fork 已載入模型與執行緒的父行程
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(shutdown_executor)
+        return _executor
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def _shift_refs(node, offsets):
+    if isinstance(node, dict):
+        return {key: _shift_refs(value, offsets) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_shift_refs(value, offsets) for value in node]
+    if isinstance(node, str):
+        match = _REF_PATTERN.match(node)
+        if match:
+            key, index = match.group(1), int(match.group(2))
+            return f"#/{key}/{index + offsets[key]}"
+    return node
+
+def merge_document_dicts(doc_dicts):
+    """
+    reassemble page range documents into one DoclingDocument
+
+    item lists are concatenated in page order and every "#/<key>/<n>"
+    reference is shifted, so table / picture indexes (used for the
+    -table-N image names) follow document order as in a single conversion;
+    page numbers are absolute already
+
+    Args:
+        doc_dicts: export_to_dict() outputs in page order
+    Returns:
+        DoclingDocument
+    """
+    merged = None
+    for doc_dict in doc_dicts:
+        if merged is None:
+            merged = doc_dict
+            continue
+        offsets = {key: len(merged.get(key, [])) for key in _REF_KEYS}
+        shifted = _shift_refs(doc_dict, offsets)
+        for key in _REF_KEYS:
+            merged.setdefault(key, []).extend(shifted.get(key, []))
+        for node in ("body", "furniture"):
+            if node in shifted:
+                merged[node]["children"].extend(shifted[node].get("children", []))
+        merged.setdefault("pages", {}).update(shifted.get("pages", {}))
+    return DoclingDocument.model_validate(merged)
+
+def convert_pdf_page_parallel(file_path, do_ocr=False, pages_per_range=PAGE_PARALLEL_PAGES_PER_RANGE,
+                              workers=PAGE_PARALLEL_WORKERS):
+    """
+    convert a PDF by page ranges in a process pool
+
+    Returns:
+        DoclingDocument, or None if the PDF is too short to be worth splitting
+    """
+    page_count = pdf_page_count(file_path)
+    if page_count < max(PAGE_PARALLEL_MIN_PAGES, pages_per_range + 1):
+        return None
+
+    executor = _get_executor(workers)
+    futures = [executor.submit(convert_range, file_path, do_ocr, start, end)
+               for start, end in page_ranges(page_count, pages_per_range)]
+    doc_dicts = [future.result() for future in futures]
+    return merge_document_dicts(doc_dicts)
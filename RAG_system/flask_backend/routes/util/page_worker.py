@@ -0,0 +1,101 @@
+"""
+docling conversion used both by the converter pool and by the page range
+process pool; spawn children only import this module (docling), not the
+Flask routes, Qdrant client or reranker
+"""
+import os
+import threading
+
+from docling.datamodel.pipeline_options import PdfPipelineOptions, RapidOcrOptions
+from docling.backend.pypdfium2_backend import PyPdfiumDocumentBackend
+from docling.datamodel.base_models import InputFormat
+from docling.document_converter import DocumentConverter, PdfFormatOption
+
+_lock = threading.Lock()
+_ocr_options = None
+_converters = {}  # 子行程內重複使用的 converter，do_ocr -> DocumentConverter
+
+def _get_ocr_options():
+    global _ocr_options
+    with _lock:
+        if _ocr_options is None:
+            # PyPdfium with RapidOCR
+            # ----------------------
+            # Download RappidOCR models from HuggingFace
+            print("Downloading RapidOCR models")
+            from huggingface_hub import snapshot_download
+            download_path = snapshot_download(repo_id="SWHL/RapidOCR")
+
+            det_model_path = os.path.join(
+                download_path, "PP-OCRv4", "ch_PP-OCRv4_det_infer.onnx"
+            )
+            rec_model_path = os.path.join(
+                download_path, "PP-OCRv4", "ch_PP-OCRv4_rec_infer.onnx"
+            )
+            cls_model_path = os.path.join(
+                download_path, "PP-OCRv3", "ch_ppocr_mobile_v2.0_cls_train.onnx"
+            )
+            _ocr_options = RapidOcrOptions(
+                det_model_path=det_model_path,
+                rec_model_path=rec_model_path,
+                cls_model_path=cls_model_path,
+                #force_full_page_ocr=True
+            )
+        return _ocr_options
+
+def build_pipeline_options(do_ocr):
+    # 設置docling處理選項
+    if do_ocr:
+        pipeline_options = PdfPipelineOptions()
+
+        pipeline_options.do_ocr = True
+        pipeline_options.do_table_structure = True
+        pipeline_options.table_structure_options.do_cell_matching = True
+        pipeline_options.table_structure_options.mode = 'accurate'
+
+        pipeline_options.images_scale = 2.0
+        pipeline_options.generate_page_images = True
+        pipeline_options.generate_picture_images = True
+
+        pipeline_options.ocr_options = _get_ocr_options()
+    else:
+        # PyPdfium without EasyOCR
+        # --------------------
+        pipeline_options = PdfPipelineOptions()
+        pipeline_options.do_ocr = False
+        pipeline_options.do_table_structure = True
+        pipeline_options.table_structure_options.do_cell_matching = False
+        #pipeline_options.table_structure_options.do_cell_matching = True
+
+        #pipeline_options.table_structure_options.mode = 'accurate'
+
+        pipeline_options.images_scale = 2
+        pipeline_options.generate_page_images = True
+        pipeline_options.generate_picture_images = True
+    return pipeline_options
+
+def new_converter(do_ocr):
+    pipeline_options = build_pipeline_options(do_ocr)
+    converter = DocumentConverter(
+        format_options={
+            InputFormat.PDF: PdfFormatOption(
+            pipeline_options=pipeline_options, backend=PyPdfiumDocumentBackend
+            )
+        }
+    )
+    # 預先載入 layout / TableFormer 模型
+    converter.initialize_pipeline(InputFormat.PDF)
+    return converter
+
+def convert_range(file_path, do_ocr, start, end):
+    """
+    convert one page range in a process pool child
+
+    Returns:
+        DoclingDocument.export_to_dict() of the pages start..end (1-based, inclusive)
+    """
+    converter = _converters.get(bool(do_ocr))
+    if converter is None:
+        converter = _converters[bool(do_ocr)] = new_converter(do_ocr)
+    conv_res = converter.convert(file_path, raises_on_error=True, page_range=(start, end))
+    return conv_res.document.export_to_dict()
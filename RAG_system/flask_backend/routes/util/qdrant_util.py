@@ -2,11 +2,215 @@ from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from qdrant_client.http.models import PointStruct
 from .docling_util import get_embeddings
+from routes.BM25 import SPARSE_VECTOR_NAME, document_sparse_vector, query_sparse_vector
+import hashlib
+import json
+import threading
 import uuid
 import os
 
+# 集合的 payload 索引：建立集合時一次建立，既有集合在第一次連線時補建缺少的索引
+PAYLOAD_SCHEMA = {
+    "metadata.kb_name": models.PayloadSchemaType.KEYWORD,
+    "metadata.kb_id": models.PayloadSchemaType.KEYWORD,
+    "metadata.file_id": models.PayloadSchemaType.KEYWORD,
+    "metadata.filename": models.PayloadSchemaType.KEYWORD,
+    "metadata.file_hash": models.PayloadSchemaType.KEYWORD,
+    "metadata.page_ref": models.PayloadSchemaType.INTEGER,
+}
+
+# 本程序中已確認索引完整的集合
+_schema_checked = set()
+_schema_lock = threading.Lock()
+# collection_name -> 是否有 bm25 稀疏向量 (此功能之前建立的集合沒有)
+_sparse_collections = {}
+
+def ensure_payload_schema(qdrant_client, collection_name):
+    """
+    create the PAYLOAD_SCHEMA indexes missing from a collection
+
+    Returns:
+        list of created field names
+    """
+    existing = qdrant_client.get_collection(collection_name).payload_schema or {}
+    created = []
+    for field_name, field_schema in PAYLOAD_SCHEMA.items():
+        if field_name in existing and existing[field_name].data_type == field_schema:
+            continue
+        qdrant_client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=field_schema,
+            wait=True,
+        )
+        created.append(field_name)
+    with _schema_lock:
+        _schema_checked.add(collection_name)
+    return created
+
+# 建立集合的預設參數，可於 POST /api/collections 個別指定
+COLLECTION_DEFAULTS = {
+    "quantization": os.getenv('QDRANT_QUANTIZATION', 'none'),  # none / scalar (int8) / binary
+    "on_disk": os.getenv('QDRANT_ON_DISK_VECTORS', 'false') == 'true',  # 原始向量放磁碟，記憶體只放量化向量
+    "hnsw_m": int(os.getenv('QDRANT_HNSW_M', 16)),
+    "hnsw_ef_construct": int(os.getenv('QDRANT_HNSW_EF_CONSTRUCT', 100)),
+    # 以下為查詢時參數，存於 COLLECTION_SETTINGS_FOLDER
+    "hnsw_ef": int(os.getenv('QDRANT_HNSW_EF', 128)),
+    "rescore": os.getenv('QDRANT_RESCORE', 'true') == 'true',  # 量化搜尋後以原始向量重新計分
+    "oversampling": float(os.getenv('QDRANT_OVERSAMPLING', 2.0)),
+}
+SEARCH_SETTING_KEYS = ("hnsw_ef", "rescore", "oversampling")
+QUANTIZATION_TYPES = ("none", "scalar", "binary")
+COLLECTION_SETTINGS_FOLDER = os.getenv('COLLECTION_SETTINGS_FOLDER', './collection_settings')
+
+_search_settings = {}  # collection_name -> search settings
+_settings_lock = threading.Lock()
+
+def collection_options(options=None):
+    """
+    COLLECTION_DEFAULTS overridden by options, validated
+
+    Raises:
+        ValueError: unknown option or invalid value
+    """
+    merged = dict(COLLECTION_DEFAULTS)
+    for key, value in (options or {}).items():
+        if key not in merged:
+            raise ValueError(f"不支援的集合參數: {key}")
+        if isinstance(merged[key], bool):
+            merged[key] = value.lower() == 'true' if isinstance(value, str) else bool(value)
+        else:
+            merged[key] = type(merged[key])(value)
+    if merged["quantization"] not in QUANTIZATION_TYPES:
+        raise ValueError(f"不支援的 quantization: {merged['quantization']} (可用 {' / '.join(QUANTIZATION_TYPES)})")
+    if merged["hnsw_m"] < 0 or merged["hnsw_ef_construct"] < 4 or merged["hnsw_ef"] < 1:
+        raise ValueError("hnsw_m 需 >= 0，hnsw_ef_construct 需 >= 4，hnsw_ef 需 >= 1")
+    if merged["oversampling"] < 1:
+        raise ValueError("oversampling 需 >= 1")
+    return merged
+
+def quantization_config(quantization):
+    if quantization == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if quantization == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    return None
+
+def _settings_path(collection_name):
+    return os.path.join(COLLECTION_SETTINGS_FOLDER, f"{collection_name}.json")
+
+def save_search_settings(collection_name, options):
+    settings = {key: options[key] for key in SEARCH_SETTING_KEYS}
+    os.makedirs(COLLECTION_SETTINGS_FOLDER, exist_ok=True)
+    path = _settings_path(collection_name)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(settings, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    with _settings_lock:
+        _search_settings[collection_name] = settings
+    return settings
+
+def load_search_settings(collection_name):
+    # 沒有設定檔的集合 (舊集合) 使用預設值
+    with _settings_lock:
+        settings = _search_settings.get(collection_name)
+    if settings is not None:
+        return settings
+    settings = {key: COLLECTION_DEFAULTS[key] for key in SEARCH_SETTING_KEYS}
+    path = _settings_path(collection_name)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            settings.update(json.load(f))
+    with _settings_lock:
+        _search_settings[collection_name] = settings
+    return settings
+
+def search_params(collection_name):
+    # 未量化的集合會忽略 quantization 參數
+    settings = load_search_settings(collection_name)
+    return models.SearchParams(
+        hnsw_ef=settings["hnsw_ef"],
+        quantization=models.QuantizationSearchParams(
+            rescore=settings["rescore"],
+            oversampling=settings["oversampling"],
+        ),
+    )
+
+def has_sparse_vectors(qdrant_client, collection_name):
+    with _schema_lock:
+        cached = _sparse_collections.get(collection_name)
+    if cached is not None:
+        return cached
+    sparse_config = qdrant_client.get_collection(collection_name).config.params.sparse_vectors or {}
+    enabled = SPARSE_VECTOR_NAME in sparse_config
+    with _schema_lock:
+        _sparse_collections[collection_name] = enabled
+    return enabled
+
+def describe_collection(collection_name, collection_info):
+    """
+    storage / index settings of a collection as reported by /api/collectionStatus
+    """
+    config = collection_info.config
+    vectors = config.params.vectors
+    quantization = config.quantization_config
+    if isinstance(quantization, models.ScalarQuantization):
+        quantization_type = "scalar"
+    elif isinstance(quantization, models.BinaryQuantization):
+        quantization_type = "binary"
+    elif quantization is None:
+        quantization_type = "none"
+    else:
+        quantization_type = type(quantization).__name__
+    settings = load_search_settings(collection_name)
+    return {
+        "quantization": quantization_type,
+        "on_disk": bool(vectors.on_disk),
+        "hnsw_m": config.hnsw_config.m,
+        "hnsw_ef_construct": config.hnsw_config.ef_construct,
+        "hnsw_on_disk": bool(config.hnsw_config.on_disk),
+        "hnsw_ef": settings["hnsw_ef"],
+        "rescore": settings["rescore"],
+        "oversampling": settings["oversampling"],
+        "sparse_vectors": SPARSE_VECTOR_NAME in (config.params.sparse_vectors or {}),
+    }
+
+# 決定性 point id：uuid5(kb_id / file_id / 內容 hash / 同內容出現次序)
+# 重試或重新索引時相同 chunk 得到相同 id，覆寫而非重複寫入
+POINT_ID_NAMESPACE = uuid.UUID("02007938-1360-40db-ae6b-ba2a0233078e")
+
+def point_id(kb_id, file_id, text, occurrence=0):
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{kb_id}/{file_id}/{content_hash}/{occurrence}"))
+
+class PointIdAssigner:
+    def __init__(self):
+        """
+        point ids of the chunks of one or more documents in chunk order;
+        identical chunk texts in a document are told apart by occurrence
+        """
+        self._occurrences = {}
+
+    def __call__(self, text, metadata):
+        kb_id, file_id = metadata.get("kb_id"), metadata.get("file_id")
+        if kb_id is None or file_id is None:
+            return str(uuid.uuid4())
+        key = (kb_id, file_id, text)
+        occurrence = self._occurrences.get(key, 0)
+        self._occurrences[key] = occurrence + 1
+        return point_id(kb_id, file_id, text, occurrence)
+
 class qdrant_DBConnector:
-    def __init__(self, collection_name, recreate=False):#, embedding_fn):
+    def __init__(self, collection_name, recreate=False, options=None):#, embedding_fn):
+        """
+        Args:
+            collection_name: qdrant collection name
+            recreate: drop and create the collection
+            options: collection options for a created collection, see COLLECTION_DEFAULTS
+        """
         # 檢查是否在 Docker 環境中運行
         import socket
         try:
@@ -27,14 +231,31 @@ class qdrant_DBConnector:
 
         # create collection
         if recreate == True or not collection_exists:
+            options = collection_options(options)
             self.collection = self.qdrant_client.recreate_collection(
                 collection_name = collection_name,
                 vectors_config = models.VectorParams(
                     distance = models.Distance.COSINE,
-                    size=len(get_embeddings("你好"))),
+                    size=len(get_embeddings("你好")),
+                    on_disk=options["on_disk"]),
                 optimizers_config = models.OptimizersConfigDiff(memmap_threshold=20000),
-                hnsw_config = models.HnswConfigDiff(on_disk=True, m=16, ef_construct=100)
+                hnsw_config = models.HnswConfigDiff(on_disk=True, m=options["hnsw_m"], ef_construct=options["hnsw_ef_construct"]),
+                quantization_config = quantization_config(options["quantization"]),
+                # 詞彙檢索用的 BM25 稀疏向量，IDF 由 Qdrant 依集合統計計算
+                sparse_vectors_config = {
+                    SPARSE_VECTOR_NAME: models.SparseVectorParams(modifier=models.Modifier.IDF)
+                }
             )
+            with _schema_lock:
+                _sparse_collections[collection_name] = True
+            save_search_settings(collection_name, options)
+            ensure_payload_schema(self.qdrant_client, collection_name)
+        elif collection_name not in _schema_checked:
+            # 舊集合：補建缺少的索引
+            created = ensure_payload_schema(self.qdrant_client, collection_name)
+            if created:
+                print(f"已為集合 {collection_name} 建立 payload 索引: {', '.join(created)}")
+        self.sparse_enabled = has_sparse_vectors(self.qdrant_client, collection_name)
         
         
         '''
@@ -57,39 +278,84 @@ class qdrant_DBConnector:
         KB_PATH = os.path.join(UPLOAD_FOLDER, kb_folder_name)
         os.makedirs(KB_PATH, exist_ok=True)
 
-        # build index for later facet search
-        self.qdrant_client.create_payload_index(
-            collection_name = self.collection_name,
-            field_name = "metadata.kb_name",
-            field_schema = "keyword",
-        )
-
-        self.qdrant_client.create_payload_index(
-            collection_name = self.collection_name,
-            field_name = "metadata.filename",
-            field_schema = "keyword",
-        )
         return kb_folder_name, kb_id # 沒有的話就用新的
 
     ''' WARNING: NO CHECK ON EQUAL LENGTH YET'''
-    def upsert_vector(self, vectors, data):
+    def upsert_vector(self, vectors, data, batch_size=64, ids=None):
         # insert 'points' to qdrant by vector, 
         # payload with original text and metadata
+        # 每次請求寫入 batch_size 個 point，回傳寫入的 point id
+        # 有稀疏向量的集合同時寫入由 chunk 文字計算的 bm25 向量
+        # 未指定 ids 時依 metadata 的 kb_id / file_id 與內容產生決定性 id
+        assign_id = PointIdAssigner()
+        point_ids = []
+        points = []
         for i, vector in enumerate(vectors):
+            if isinstance(vector, dict):
+                # 從具名向量集合取出的 point (複製文件時)
+                vector = vector.get("", [])
             """ WARNING: SHOULD CHECK DIMENSION==EMBEDDING_DIMENSION INSTEAD"""
             if len(vector) == 0:
                 continue
-            self.qdrant_client.upsert(
+            if self.sparse_enabled:
+                indices, values = document_sparse_vector(data.text[i])
+                vector = {"": vector, SPARSE_VECTOR_NAME: models.SparseVector(indices=indices, values=values)}
+            chunk_id = ids[i] if ids is not None else assign_id(data.text[i], data.metadata[i])
+            points.append(PointStruct(id=chunk_id,
+                                      vector=vector,
+                                      payload={"text": data.text[i],
+                                               "metadata": data.metadata[i]}))
+            point_ids.append(chunk_id)
+            if len(points) >= batch_size:
+                self.qdrant_client.upsert(collection_name=self.collection_name, points=points)
+                points = []
+        if points:
+            self.qdrant_client.upsert(collection_name=self.collection_name, points=points)
+
+        print("upsert finish")
+        return point_ids
+
+    def overwrite_payloads(self, point_ids, data, batch_size=64):
+        # 內容未變的 chunk 只更新 payload，不重新寫入向量
+        operations = [
+            models.OverwritePayloadOperation(
+                overwrite_payload=models.SetPayload(
+                    payload={"text": data.text[i], "metadata": data.metadata[i]},
+                    points=[chunk_id],
+                )
+            )
+            for i, chunk_id in enumerate(point_ids)
+        ]
+        for start in range(0, len(operations), batch_size):
+            self.qdrant_client.batch_update_points(
                 collection_name=self.collection_name,
-                points=[PointStruct(id=str(uuid.uuid4()),
-                                    #id=i,
-                                    vector=vectors[i],
-                                    payload={"text": data.text[i],
-                                             "metadata": data.metadata[i]})]
-                                    
+                update_operations=operations[start:start + batch_size],
             )
+        return list(point_ids)
 
-        print("upsert finish")
+    def file_point_ids(self, file_id, batch_size=1000):
+        # 只取出某文件所有 point 的 id
+        result = []
+        offset = None
+        while True:
+            points, offset = self.qdrant_client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="metadata.file_id",
+                            match=models.MatchValue(value=file_id)
+                        ),
+                    ]
+                ),
+                limit=batch_size,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False,
+            )
+            result.extend(str(point.id) for point in points)
+            if offset is None:
+                return result
 
     def retrieved_all(self):
         count_points = self.qdrant_client.count(
@@ -136,12 +402,78 @@ class qdrant_DBConnector:
         )[0]
         return result
 
+    def find_file_by_hash(self, file_hash, kb_name=None, exclude_file_id=None):
+        # 找出內容相同的已上傳文件，回傳其中一個 chunk 的 metadata
+        # exclude_file_id：略過該文件本身 (重試的工作可能已寫入部分 point)
+        must = [
+            models.FieldCondition(
+                key="metadata.file_hash",
+                match=models.MatchValue(value=file_hash)
+            ),
+        ]
+        if kb_name is not None:
+            must.append(
+                models.FieldCondition(
+                    key="metadata.kb_name",
+                    match=models.MatchValue(value=kb_name)
+                )
+            )
+        must_not = []
+        if exclude_file_id is not None:
+            must_not.append(
+                models.FieldCondition(
+                    key="metadata.file_id",
+                    match=models.MatchValue(value=exclude_file_id)
+                )
+            )
+        points = self.qdrant_client.scroll(
+            collection_name=self.collection_name,
+            scroll_filter=models.Filter(must=must, must_not=must_not),
+            limit=1,
+            with_payload=True,
+        )[0]
+        return points[0].payload['metadata'] if points else None
+
+    def retrieved_from_file(self, file_id, with_vectors=False, batch_size=256):
+        # 分頁取出某文件的所有 point
+        result = []
+        offset = None
+        while True:
+            points, offset = self.qdrant_client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="metadata.file_id",
+                            match=models.MatchValue(value=file_id)
+                        ),
+                    ]
+                ),
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=with_vectors,
+            )
+            result.extend(points)
+            if offset is None:
+                return result
+
+    def delete_points(self, point_ids, batch_size=1000):
+        # 依 point id 分批刪除
+        point_ids = list(point_ids)
+        for start in range(0, len(point_ids), batch_size):
+            self.qdrant_client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(points=point_ids[start:start + batch_size]),
+            )
+
     def vector_search(self, vector, top_k):
         # vector search qdrant DB
         result = self.qdrant_client.search(
             collection_name=self.collection_name,
             query_vector=vector,
             limit=top_k,
+            search_params=search_params(self.collection_name),
             append_payload=True,
         )
         return result
@@ -152,6 +484,7 @@ class qdrant_DBConnector:
             collection_name=self.collection_name,
             query_vector=vector,
             limit=top_k,
+            search_params=search_params(self.collection_name),
             append_payload=True,
         )
         vector_result_json = {
@@ -180,6 +513,7 @@ class qdrant_DBConnector:
                 ]
             ),
             limit=top_k,
+            search_params=search_params(self.collection_name),
             append_payload=True,
         )
         vector_result_json = {
@@ -194,6 +528,52 @@ class qdrant_DBConnector:
 
         return vector_result_json
     
+    def hybrid_search_json_with_kb_name(self, kb_name, vector, query, top_k):
+        """
+        dense + bm25 sparse search of one KB fused by Qdrant (RRF) in a
+        single query_points request, same output format as rrf()
+
+        Returns:
+            dict chunk id -> {"score", "text", "metadata"} sorted by fused score,
+            None if the collection has no sparse vectors
+        """
+        if not self.sparse_enabled:
+            return None
+        kb_filter = models.Filter(
+            must=[
+                models.FieldCondition(
+                    key="metadata.kb_name",
+                    match=models.MatchValue(value=kb_name)
+                ),
+            ]
+        )
+        prefetch = [
+            models.Prefetch(query=vector, filter=kb_filter, limit=top_k, params=search_params(self.collection_name)),
+        ]
+        indices, values = query_sparse_vector(query)
+        if indices:
+            prefetch.append(
+                models.Prefetch(query=models.SparseVector(indices=indices, values=values),
+                                using=SPARSE_VECTOR_NAME, filter=kb_filter, limit=top_k)
+            )
+        result = self.qdrant_client.query_points(
+            collection_name=self.collection_name,
+            prefetch=prefetch,
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            query_filter=kb_filter,
+            # 與兩路各取 top_k 後合併的候選數相同
+            limit=top_k * len(prefetch),
+            with_payload=True,
+        ).points
+        return {
+            f"chunk_{item.id}": {
+                "score": item.score,
+                "text": item.payload['text'],
+                "metadata": item.payload['metadata']
+            }
+            for item in result
+        }
+
 class DataObject:
     def __init__(self, text, metadata):
         self.text = text
@@ -0,0 +1,151 @@
+import queue
+import threading
+import time
+
+from .qdrant_util import DataObject, PointIdAssigner
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def background_iter(iterable, maxsize=32, name="pipeline-stage"):
+    """
+    run an iterable in a background thread, yielding its items through a
+    bounded queue
+
+    the producer blocks once maxsize items are waiting, so a slow consumer
+    keeps memory flat; errors raised by the producer are re-raised here,
+    and closing the generator stops the producer
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(_Failure(e))
+            return
+        put(_DONE)
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join(timeout=5)
+
+
+class BatchUpserter:
+    def __init__(self, vector_db, batch_size=64, maxsize=4, on_upserted=None):
+        """
+        upsert (vector, text, metadata) items to qdrant in a background
+        thread, batch_size points per request; items without a vector
+        (unchanged chunks of a re-indexed document) only overwrite the
+        payload of their existing point
+
+        Args:
+            vector_db: qdrant_DBConnector
+            maxsize: max batches waiting for upsert before add() blocks
+            on_upserted: optional callback(points_upserted_total)
+        """
+        self.vector_db = vector_db
+        self.batch_size = batch_size
+        self.on_upserted = on_upserted
+        self.point_ids = []
+        self.reused_ids = []
+        self.seconds = 0.0
+        # 沒有指定 id 的項目在整份文件範圍內依序產生決定性 id
+        self._assign_id = PointIdAssigner()
+        self._batch = []
+        self._batches = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="qdrant-upsert", daemon=True)
+        self._thread.start()
+
+    def add(self, vector, text, metadata, point_id=None):
+        self._raise_error()
+        if point_id is None:
+            point_id = self._assign_id(text, metadata)
+        self._batch.append((point_id, vector, text, metadata))
+        if len(self._batch) >= self.batch_size:
+            self._submit()
+
+    def close(self):
+        # 寫入剩餘的資料並等待完成
+        if self._batch:
+            self._submit()
+        self._batches.put(_DONE)
+        self._thread.join()
+        self._raise_error()
+        return self.point_ids
+
+    def abort(self):
+        self._batch = []
+        self._batches.put(_DONE)
+        self._thread.join()
+
+    def _submit(self):
+        batch, self._batch = self._batch, []
+        while True:
+            self._raise_error()
+            try:
+                self._batches.put(batch, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        # 寫入失敗後仍持續取出批次，避免 add() 阻塞
+        while True:
+            batch = self._batches.get()
+            if batch is _DONE:
+                return
+            if self._error is not None:
+                continue
+            try:
+                start = time.perf_counter()
+                upserts = [item for item in batch if item[1] is not None]
+                if upserts:
+                    point_ids, vectors, texts, metadatas = zip(*upserts)
+                    self.point_ids.extend(self.vector_db.upsert_vector(
+                        list(vectors), DataObject(list(texts), list(metadatas)), batch_size=self.batch_size,
+                        ids=list(point_ids)
+                    ))
+                reused = [item for item in batch if item[1] is None]
+                if reused:
+                    point_ids, _vectors, texts, metadatas = zip(*reused)
+                    self.reused_ids.extend(self.vector_db.overwrite_payloads(
+                        list(point_ids), DataObject(list(texts), list(metadatas)), batch_size=self.batch_size
+                    ))
+                self.seconds += time.perf_counter() - start
+                if self.on_upserted is not None:
+                    self.on_upserted(len(self.point_ids) + len(self.reused_ids))
+            except Exception as e:
+                self._error = e
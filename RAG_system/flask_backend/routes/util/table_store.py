@@ -0,0 +1,311 @@
+import os
+import re
+import shutil
+import threading
+import uuid
+
+import jieba
+import numpy as np
+import pandas as pd
+
+from routes.BM25.stopwords import STOPWORDS_EN_PLUS, STOPWORDS_CHINESE, STOPWORDS_ZH_TW
+
+TABLE_STORE_FOLDER = os.getenv('TABLE_STORE_FOLDER', './table_store')
+
+# 長格式：每個非空儲存格一列
+TABLE_COLUMNS = ["file_id", "filename", "table_id", "table_ref", "page_ref", "row", "col", "column", "value"]
+
+_STOPWORDS = set(STOPWORDS_EN_PLUS + STOPWORDS_CHINESE + STOPWORDS_ZH_TW)
+_NUMBER_PATTERN = re.compile(r"\d[\d,]*(?:\.\d+)?")
+_WORD_PATTERN = re.compile(r"[\u4e00-\u9fffa-z0-9]")
+
+_lock = threading.Lock()
+_indexes = {}  # kb_name -> (signature, TableIndex)
+
+def tokenize_terms(text):
+    """
+    index / query terms of a cell value, column name or question:
+    jieba search-mode tokens without stopwords and single non-digit
+    characters, plus numbers with thousands separators removed
+    """
+    text = str(text).lower()
+    terms = set()
+    for token in jieba.cut_for_search(text):
+        token = token.strip()
+        if not token or token in _STOPWORDS or not _WORD_PATTERN.search(token):
+            continue
+        if len(token) == 1 and not token.isdigit():
+            continue
+        terms.add(token)
+    for number in _NUMBER_PATTERN.findall(text):
+        terms.add(number.replace(",", ""))
+    return terms
+
+def _check_name(name, label):
+    # kb_name / file_id 來自請求，只接受單層名稱，避免 ../ 跳出表格目錄
+    name = str(name) if name is not None else ""
+    if name in ("", ".", "..") or "/" in name or "\\" in name or os.path.basename(name) != name:
+        raise ValueError(f"不合法的 {label}: {name!r}")
+    return name
+
+def _kb_folder(kb_name):
+    root = os.path.abspath(TABLE_STORE_FOLDER)
+    folder = os.path.abspath(os.path.join(root, _check_name(kb_name, "kb_name")))
+    if os.path.dirname(folder) != root:
+        raise ValueError(f"不合法的 kb_name: {kb_name!r}")
+    return folder
+
+def _file_path(kb_name, file_id):
+    return os.path.join(_kb_folder(kb_name), f"{_check_name(file_id, 'file_id')}.parquet")
+
+def _staged_path(kb_name, file_id):
+    # 索引中的文件重新處理時，新表格先寫到這裡，向量寫入成功後才取代原本的表格
+    return f"{_file_path(kb_name, file_id)}.staged"
+
+def tables_to_frame(tables, file_id):
+    """
+    extract_tables() output -> one long DataFrame with TABLE_COLUMNS
+    """
+    frames = []
+    for table_id, (table_df, table_meta) in enumerate(tables):
+        n_rows, n_cols = table_df.shape
+        if n_rows == 0 or n_cols == 0:
+            continue
+        values = pd.Series(table_df.to_numpy().ravel(), dtype=object)
+        frame = pd.DataFrame({
+            "row": np.repeat(np.arange(n_rows, dtype=np.int32), n_cols),
+            "col": np.tile(np.arange(n_cols, dtype=np.int32), n_rows),
+            "column": np.tile(np.array([str(c) for c in table_df.columns], dtype=object), n_rows),
+            "value": values.map(str),
+        })
+        frame = frame[values.notnull().to_numpy() & (frame["value"].str.strip() != "").to_numpy()]
+        frame.insert(0, "file_id", file_id)
+        frame.insert(1, "filename", table_meta["filename"])
+        frame.insert(2, "table_id", np.int32(table_id))
+        frame.insert(3, "table_ref", ",".join(table_meta.get("table_ref", [])))
+        frame.insert(4, "page_ref", ",".join(str(p) for p in table_meta.get("page_ref", [])))
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=TABLE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)[TABLE_COLUMNS]
+
+def _write_frame(kb_name, file_id, frame):
+    os.makedirs(_kb_folder(kb_name), exist_ok=True)
+    path = _file_path(kb_name, file_id)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def save_file_tables(kb_name, file_id, tables):
+    """
+    persist the tables of one document in the KB table store
+
+    Args:
+        kb_name: kb folder name ('<kb_name>_<kb_id>')
+        tables: extract_tables() output
+    Returns:
+        number of stored cells
+    """
+    frame = tables_to_frame(tables, file_id)
+    if frame.empty:
+        remove_file_tables(kb_name, file_id)
+        return 0
+    _write_frame(kb_name, file_id, frame)
+    return len(frame)
+
+def stage_file_tables(kb_name, file_id, tables):
+    """
+    write the tables of one document next to its current tables;
+    commit_file_tables() swaps them in, discard_staged_tables() drops them
+
+    Returns:
+        number of staged cells
+    """
+    frame = tables_to_frame(tables, file_id)
+    os.makedirs(_kb_folder(kb_name), exist_ok=True)
+    path = _staged_path(kb_name, file_id)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        if frame.empty:
+            # 空檔案代表文件沒有表格，commit 時刪除原本的表格
+            open(tmp_path, "wb").close()
+        else:
+            frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return len(frame)
+
+def commit_file_tables(kb_name, file_id):
+    # 以原子的 os.replace 換上 stage_file_tables() 寫入的表格
+    staged_path = _staged_path(kb_name, file_id)
+    if not os.path.exists(staged_path):
+        return False
+    if os.path.getsize(staged_path) == 0:
+        os.remove(staged_path)
+        remove_file_tables(kb_name, file_id)
+    else:
+        os.replace(staged_path, _file_path(kb_name, file_id))
+    return True
+
+def discard_staged_tables(kb_name, file_id):
+    staged_path = _staged_path(kb_name, file_id)
+    if os.path.exists(staged_path):
+        os.remove(staged_path)
+
+def copy_file_tables(source_kb_name, source_file_id, kb_name, file_id, filename, rename_ref=None):
+    # 去重複複製文件到其他知識庫時，一併複製表格
+    source_path = _file_path(source_kb_name, source_file_id)
+    if not os.path.exists(source_path):
+        return 0
+    frame = pd.read_parquet(source_path)
+    frame["file_id"] = file_id
+    frame["filename"] = filename
+    if rename_ref is not None:
+        frame["table_ref"] = frame["table_ref"].map(
+            lambda refs: ",".join(rename_ref(ref) for ref in refs.split(",") if ref))
+    _write_frame(kb_name, file_id, frame)
+    return len(frame)
+
+def remove_file_tables(kb_name, file_id):
+    path = _file_path(kb_name, file_id)
+    if os.path.exists(path):
+        os.remove(path)
+        return True
+    return False
+
+def remove_kb_tables(kb_name):
+    folder = _kb_folder(kb_name)
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+        return True
+    return False
+
+
+class TableIndex:
+    def __init__(self, frame):
+        """
+        in-memory indexes over the long table frame of one KB
+
+        value_index: term -> row keys whose cells contain the term
+        column_index: term -> table keys whose column names contain the term
+        """
+        self.frame = frame.reset_index(drop=True)
+        self.frame["row_key"] = self.frame.groupby(["file_id", "table_id", "row"], sort=False).ngroup()
+        self.frame["table_key"] = self.frame.groupby(["file_id", "table_id"], sort=False).ngroup()
+        self.row_positions = self.frame.groupby("row_key").indices
+        self.row_table = self.frame.groupby("row_key")["table_key"].first().to_dict()
+
+        self.value_index = {}
+        value_terms = {value: tokenize_terms(value) for value in self.frame["value"].unique()}
+        for value, row_keys in self.frame.groupby("value")["row_key"]:
+            for term in value_terms[value]:
+                self.value_index.setdefault(term, set()).update(row_keys.tolist())
+
+        self.column_index = {}
+        for column, table_keys in self.frame.groupby("column")["table_key"]:
+            for term in tokenize_terms(column):
+                self.column_index.setdefault(term, set()).update(table_keys.tolist())
+
+    def row_text(self, row_key):
+        # 與 DataFrameFormatter 相同的 "欄名 = 值" 格式
+        cells = self.frame.iloc[self.row_positions[row_key]].sort_values("col")
+        return ", ".join(f"{column} = {value}" for column, value in zip(cells["column"], cells["value"]))
+
+    def row_meta(self, row_key):
+        first = self.frame.iloc[self.row_positions[row_key][0]]
+        return {
+            "filename": first["filename"],
+            "file_id": first["file_id"],
+            "table_ref": [ref for ref in first["table_ref"].split(",") if ref],
+            "image_ref": [],
+            "page_ref": [int(p) for p in first["page_ref"].split(",") if p],
+            "table_row": int(first["row"])
+        }
+
+    def _idf(self, term):
+        # 出現在越少列的詞權重越高
+        n_rows = len(self.row_positions)
+        row_count = len(self.value_index.get(term, ()))
+        return np.log(1.0 + n_rows / (row_count + 1.0))
+
+    def lookup(self, query, top_k=5, min_score=0.5):
+        """
+        rows whose cells match query terms, scored by the idf weight of
+        the query terms found in the row values (and, at half weight, in
+        its table column names) over the weight of all indexed query terms
+
+        Returns:
+            list of (score, row text, metadata), score in [0, 1]
+        """
+        query_terms = [term for term in tokenize_terms(query)
+                       if term in self.value_index or term in self.column_index]
+        if not query_terms:
+            return []
+        weights = {term: self._idf(term) for term in query_terms}
+        total_weight = sum(weights.values())
+
+        value_hits = {}
+        for term in query_terms:
+            for row_key in self.value_index.get(term, ()):
+                value_hits.setdefault(row_key, set()).add(term)
+        column_hits = {}
+        for term in query_terms:
+            for table_key in self.column_index.get(term, ()):
+                column_hits.setdefault(table_key, set()).add(term)
+
+        scored = []
+        for row_key, terms in value_hits.items():
+            column_terms = column_hits.get(self.row_table[row_key], set()) - terms
+            score = (sum(weights[t] for t in terms) + 0.5 * sum(weights[t] for t in column_terms)) / total_weight
+            if score >= min_score:
+                scored.append((min(score, 1.0), row_key))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+
+        return [(score, self.row_text(row_key), self.row_meta(row_key)) for score, row_key in scored[:top_k]]
+
+
+def _signature(kb_name):
+    folder = _kb_folder(kb_name)
+    if not os.path.isdir(folder):
+        return ()
+    return tuple(sorted(
+        (entry.name, entry.stat().st_mtime_ns) for entry in os.scandir(folder) if entry.name.endswith(".parquet")
+    ))
+
+def get_table_index(kb_name):
+    """
+    TableIndex of a KB, rebuilt when its parquet files change
+
+    Returns:
+        TableIndex or None if the KB has no tables
+    """
+    signature = _signature(kb_name)
+    with _lock:
+        cached = _indexes.get(kb_name)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+    if not signature:
+        index = None
+    else:
+        frame = pd.concat(
+            [pd.read_parquet(os.path.join(_kb_folder(kb_name), name)) for name, _mtime in signature],
+            ignore_index=True
+        )
+        index = TableIndex(frame) if not frame.empty else None
+    with _lock:
+        _indexes[kb_name] = (signature, index)
+    return index
+
+def lookup_table_rows(kb_name, query, top_k=5, min_score=0.5):
+    if not kb_name or not query:
+        return []
+    index = get_table_index(kb_name)
+    if index is None:
+        return []
+    return index.lookup(query, top_k=top_k, min_score=min_score)
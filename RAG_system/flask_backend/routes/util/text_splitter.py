@@ -1,12 +1,62 @@
 import re
+from bisect import bisect_left
 import pandas as pd
 
+def encode_offsets(tokenizer, text):
+    # 需要 fast tokenizer 才能取得每個 token 對應的字元位置
+    if not getattr(tokenizer, "is_fast", False):
+        raise ValueError("RecursiveTextSplitter 需要支援 offset mapping 的 fast tokenizer")
+    return tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+
+class ChunkRecord:
+    __slots__ = ("text", "metadata", "tokenizer", "_offsets")
+
+    def __init__(self, text, metadata, tokenizer=None, offsets=None):
+        """
+        one chunk to embed: serialized text, metadata and the character
+        offsets of its tokens, tokenized at most once and shared by the
+        big-chunk check and RecursiveTextSplitter
+        """
+        self.text = text
+        self.metadata = metadata
+        self.tokenizer = tokenizer
+        self._offsets = offsets
+
+    @property
+    def offsets(self):
+        if self._offsets is None:
+            self._offsets = encode_offsets(self.tokenizer, self.text)
+        return self._offsets
+
+    @property
+    def token_count(self):
+        return len(self.offsets)
+
+    def release_tokens(self):
+        # 進入嵌入階段後不再需要 token 位置
+        self._offsets = None
+
 class RecursiveTextSplitter:
     def __init__(self, tokenizer, max_tokens=1024, overlap=100, min_length_ratio=0.7):
+        """
+        token based recursive splitter
+
+        the text is tokenized once; token counts of candidate chunks come
+        from the token offset mapping (binary search on token start
+        positions) and candidates are only re-tokenized near max_tokens.
+        overlaps are not sliced by character offsets: each output chunk is
+        tokenized on its own (plus the last chunk before its overlap) and
+        the next overlap is decoded from its last tokens, because a chunk
+        tokenized alone can have different boundary tokens than the whole
+        text. splitting stays linear in the text length and gives the same
+        chunks as the legacy splitter (tests/test_text_splitter.py)
+        """
         self.tokenizer = tokenizer
         self.max_tokens = max_tokens
         self.overlap = overlap
         self.min_length_ratio = min_length_ratio
+        # 估算的 token 數與上限相差在此範圍內時，單獨 tokenize 確認
+        self.count_check_margin = 2
 
         # chinese text splitter
         self.separators = [
@@ -16,52 +66,98 @@ class RecursiveTextSplitter:
             r"(?=\s+)",       # 空格
             r""               # fallback：逐字切
         ]
+        self._separator_patterns = [re.compile(sep) for sep in self.separators]
 
     def tokenize_len(self, text):
         return len(self.tokenizer.tokenize(text))
 
-    def split_text(self, text):
-        for sep in self.separators:
-            parts = re.split(sep, text)
-            parts = [p for p in parts if p.strip() != '']
-            chunks = self._recursive_split(parts)
-            if all(self.tokenize_len(chunk) <= self.max_tokens + 2 for chunk in chunks):
-                return chunks
+    def split_text(self, text, offsets=None):
+        """
+        Args:
+            offsets: encode_offsets(tokenizer, text) if already computed
+        Returns:
+            list of chunk texts
+        """
+        if offsets is None:
+            offsets = encode_offsets(self.tokenizer, text)
+        starts = [start for start, _end in offsets]
+
+        for pattern in self._separator_patterns:
+            parts = self._split_spans(text, pattern)
+            chunks = self._apply_overlap(self._recursive_split(text, parts, starts))
+            if all(token_count <= self.max_tokens + 2 for _chunk, token_count in chunks):
+                return [chunk for chunk, _token_count in chunks]
         # fallback: force token split
         return self._force_split(text)
 
-    def _recursive_split(self, parts):
+    def split_record(self, record):
+        """
+        split a ChunkRecord longer than max_tokens, reusing its offsets
+
+        Returns:
+            list of ChunkRecord with a copy of the record metadata
+        """
+        if record.token_count <= self.max_tokens:
+            return [record]
+        return [ChunkRecord(text, dict(record.metadata), self.tokenizer)
+                for text in self.split_text(record.text, record.offsets)]
+
+    @staticmethod
+    def _token_index(starts, char_pos):
+        # 第一個起始位置 >= char_pos 的 token
+        return bisect_left(starts, char_pos)
+
+    @staticmethod
+    def _split_spans(text, pattern):
+        # 分隔符皆為零寬度，回傳 (start, end) 字元區段並略過空白區段
+        boundaries = [0]
+        boundaries += [m.start() for m in pattern.finditer(text) if 0 < m.start() < len(text)]
+        boundaries.append(len(text))
+        return [(a, b) for a, b in zip(boundaries, boundaries[1:])
+                if b > a and text[a:b].strip() != '']
+
+    def _recursive_split(self, text, parts, starts):
+        # 依累積 token 數貪婪合併區段，回傳 chunk 文字清單 (與舊版相同，略過的空白區段不併入)
+        # token 數以整份文件的 token 位置估算，接近上限時才單獨 tokenize 合併後的文字確認，
+        # 因為單獨 tokenize 時 chunk 邊界的 token 可能與整份文件不同
         chunks = []
-        current = ""
-        for part in parts:
-            if self.tokenize_len(current + part) <= self.max_tokens:
-                current += part
+        current = []
+        for a, b in parts:
+            candidate_start = current[0][0] if current else a
+            candidate_tokens = self._token_index(starts, b) - self._token_index(starts, candidate_start)
+            if abs(candidate_tokens - self.max_tokens) <= self.count_check_margin:
+                candidate_tokens = len(self._encode(self._join(text, current + [(a, b)])))
+            if candidate_tokens <= self.max_tokens:
+                current.append((a, b))
             else:
                 if current:
-                    chunks.append(current)
-                current = part
+                    chunks.append(self._join(text, current))
+                current = [(a, b)]
         if current:
-            chunks.append(current)
-        return self._apply_overlap(chunks)
+            chunks.append(self._join(text, current))
+        return chunks
+
+    @staticmethod
+    def _join(text, spans):
+        return "".join(text[a:b] for a, b in spans)
 
     def _force_split(self, text):
-        tokens = self.tokenizer.tokenize(text)
-        total_tokens = len(tokens)
+        # 與舊版相同以 decode 產生文字，token 區段的原文位置可能含前導空白
+        input_ids = self._encode(text)
+        total_tokens = len(input_ids)
         chunks = []
         start = 0
 
         while start < total_tokens:
             end = min(start + self.max_tokens, total_tokens)
-            chunk_tokens = tokens[start:end]
+            chunk_start = start
 
             # fill to max_token at last chunk
-            if end == total_tokens and len(chunk_tokens) < self.max_tokens and start != 0:
-                tokens_needed = self.max_tokens - len(chunk_tokens)
-                prev_start = max(0, start - tokens_needed)
-                chunk_tokens = tokens[prev_start:end]
+            if end == total_tokens and end - start < self.max_tokens and start != 0:
+                tokens_needed = self.max_tokens - (end - start)
+                chunk_start = max(0, start - tokens_needed)
 
-            chunk_text = self.tokenizer.decode(self.tokenizer.convert_tokens_to_ids(chunk_tokens))
-            chunks.append(chunk_text)
+            chunks.append(self._decode(input_ids[chunk_start:end]))
 
             if end == total_tokens:
                 break
@@ -69,36 +165,38 @@ class RecursiveTextSplitter:
         #print("this chunk was force splitted!")
         return chunks
     
+    def _encode(self, text):
+        return self.tokenizer.backend_tokenizer.encode(text, add_special_tokens=False).ids
+
+    def _decode(self, ids):
+        # 等同 tokenizer.decode(ids)，但略過 transformers 對每個 id 的型別轉換 (chunk 多時佔大部分時間)
+        text = self.tokenizer.backend_tokenizer.decode(ids, skip_special_tokens=False)
+        if self.tokenizer.clean_up_tokenization_spaces:
+            text = self.tokenizer.clean_up_tokenization(text)
+        return text
+
     def _apply_overlap(self, chunks):
+        # 回傳 (chunk text, token 數)
+        # 重疊部分取自前一個 chunk 單獨 tokenize 後的最後幾個 token 再 decode：
+        # 單獨 tokenize 時的 token 邊界 (句首空白、跨 chunk 的詞) 與整份文件不同，
+        # 直接以整份文件的 token 位置從原文切出會多出空白或少一個 token
         result = []
+        prev_ids = None
         for i, chunk in enumerate(chunks):
-            if i == 0:
-                result.append(chunk)
-            else:
-                prev_chunk = result[-1]
-                current_tokens = self.tokenize_len(chunk)
-
-                if i == len(chunks) - 1 and current_tokens < self.max_tokens * self.min_length_ratio:
+            if i > 0:
+                # 只有最後一個 chunk 需要自身的 token 數 (決定是否補滿到 max_tokens)
+                current_tokens = len(self._encode(chunk)) if i == len(chunks) - 1 else None
+                if current_tokens is not None and current_tokens < self.max_tokens * self.min_length_ratio:
                     # fill to max_token at last chunk
-                    prev_tokens = self.tokenizer.tokenize(prev_chunk)
-                    tokens_needed = self.max_tokens - current_tokens
-                    extra_overlap_tokens = min(tokens_needed, len(prev_tokens))
-
-                    extra_overlap_text = self.tokenizer.decode(
-                        self.tokenizer.convert_tokens_to_ids(prev_tokens[-extra_overlap_tokens:])
-                    )
-                    result.append(extra_overlap_text + chunk)
-
+                    overlap_tokens = min(self.max_tokens - current_tokens, len(prev_ids))
                 else:
                     # regular fixed token overlap
-                    prev_tokens = self.tokenizer.tokenize(prev_chunk)
-                    overlap_text = self.tokenizer.decode(
-                        self.tokenizer.convert_tokens_to_ids(prev_tokens[-self.overlap:])
-                    )
-                    result.append(overlap_text + chunk)
-        #print(result)
-        #for j in result:
-        #    print(self.tokenize_len(j))
+                    overlap_tokens = min(self.overlap, len(prev_ids))
+                if overlap_tokens > 0:
+                    chunk = self._decode(prev_ids[-overlap_tokens:]) + chunk
+            # 下一個 chunk 的重疊取自本 chunk (含其重疊部分) 的結尾
+            prev_ids = self._encode(chunk)
+            result.append((chunk, len(prev_ids)))
         return result
     
 class DataFrameFormatter:
@@ -119,10 +217,41 @@ class DataFrameFormatter:
         return ', '.join(output)
 
     def format_all_rows(self, df: pd.DataFrame):
-        return [
-            self.format_row(row, idx + 1, self.show_index)
-            for idx, row in df.iterrows()
-        ]
+        """
+        format every row as format_row() would, column by column
+
+        df.to_numpy() applies the same dtype upcasting as df.iterrows(),
+        so values are rendered identically
+        """
+        if len(df) == 0:
+            return []
+        values = df.to_numpy()
+        rows = pd.Series([""] * len(df), dtype=object)
+        if self.show_index:
+            index_suffix = ". " + pd.Series(df.index + 1, dtype=object).map(str).reset_index(drop=True)
+
+        for position, key in enumerate(df.columns):
+            column = pd.Series(values[:, position], dtype=object)
+            text = column.map(str)
+            valid = column.notnull() & (text.str.strip() != "")
+            entry = f"{key} = " + text
+            if self.show_index:
+                entry = entry + index_suffix
+            entry = entry.where(valid, "")
+
+            # 以 ', ' 串接非空的欄位
+            joined = rows + ", " + entry
+            rows = joined.where((rows != "") & valid, rows.where(rows != "", entry))
+        return rows.tolist()
+
+    def token_lengths(self, texts):
+        # fast tokenizer 一次批次計算所有列的 token 數
+        if not texts:
+            return []
+        if getattr(self.tokenizer, "is_fast", False):
+            encoded = self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+            return [len(ids) for ids in encoded]
+        return [len(self.tokenizer.tokenize(text)) for text in texts]
 
     def chunk_rows(self, df: pd.DataFrame):
         formatted_rows = self.format_all_rows(df)
@@ -130,8 +259,7 @@ class DataFrameFormatter:
         current_chunk = []
         current_tokens = 0
 
-        for row in formatted_rows:
-            row_tokens = len(self.tokenizer.tokenize(row))
+        for row, row_tokens in zip(formatted_rows, self.token_lengths(formatted_rows)):
             if current_tokens + row_tokens <= self.max_tokens:
                 current_chunk.append(row)
                 current_tokens += row_tokens
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# 每個階段保留最近的樣本數，用於計算 p50/p95
+STAGE_SAMPLE_SIZE = int(os.getenv('STAGE_SAMPLE_SIZE', 2048))
+
+
+class StageStats:
+    def __init__(self, sample_size=STAGE_SAMPLE_SIZE):
+        """
+        aggregate stage latencies across requests
+
+        Args:
+            sample_size: number of recent samples kept per stage for percentiles
+        """
+        self.sample_size = sample_size
+        self._samples = {}  # stage -> deque of ms
+        self._counts = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, elapsed_ms):
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = deque(maxlen=self.sample_size)
+                self._counts[stage] = 0
+                self._totals[stage] = 0.0
+            self._samples[stage].append(elapsed_ms)
+            self._counts[stage] += 1
+            self._totals[stage] += elapsed_ms
+
+    @staticmethod
+    def _percentile(sorted_samples, q):
+        if not sorted_samples:
+            return 0.0
+        index = min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))
+        return sorted_samples[index]
+
+    def summary(self):
+        """
+        Returns:
+            dict of stage -> {count, mean_ms, p50_ms, p95_ms, max_ms}
+        """
+        with self._lock:
+            snapshot = {stage: (sorted(samples), self._counts[stage], self._totals[stage])
+                        for stage, samples in self._samples.items()}
+
+        result = {}
+        for stage, (samples, count, total) in snapshot.items():
+            result[stage] = {
+                "count": count,
+                "mean_ms": round(total / count, 3) if count else 0.0,
+                "p50_ms": round(self._percentile(samples, 0.50), 3),
+                "p95_ms": round(self._percentile(samples, 0.95), 3),
+                "max_ms": round(samples[-1], 3) if samples else 0.0
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self._totals.clear()
+
+
+class Trace:
+    def __init__(self):
+        # 單次請求內各階段的耗時，依完成順序記錄
+        self.spans = []
+        self._start = time.perf_counter()
+
+    def add(self, stage, elapsed_ms):
+        self.spans.append((stage, elapsed_ms))
+
+    def timings(self):
+        """
+        Returns:
+            dict of stage -> ms (repeated stages are summed) plus 'total'
+        """
+        result = {}
+        for stage, elapsed_ms in self.spans:
+            result[stage] = round(result.get(stage, 0.0) + elapsed_ms, 3)
+        result["total"] = round((time.perf_counter() - self._start) * 1000, 3)
+        return result
+
+
+stage_stats = StageStats()
+_current_trace = ContextVar("current_trace", default=None)
+
+def start_trace():
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+def current_trace():
+    return _current_trace.get()
+
+@contextmanager
+def span(stage):
+    """
+    time a pipeline stage with a monotonic timer
+
+    the elapsed time is added to the current request trace (if any)
+    and to the global per-stage statistics
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        stage_stats.record(stage, elapsed_ms)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, elapsed_ms)
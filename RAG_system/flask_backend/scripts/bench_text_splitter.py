@@ -0,0 +1,165 @@
+"""
+RecursiveTextSplitter 效能測試：比較舊版 (逐段重新 tokenize) 與
+offset mapping 版本在長篇中文文件上的耗時與切分結果
+
+使用方式 (於 flask_backend 目錄下):
+    python scripts/bench_text_splitter.py
+    python scripts/bench_text_splitter.py --file 長文件.txt --repeat 3
+    python scripts/bench_text_splitter.py --lengths 2000 8000 32000 --skip-legacy-above 20000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from transformers import AutoTokenizer
+from routes.util.text_splitter import RecursiveTextSplitter
+
+
+class LegacyRecursiveTextSplitter:
+    # 改寫前的實作，僅作為比較基準
+    def __init__(self, tokenizer, max_tokens=1024, overlap=100, min_length_ratio=0.7):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.min_length_ratio = min_length_ratio
+        self.separators = [r"(?<=[。！？])", r"(?<=[；，、])", r"(?=\n+)", r"(?=\s+)", r""]
+
+    def tokenize_len(self, text):
+        return len(self.tokenizer.tokenize(text))
+
+    def split_text(self, text):
+        for sep in self.separators:
+            parts = re.split(sep, text)
+            parts = [p for p in parts if p.strip() != '']
+            chunks = self._recursive_split(parts)
+            if all(self.tokenize_len(chunk) <= self.max_tokens + 2 for chunk in chunks):
+                return chunks
+        return self._force_split(text)
+
+    def _recursive_split(self, parts):
+        chunks = []
+        current = ""
+        for part in parts:
+            if self.tokenize_len(current + part) <= self.max_tokens:
+                current += part
+            else:
+                if current:
+                    chunks.append(current)
+                current = part
+        if current:
+            chunks.append(current)
+        return self._apply_overlap(chunks)
+
+    def _force_split(self, text):
+        tokens = self.tokenizer.tokenize(text)
+        total_tokens = len(tokens)
+        chunks = []
+        start = 0
+        while start < total_tokens:
+            end = min(start + self.max_tokens, total_tokens)
+            chunk_tokens = tokens[start:end]
+            if end == total_tokens and len(chunk_tokens) < self.max_tokens and start != 0:
+                tokens_needed = self.max_tokens - len(chunk_tokens)
+                prev_start = max(0, start - tokens_needed)
+                chunk_tokens = tokens[prev_start:end]
+            chunks.append(self.tokenizer.decode(self.tokenizer.convert_tokens_to_ids(chunk_tokens)))
+            if end == total_tokens:
+                break
+            start = end - self.overlap
+        return chunks
+
+    def _apply_overlap(self, chunks):
+        result = []
+        for i, chunk in enumerate(chunks):
+            if i == 0:
+                result.append(chunk)
+                continue
+            prev_tokens = self.tokenizer.tokenize(result[-1])
+            current_tokens = self.tokenize_len(chunk)
+            if i == len(chunks) - 1 and current_tokens < self.max_tokens * self.min_length_ratio:
+                extra = min(self.max_tokens - current_tokens, len(prev_tokens))
+                overlap_tokens = prev_tokens[-extra:]
+            else:
+                overlap_tokens = prev_tokens[-self.overlap:]
+            result.append(self.tokenizer.decode(self.tokenizer.convert_tokens_to_ids(overlap_tokens)) + chunk)
+        return result
+
+
+SENTENCE_PIECES = [
+    "本研究探討知識庫檢索增強生成系統在企業文件上的應用",
+    "表格與圖片經由版面分析後轉換為結構化內容",
+    "向量資料庫負責儲存文件片段的嵌入向量",
+    "使用者提出問題時系統先檢索相關片段再交由語言模型生成回答",
+    "實驗結果顯示混合檢索在專有名詞查詢上明顯優於單純向量檢索",
+    "文件切分的粒度會影響檢索的精確度與回答的完整性",
+]
+
+def synthetic_document(n_chars, seed=0):
+    # 產生含句號、逗號與換行的長篇中文文本
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < n_chars:
+        sentence = "，".join(rng.sample(SENTENCE_PIECES, rng.randint(1, 3))) + rng.choice("。。。！？")
+        if rng.random() < 0.1:
+            sentence += "\n"
+        parts.append(sentence)
+        length += len(sentence)
+    return "".join(parts)[:n_chars]
+
+def time_split(splitter, text, repeat):
+    best = None
+    chunks = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = splitter.split_text(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, chunks
+
+def normalize(text):
+    return re.sub(r"\s+", "", text)
+
+def main():
+    parser = argparse.ArgumentParser(description="RecursiveTextSplitter benchmark")
+    parser.add_argument("--tokenizer", default="BAAI/bge-m3")
+    parser.add_argument("--file", help="以指定文字檔為測試文件，否則產生合成文本")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[2000, 8000, 32000], help="合成文本字數")
+    parser.add_argument("--max-tokens", type=int, default=1024)
+    parser.add_argument("--overlap", type=int, default=150)
+    parser.add_argument("--min-length-ratio", type=float, default=1)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--skip-legacy-above", type=int, default=None, help="超過此字數時不執行舊版 (耗時過長)")
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    kwargs = dict(max_tokens=args.max_tokens, overlap=args.overlap, min_length_ratio=args.min_length_ratio)
+    splitter = RecursiveTextSplitter(tokenizer, **kwargs)
+    legacy = LegacyRecursiveTextSplitter(tokenizer, **kwargs)
+
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            documents = [(os.path.basename(args.file), f.read())]
+    else:
+        documents = [(f"synthetic-{n}", synthetic_document(n)) for n in args.lengths]
+
+    print(f"{'document':<20}{'chars':>8}{'tokens':>8}{'legacy s':>10}{'offset s':>10}{'speedup':>9}{'chunks':>12}{'same text':>11}")
+    for name, text in documents:
+        n_tokens = len(tokenizer.tokenize(text))
+        new_seconds, new_chunks = time_split(splitter, text, args.repeat)
+        if args.skip_legacy_above is not None and len(text) > args.skip_legacy_above:
+            print(f"{name:<20}{len(text):>8}{n_tokens:>8}{'-':>10}{new_seconds:>10.3f}{'-':>9}{len(new_chunks):>12}{'-':>11}")
+            continue
+        legacy_seconds, legacy_chunks = time_split(legacy, text, args.repeat)
+        same = sum(normalize(a) == normalize(b) for a, b in zip(legacy_chunks, new_chunks))
+        print(f"{name:<20}{len(text):>8}{n_tokens:>8}{legacy_seconds:>10.3f}{new_seconds:>10.3f}"
+              f"{legacy_seconds / max(new_seconds, 1e-9):>8.1f}x"
+              f"{f'{len(legacy_chunks)}/{len(new_chunks)}':>12}{f'{same}/{len(legacy_chunks)}':>11}")
+
+if __name__ == "__main__":
+    main()
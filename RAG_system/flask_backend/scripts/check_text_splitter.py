@@ -0,0 +1,71 @@
+"""
+RecursiveTextSplitter 回歸檢查：在隨機中文文本上與舊版實作
+(bench_text_splitter.LegacyRecursiveTextSplitter) 比較，切分結果須逐字相同
+
+使用方式 (於 flask_backend 目錄下):
+    python scripts/check_text_splitter.py
+    python scripts/check_text_splitter.py --cases 50 --max-tokens 100 200 --overlap 20 50
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from transformers import AutoTokenizer
+from routes.util.text_splitter import RecursiveTextSplitter
+from bench_text_splitter import SENTENCE_PIECES, LegacyRecursiveTextSplitter
+
+CHARACTERS = sorted(set("".join(SENTENCE_PIECES)))
+SEPARATORS = "。，！？；、\n "
+
+def random_document(rng, min_chars, max_chars):
+    # 隨機中文字夾雜標點、換行與空白，讓各層分隔符都會用到
+    n_chars = rng.randint(min_chars, max_chars)
+    return "".join(rng.choice(SEPARATORS) if rng.random() < 0.12 else rng.choice(CHARACTERS)
+                   for _ in range(n_chars))
+
+def main():
+    parser = argparse.ArgumentParser(description="compare RecursiveTextSplitter with the legacy splitter")
+    parser.add_argument("--tokenizer", default="BAAI/bge-m3")
+    parser.add_argument("--cases", type=int, default=10, help="每組設定的隨機文本數")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-chars", type=int, default=300)
+    parser.add_argument("--max-chars", type=int, default=3000)
+    parser.add_argument("--max-tokens", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--overlap", type=int, nargs="+", default=[20, 50])
+    parser.add_argument("--min-length-ratio", type=float, nargs="+", default=[0.7, 1])
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    rng = random.Random(args.seed)
+    documents = [random_document(rng, args.min_chars, args.max_chars) for _ in range(args.cases)]
+
+    total = failed = 0
+    for max_tokens in args.max_tokens:
+        for overlap in args.overlap:
+            for min_length_ratio in args.min_length_ratio:
+                kwargs = dict(max_tokens=max_tokens, overlap=overlap, min_length_ratio=min_length_ratio)
+                splitter = RecursiveTextSplitter(tokenizer, **kwargs)
+                legacy = LegacyRecursiveTextSplitter(tokenizer, **kwargs)
+                for index, text in enumerate(documents):
+                    total += 1
+                    expected = legacy.split_text(text)
+                    chunks = splitter.split_text(text)
+                    if chunks == expected:
+                        continue
+                    failed += 1
+                    position = next((i for i, (a, b) in enumerate(zip(expected, chunks)) if a != b),
+                                    min(len(expected), len(chunks)))
+                    print(f"不一致: {kwargs} 文本 {index}, chunk {position} ({len(expected)}/{len(chunks)} chunks)")
+                    if position < min(len(expected), len(chunks)):
+                        print(f"  舊版: {expected[position]!r}")
+                        print(f"  新版: {chunks[position]!r}")
+
+    print(f"{total - failed}/{total} 相同")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
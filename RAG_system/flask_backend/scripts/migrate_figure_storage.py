@@ -0,0 +1,78 @@
+"""
+將舊版平放在 figure_storage/ 的圖片搬到 figure_storage/<kb_name>/<file_id>/
+並寫入每份文件的 manifest.json；知識庫由 uploads/<kb_name>/<stem>_<file_id>.pdf 對應
+
+使用方式 (於 flask_backend 目錄下):
+    python scripts/migrate_figure_storage.py --dry-run
+    python scripts/migrate_figure_storage.py
+"""
+import argparse
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from routes.util.figure_export import THUMBNAIL_FOLDER, remove_thumbnails
+from routes.util.figure_storage import FIGURE_ROOT, ref_file_id, prepare_document_dir, read_manifest, write_manifest
+
+UPLOAD_FOLDER = './uploads'
+
+def uploaded_documents(upload_folder):
+    # file_id -> (kb_name, pdf 檔名)
+    documents = {}
+    if not os.path.isdir(upload_folder):
+        return documents
+    for kb_entry in os.scandir(upload_folder):
+        if not kb_entry.is_dir():
+            continue
+        for entry in os.scandir(kb_entry.path):
+            if entry.is_file() and entry.name.endswith(".pdf"):
+                file_id = os.path.splitext(entry.name)[0].split('_')[-1]
+                documents[file_id] = (kb_entry.name, entry.name)
+    return documents
+
+def main():
+    parser = argparse.ArgumentParser(description="migrate flat figure storage to per-document folders")
+    parser.add_argument("--figure-root", default=FIGURE_ROOT)
+    parser.add_argument("--upload-folder", default=UPLOAD_FOLDER)
+    parser.add_argument("--dry-run", action="store_true", help="只列出會搬移的檔案")
+    args = parser.parse_args()
+
+    documents = uploaded_documents(args.upload_folder)
+    moved = {}  # file_id -> refs
+    orphans = []
+    for entry in os.scandir(args.figure_root):
+        if not entry.is_file():
+            continue
+        file_id = ref_file_id(entry.name)
+        if file_id is None or file_id not in documents:
+            orphans.append(entry.name)
+            continue
+        kb_name, _filename = documents[file_id]
+        moved.setdefault(file_id, []).append(entry.name)
+        if args.dry_run:
+            print(f"{entry.name} -> {kb_name}/{file_id}/")
+            continue
+        target_dir = prepare_document_dir(kb_name, file_id, args.figure_root)
+        shutil.move(entry.path, os.path.join(target_dir, entry.name))
+
+    if not args.dry_run:
+        for file_id, refs in moved.items():
+            kb_name, filename = documents[file_id]
+            manifest = read_manifest(kb_name, file_id, args.figure_root)
+            if manifest is not None:
+                refs = sorted(set(refs) | set(manifest["figures"]))
+            write_manifest(kb_name, file_id, filename, refs, args.figure_root)
+            # 舊縮圖刪除，之後請求時於新資料夾重新產生
+            remove_thumbnails(args.figure_root, os.path.splitext(filename)[0])
+        thumbnail_root = os.path.join(args.figure_root, THUMBNAIL_FOLDER)
+        if os.path.isdir(thumbnail_root) and not any(files for _root, _dirs, files in os.walk(thumbnail_root)):
+            shutil.rmtree(thumbnail_root)
+
+    print(f"文件數: {len(moved)}, 圖片數: {sum(len(refs) for refs in moved.values())}, 無對應文件: {len(orphans)}")
+    for name in orphans:
+        print(f"  未搬移: {name}")
+
+if __name__ == "__main__":
+    main()
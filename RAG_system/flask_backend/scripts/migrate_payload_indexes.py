@@ -0,0 +1,33 @@
+"""
+為既有的 Qdrant 集合補建 PAYLOAD_SCHEMA 中缺少的 payload 索引
+(服務第一次連線到集合時也會自動補建，此腳本用於部署前預先執行)
+
+使用方式 (於 flask_backend 目錄下):
+    python scripts/migrate_payload_indexes.py
+    python scripts/migrate_payload_indexes.py --collection 預設向量數據庫
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qdrant_client import QdrantClient
+from routes.util.qdrant_util import PAYLOAD_SCHEMA, ensure_payload_schema
+
+def main():
+    parser = argparse.ArgumentParser(description="create missing payload indexes")
+    parser.add_argument("--url", default=f"http://{os.getenv('QDRANT_HOST', 'localhost')}:{os.getenv('QDRANT_PORT', 6333)}")
+    parser.add_argument("--collection", nargs="*", help="只處理指定集合，預設為全部")
+    args = parser.parse_args()
+
+    qdrant_client = QdrantClient(args.url)
+    collection_names = args.collection or [c.name for c in qdrant_client.get_collections().collections]
+    for collection_name in collection_names:
+        created = ensure_payload_schema(qdrant_client, collection_name)
+        status = f"建立 {', '.join(created)}" if created else "索引已完整"
+        print(f"{collection_name}: {status}")
+    print(f"索引欄位: {', '.join(f'{name} ({schema.value})' for name, schema in PAYLOAD_SCHEMA.items())}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+本地測試用的 OpenAI chat completions stub server
+
+不呼叫真正的 OpenAI API，依圖片內容回傳固定格式的摘要，可模擬延遲，
+用於測試 do_image_summary 的平行摘要與快取。
+
+使用方式:
+    python scripts/stub_openai_server.py --port 8001 --delay 2
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=stub python app.py
+"""
+import argparse
+import hashlib
+import threading
+import time
+import uuid
+
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+DELAY_SECONDS = 0.0
+_lock = threading.Lock()
+_request_count = 0
+
+@app.route('/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    global _request_count
+    data = request.get_json() or {}
+    image_urls = []
+    for message in data.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, list):
+            image_urls += [part['image_url']['url'] for part in content if part.get('type') == 'image_url']
+
+    with _lock:
+        _request_count += 1
+    time.sleep(DELAY_SECONDS)
+
+    digest = hashlib.sha256(''.join(image_urls).encode('utf-8')).hexdigest()[:12]
+    summary = f"[stub summary] 圖片 {digest} 的摘要內容。"
+    return jsonify({
+        'id': f"chatcmpl-{uuid.uuid4().hex}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': data.get('model', 'stub'),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': summary},
+            'finish_reason': 'stop'
+        }],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+    })
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    # 已收到的摘要請求數，用於確認快取命中時不再送出請求
+    return jsonify({'requests': _request_count})
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="OpenAI chat completions stub server")
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--delay', type=float, default=0.0, help="每個請求的模擬延遲秒數")
+    args = parser.parse_args()
+    DELAY_SECONDS = args.delay
+    app.run(host='0.0.0.0', port=args.port, threaded=True)
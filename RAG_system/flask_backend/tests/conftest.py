@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 測試以 flask_backend 為根目錄匯入 routes
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
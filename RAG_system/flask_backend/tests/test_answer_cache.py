@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from routes.util.answer_cache import SemanticAnswerCache
+
+def test_settings_are_part_of_the_key():
+    cache = SemanticAnswerCache(threshold=0.9)
+    single = ("single", 20, None, 5)
+    cascade = ("cascade", 20, ("rrf", 8), 5)
+    assert cache.store("col", "kb", "model", "q", [1.0, 0.0], "answer", [], settings=single)
+
+    assert cache.lookup("col", "kb", "model", [1.0, 0.0], settings=single)["answer"] == "answer"
+    assert cache.lookup("col", "kb", "model", [1.0, 0.0], settings=cascade) is None
+    assert cache.lookup("col", "kb", "model", [1.0, 0.0], settings=("single", 50, None, 5)) is None
+    assert cache.lookup("col", "kb", "model", [1.0, 0.0], settings=("single", 20, None, None)) is None
+
+def test_invalidate_drops_every_settings_bucket():
+    cache = SemanticAnswerCache(threshold=0.9)
+    for settings in [("single", 20, None, 5), ("cascade", 20, ("rrf", 8), 5)]:
+        cache.store("col", "kb", "model", "q", [1.0, 0.0], "answer", [], settings=settings)
+    cache.invalidate("col", "kb")
+    assert cache.stats()["entries"] == 0
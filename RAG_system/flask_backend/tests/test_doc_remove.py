@@ -0,0 +1,73 @@
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("qdrant_client")
+
+from flask import Flask
+from qdrant_client import QdrantClient, models
+
+from routes import docRemove
+
+COLLECTION = "test_collection"
+
+
+@pytest.fixture
+def qdrant(monkeypatch, tmp_path):
+    client = QdrantClient(":memory:")
+    client.create_collection(COLLECTION, vectors_config=models.VectorParams(size=2, distance=models.Distance.COSINE))
+    points = []
+    for kb_name, file_id, count in [("kb_a", "f1", 3), ("kb_a", "f2", 2), ("kb_b", "f1", 4)]:
+        for _ in range(count):
+            points.append(models.PointStruct(id=len(points) + 1, vector=[1.0, 0.0],
+                                             payload={"metadata": {"kb_name": kb_name, "file_id": file_id}}))
+    client.upsert(COLLECTION, points)
+    monkeypatch.setattr(docRemove, "get_qdrant_client", lambda: client)
+    monkeypatch.setattr(docRemove, "bump_kb_version", lambda *args: None)
+    monkeypatch.setattr(docRemove, "UPLOAD_FOLDER", str(tmp_path / "uploads"))
+    monkeypatch.setattr(docRemove, "remove_document_files",
+                        lambda kb_name, document_id, file_name=None: {"file_deleted": True, "figures_deleted": 0})
+    return client
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(docRemove.delete_bp)
+    return app.test_client()
+
+
+def test_counts_documents_with_one_facet_request(qdrant, monkeypatch):
+    count_calls = []
+    original_count = qdrant.count
+    monkeypatch.setattr(qdrant, "count", lambda *args, **kwargs: count_calls.append(kwargs) or original_count(*args, **kwargs))
+
+    counts = docRemove.count_document_vectors(qdrant, COLLECTION, "kb_a", ["f1", "f2"])
+
+    assert counts == {"f1": 3, "f2": 2}
+    assert count_calls == []
+
+
+def test_missing_documents_are_confirmed_per_file(qdrant):
+    assert docRemove.count_document_vectors(qdrant, COLLECTION, "kb_a", ["f1", "f3"]) == {"f1": 3, "f3": 0}
+
+
+def test_bulk_delete_only_touches_the_requested_kb(qdrant, client):
+    response = client.post("/api/delete", json={"document_ids": ["f1", "f3"], "kb_name": "kb_a", "collection": COLLECTION})
+
+    assert response.status_code == 200
+    assert response.json["details"]["vectors_count"] == 3
+    assert response.json["details"]["missing_documents"] == ["f3"]
+    assert qdrant.count(COLLECTION).count == 6
+
+
+def test_bulk_delete_reports_entries_without_document_id(qdrant, client):
+    response = client.post("/api/delete", json={
+        "documents": [{"document_id": "f2"}, {"filename": "沒有id.pdf"}],
+        "kb_name": "kb_a",
+        "collection": COLLECTION,
+    })
+
+    assert response.status_code == 200
+    assert response.json["success"] is False
+    assert response.json["details"]["invalid_documents"] == [{"filename": "沒有id.pdf"}]
+    assert list(response.json["details"]["documents"]) == ["f2"]
@@ -0,0 +1,84 @@
+import hashlib
+
+import pytest
+
+pytest.importorskip("docling_core")
+qdrant_client = pytest.importorskip("qdrant_client")
+
+from qdrant_client import QdrantClient, models
+
+from routes.util import ingest_util
+from routes.util.qdrant_util import qdrant_DBConnector
+
+COLLECTION = "test_collection"
+KB_NAME = "kb_1a2b"
+PDF_CONTENT = b"%PDF-1.4 dedup test"
+FILE_HASH = hashlib.sha256(PDF_CONTENT).hexdigest()
+
+
+@pytest.fixture
+def vector_db(monkeypatch):
+    client = QdrantClient(":memory:")
+    client.create_collection(COLLECTION, vectors_config=models.VectorParams(size=2, distance=models.Distance.COSINE))
+    connector = object.__new__(qdrant_DBConnector)
+    connector.qdrant_client = client
+    connector.collection_name = COLLECTION
+    monkeypatch.setattr(ingest_util, "qdrant_DBConnector", lambda *args, **kwargs: connector)
+    monkeypatch.setattr(ingest_util, "bump_kb_version", lambda *args: None)
+    return connector
+
+
+def _add_points(vector_db, file_id, kb_name, count):
+    start = vector_db.qdrant_client.count(COLLECTION).count
+    vector_db.qdrant_client.upsert(COLLECTION, [
+        models.PointStruct(id=start + i + 1, vector=[1.0, 0.0], payload={
+            "text": f"chunk {i}",
+            "metadata": {"file_id": file_id, "kb_name": kb_name, "file_hash": FILE_HASH,
+                         "filename": f"report_{file_id}.pdf"},
+        })
+        for i in range(count)
+    ])
+
+
+def _save_pdf(tmp_path, file_id):
+    path = tmp_path / f"report_{file_id}.pdf"
+    path.write_bytes(PDF_CONTENT)
+    return str(path)
+
+
+def test_retry_after_partial_upsert_is_not_a_duplicate(vector_db, tmp_path):
+    # 工作中斷前已寫入部分 point，重新排隊後不能把自己當成重複文件
+    file_path = _save_pdf(tmp_path, "1a2b3c4d")
+    _add_points(vector_db, "1a2b3c4d", KB_NAME, 3)
+
+    result, file_hash = ingest_util.deduplicate_document(file_path, COLLECTION, KB_NAME, "1a2b")
+
+    assert result is None
+    assert file_hash == FILE_HASH
+    assert (tmp_path / "report_1a2b3c4d.pdf").exists()
+
+
+def test_retry_reindexes_instead_of_returning_duplicate(vector_db, tmp_path, monkeypatch):
+    file_path = _save_pdf(tmp_path, "1a2b3c4d")
+    _add_points(vector_db, "1a2b3c4d", KB_NAME, 3)
+    indexed = []
+    monkeypatch.setattr(ingest_util, "convert_pdf", lambda *args, **kwargs: ["converted"])
+    monkeypatch.setattr(ingest_util, "index_converted",
+                        lambda docs, path, *args, **kwargs: indexed.append(path) or {"file_id": "1a2b3c4d"})
+
+    result = ingest_util.ingest_pdf(file_path, COLLECTION, KB_NAME, "1a2b")
+
+    assert "duplicate" not in result
+    assert indexed == [file_path]
+    assert (tmp_path / "report_1a2b3c4d.pdf").exists()
+
+
+def test_same_content_in_same_kb_is_a_duplicate(vector_db, tmp_path):
+    file_path = _save_pdf(tmp_path, "5e6f7a8b")
+    _add_points(vector_db, "1a2b3c4d", KB_NAME, 3)
+
+    result, _file_hash = ingest_util.deduplicate_document(file_path, COLLECTION, KB_NAME, "1a2b")
+
+    assert result["duplicate"] is True
+    assert result["file_id"] == "1a2b3c4d"
+    assert not (tmp_path / "report_5e6f7a8b.pdf").exists()
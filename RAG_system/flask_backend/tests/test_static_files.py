@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("PIL")
+
+from flask import Flask
+
+from routes import staticFiles
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    doc_dir = tmp_path / "kb_1" / "1a2b3c4d"
+    doc_dir.mkdir(parents=True)
+    (doc_dir / "report_1a2b3c4d-table-1.png").write_bytes(b"png")
+    (doc_dir / "manifest.json").write_text("{}")
+    monkeypatch.setattr(staticFiles, "FIGURE_ROOT", str(tmp_path))
+    app = Flask(__name__)
+    app.register_blueprint(staticFiles.static_bp)
+    return app.test_client()
+
+def test_figure_is_cached_as_immutable(client):
+    response = client.get("/api/figure_storage/report_1a2b3c4d-table-1.png")
+    assert response.status_code == 200
+    assert response.data == b"png"
+    assert response.cache_control.max_age == staticFiles.FIGURE_CACHE_MAX_AGE
+    assert response.cache_control.immutable
+
+    etag = response.headers["ETag"]
+    revalidated = client.get("/api/figure_storage/report_1a2b3c4d-table-1.png", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+
+@pytest.mark.parametrize("filename", ["manifest.json", "kb_1/1a2b3c4d/report_1a2b3c4d-table-1.png",
+                                      "../report_1a2b3c4d-table-1.png", "report_1a2b3c4d-table-1.txt"])
+def test_only_figure_refs_are_served(client, filename):
+    assert client.get(f"/api/figure_storage/{filename}").status_code == 404
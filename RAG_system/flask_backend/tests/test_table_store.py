@@ -0,0 +1,59 @@
+import os
+
+import pandas as pd
+import pytest
+
+from routes.util import table_store
+
+
+@pytest.fixture(autouse=True)
+def table_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(table_store, "TABLE_STORE_FOLDER", str(tmp_path / "table_store"))
+    return tmp_path / "table_store"
+
+
+def _tables(value):
+    frame = pd.DataFrame({"項目": ["營收"], "金額": [value]})
+    return [(frame, {"filename": "report_1a2b3c4d.pdf", "table_ref": ["report_1a2b3c4d-table-1.png"], "page_ref": [1]})]
+
+
+@pytest.mark.parametrize("kb_name", ["../kb", "..", "kb/../../etc", "/tmp", "kb\\..\\x", ""])
+def test_rejects_kb_names_outside_table_root(kb_name):
+    with pytest.raises(ValueError):
+        table_store.remove_kb_tables(kb_name)
+    with pytest.raises(ValueError):
+        table_store.lookup_table_rows(kb_name or "x/..", "營收")
+
+
+def test_rejects_file_ids_with_path_separators():
+    with pytest.raises(ValueError):
+        table_store.remove_file_tables("kb_1", "../1a2b3c4d")
+
+
+def test_staged_tables_replace_current_tables_only_on_commit():
+    table_store.save_file_tables("kb_1", "1a2b3c4d", _tables("100"))
+    table_store.stage_file_tables("kb_1", "1a2b3c4d", _tables("200"))
+
+    # 暫存的表格不會出現在查詢中
+    assert table_store.lookup_table_rows("kb_1", "營收 100", min_score=0)[0][1].endswith("100")
+
+    table_store.commit_file_tables("kb_1", "1a2b3c4d")
+    assert "200" in table_store.lookup_table_rows("kb_1", "營收 200", min_score=0)[0][1]
+
+
+def test_discarded_tables_keep_current_tables(table_root):
+    table_store.save_file_tables("kb_1", "1a2b3c4d", _tables("100"))
+    table_store.stage_file_tables("kb_1", "1a2b3c4d", _tables("200"))
+
+    table_store.discard_staged_tables("kb_1", "1a2b3c4d")
+
+    assert os.listdir(table_root / "kb_1") == ["1a2b3c4d.parquet"]
+    assert "100" in table_store.lookup_table_rows("kb_1", "營收 100", min_score=0)[0][1]
+
+
+def test_committing_no_tables_removes_current_tables(table_root):
+    table_store.save_file_tables("kb_1", "1a2b3c4d", _tables("100"))
+    table_store.stage_file_tables("kb_1", "1a2b3c4d", [])
+
+    assert table_store.commit_file_tables("kb_1", "1a2b3c4d")
+    assert os.listdir(table_root / "kb_1") == []
@@ -0,0 +1,53 @@
+import os
+import random
+import sys
+
+import pytest
+
+pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+
+from transformers import PreTrainedTokenizerFast
+from routes.util.text_splitter import RecursiveTextSplitter
+
+# 舊版實作放在 scripts/ (bench 與 check 腳本共用)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from bench_text_splitter import SENTENCE_PIECES, LegacyRecursiveTextSplitter, synthetic_document
+
+CHARACTERS = sorted(set("".join(SENTENCE_PIECES)))
+SEPARATORS = "。，！？；、\n "
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    # 離線建立的 Unigram + Metaspace tokenizer (與 bge-m3 同類)：
+    # 詞表含單字與 SENTENCE_PIECES 中的雙字詞，讓 token 邊界隨上下文改變
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+    words = {piece[i:i + 2] for piece in SENTENCE_PIECES for i in range(len(piece) - 1)}
+    vocab = [("<unk>", 0.0), ("▁", -3.0)]
+    vocab += [(word, -4.0) for word in sorted(words)]
+    vocab += [(char, -6.0) for char in CHARACTERS + sorted(set(SEPARATORS.strip()))]
+    vocab += [("▁" + char, -7.0) for char in CHARACTERS]
+    backend = Tokenizer(models.Unigram(vocab, unk_id=0))
+    backend.pre_tokenizer = pre_tokenizers.Metaspace()
+    backend.decoder = decoders.Metaspace()
+    return PreTrainedTokenizerFast(tokenizer_object=backend, unk_token="<unk>")
+
+def random_document(rng, min_chars, max_chars):
+    # 同 scripts/check_text_splitter.py：隨機中文字夾雜標點、換行與空白
+    n_chars = rng.randint(min_chars, max_chars)
+    return "".join(rng.choice(SEPARATORS) if rng.random() < 0.12 else rng.choice(CHARACTERS)
+                   for _ in range(n_chars))
+
+@pytest.mark.parametrize("min_length_ratio", [0.7, 1])
+@pytest.mark.parametrize("overlap", [20, 50])
+@pytest.mark.parametrize("max_tokens", [100, 200])
+def test_matches_legacy_splitter(tokenizer, max_tokens, overlap, min_length_ratio):
+    kwargs = dict(max_tokens=max_tokens, overlap=overlap, min_length_ratio=min_length_ratio)
+    splitter = RecursiveTextSplitter(tokenizer, **kwargs)
+    legacy = LegacyRecursiveTextSplitter(tokenizer, **kwargs)
+    rng = random.Random(0)
+    # 隨機字元文本會用到各層分隔符，成句文本的詞常跨越 token 邊界
+    documents = [random_document(rng, 300, 3000) for _ in range(8)]
+    documents += [synthetic_document(rng.randint(300, 3000), seed=seed) for seed in range(4)]
+    for text in documents:
+        assert splitter.split_text(text) == legacy.split_text(text)
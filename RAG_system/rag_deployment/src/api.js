@@ -21,6 +21,11 @@ export const uploadPdfDocument = async (file, collection, kbName, doOcr = false,
         'Content-Type': 'multipart/form-data',
       },
     });
+    // 後端改為背景處理，輪詢工作狀態直到完成
+    if (response.data.job_id) {
+      const job = await waitForJob(response.data.job_id);
+      return { ...response.data, ...(job.result || {}), status: job.status };
+    }
     return response.data;
   } catch (error) {
     console.error('Error uploading document:', error);
@@ -28,6 +33,50 @@ export const uploadPdfDocument = async (file, collection, kbName, doOcr = false,
   }
 };
 
+// 批次上傳多個PDF (或 zip) 到同一個知識庫，回傳背景工作資訊
+export const uploadPdfBatch = async (files, collection, kbName, doOcr = false, doImageSummary = false) => {
+  const formData = new FormData();
+  files.forEach(file => formData.append('files', file));
+  formData.append('collection', collection);
+  formData.append('kb_name', kbName);
+  formData.append('do_ocr', doOcr.toString());
+  formData.append('do_image_summary', doImageSummary.toString());
+
+  try {
+    const response = await axios.post(`${API_BASE_URL}upload/batch`, formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Error uploading document batch:', error);
+    throw error;
+  }
+};
+
+// 查詢文件處理工作狀態API
+export const getJobStatus = async (jobId) => {
+  try {
+    const response = await axios.get(`${API_BASE_URL}jobs/${jobId}`);
+    return response.data;
+  } catch (error) {
+    console.error(`Error fetching job ${jobId}:`, error);
+    throw error;
+  }
+};
+
+// 輪詢工作直到完成或失敗
+export const waitForJob = async (jobId, { intervalMs = 2000, onProgress } = {}) => {
+  while (true) {
+    const job = await getJobStatus(jobId);
+    if (onProgress) onProgress(job);
+    if (job.status === 'completed') return job;
+    if (job.status === 'failed') throw new Error(job.error || '文件處理失敗');
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+  }
+};
+
 // 獲取Ollama模型列表API
 export const getOllamaModels = async () => {
   try {
@@ -77,6 +126,55 @@ export const chatWithRag = async (query, modelId, collectionName, kbName) => {
   }
 };
 
+// 串流聊天問答API (JSON lines)，先回傳 sources，再逐段回傳模型輸出
+export const chatWithRagStream = async (query, modelId, collectionName, kbName, { onSources, onToken } = {}) => {
+  const response = await fetch(`${API_BASE_URL}chat/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({
+      query,
+      model: modelId,
+      collection: collectionName,
+      kbName: kbName
+    }),
+  });
+  if (!response.ok) {
+    throw new Error(`Chat stream failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let answer = '';
+  let sources = [];
+
+  const handleLine = (line) => {
+    if (!line.trim()) return;
+    const event = JSON.parse(line);
+    if (event.type === 'sources') {
+      sources = event.sources;
+      if (onSources) onSources(sources);
+    } else if (event.type === 'token') {
+      answer += event.content;
+      if (onToken) onToken(event.content, answer);
+    } else if (event.type === 'error') {
+      throw new Error(event.error);
+    }
+  };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    lines.forEach(handleLine);
+  }
+  handleLine(buffer);
+
+  return { answer, sources };
+};
+
 // 刪除文檔API
 export const deleteDocument = async (documentId, filename, kbName, collectionName) => {
   try {
@@ -112,8 +112,9 @@ const ChatInterfaceComponent = ({ selectedModel, selectedCollection, selectedKbF
           {refs.map((ref, idx) => (
             <div key={idx} style={{ width: '100%', maxWidth: '300px', marginBottom: '10px' }}>
               <Image
-                src={`${API_BASE_URL}figure_storage/${ref}`}
+                src={`${API_BASE_URL}figure_storage/${ref}?w=640`}
                 //src={`http://127.0.0.1:5050/api/figure_storage/${ref}`}
+                preview={{ src: `${API_BASE_URL}figure_storage/${ref}` }}
                 alt={`${type === 'image' ? '圖片' : '表格'} ${idx + 1}`}
                 style={{ width: '100%', objectFit: 'contain', border: '1px solid #f0f0f0', borderRadius: '4px' }}
                 fallback="/fallback.png"